@@ -1,13 +1,192 @@
 from decimal import Decimal
+from fractions import Fraction
+import abc
 import bcrypt
 import random
-import pymysql
 import os
+import re
+import sqlite3
+import sys
 import json
-from collections import deque
+import mmap
+import struct
+import zlib
+from collections import deque, OrderedDict
 from datetime import datetime
+import calendar
 import time
+import threading
+import functools
+import queue
+import hmac
+import hashlib
+import secrets
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+try:
+    import pymysql
+except ImportError:
+    pymysql = None  # Only the MySQL backend needs it
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Only the shared cache needs it (POSIX)
+
+MONEY_PATTERN = re.compile(r"([+-]?)(\d*)(?:\.(\d{1,2}))?")
+
+class Money:
+    """An amount in rupees, held as a whole number of paise.
+
+    Exact like Decimal, but adding and comparing are plain int operations. Plain
+    numbers handed to Money.of, or compared with a Money, are rupees. The database stores
+    the paise in BIGINT columns, and both backends are taught to bind a Money as its
+    paise, so rows come back as ints and are wrapped with Money(paise).
+    """
+
+    __slots__ = ("paise",)
+
+    def __init__(self, paise=0):
+        self.paise = paise
+
+    @classmethod
+    def of(cls, value):
+        """Money from a Money, or a rupee amount as int, str, Decimal or float."""
+        if type(value) is cls:
+            return value
+        if isinstance(value, int):
+            return cls(value * 100)
+        if isinstance(value, str):
+            return cls.parse(value)
+        if isinstance(value, Decimal):
+            paise = value.scaleb(2)
+            if not paise.is_finite() or paise != paise.to_integral_value():
+                raise ValueError(f"Invalid amount: {value}")
+            return cls(int(paise))
+        if isinstance(value, float):
+            # Only at the edges (old JSON caches); rounded to the nearest paisa
+            return cls(round(value * 100))
+        raise TypeError(f"Cannot make Money from {type(value).__name__}")
+
+    @classmethod
+    def parse(cls, text):
+        """Exact parse of "2500", "2500.5" or "-12.75"; more than two decimals is an error."""
+        rupees, dot, fraction = text.partition(".")
+        if rupees.isdigit() and (fraction.isdigit() and len(fraction) <= 2 if dot else True):
+            # The common unsigned shape, without the regex
+            return cls(int(rupees) * 100 + (int(fraction) * (10 if len(fraction) == 1 else 1) if dot else 0))
+        match = MONEY_PATTERN.fullmatch(text.strip())
+        if not match or not (match.group(2) or match.group(3)):
+            raise ValueError(f"Invalid amount: {text!r}")
+        sign, rupees, fraction = match.groups()
+        paise = int(rupees or 0) * 100 + int((fraction or "").ljust(2, "0"))
+        return cls(-paise if sign == "-" else paise)
+
+    @staticmethod
+    def _paise(other):
+        if type(other) is Money:
+            return other.paise
+        if type(other) is int:
+            return other * 100
+        if isinstance(other, (int, Decimal, float)) and not isinstance(other, bool):
+            return Money.of(other).paise
+        return None
+
+    def __add__(self, other):
+        if type(other) is not Money:
+            return NotImplemented
+        return Money(self.paise + other.paise)
+
+    def __radd__(self, other):
+        # sum() starts from 0
+        if other == 0:
+            return self
+        return NotImplemented
+
+    def __sub__(self, other):
+        if type(other) is not Money:
+            return NotImplemented
+        return Money(self.paise - other.paise)
+
+    def __mul__(self, factor):
+        if not isinstance(factor, int):
+            return NotImplemented
+        return Money(self.paise * factor)
+
+    __rmul__ = __mul__
+
+    def __neg__(self):
+        return Money(-self.paise)
+
+    def __abs__(self):
+        return Money(abs(self.paise))
+
+    def __bool__(self):
+        return self.paise != 0
+
+    def __eq__(self, other):
+        if type(other) is Money:
+            return self.paise == other.paise
+        paise = self._paise(other)
+        return NotImplemented if paise is None else self.paise == paise
+
+    def __hash__(self):
+        # Equal to the numeric hash of the rupee value, like the ints and Decimals it equals
+        if self.paise % 100 == 0:
+            return hash(self.paise // 100)
+        return hash(Fraction(self.paise, 100))
+
+    def __lt__(self, other):
+        if type(other) is Money:
+            return self.paise < other.paise
+        paise = self._paise(other)
+        return NotImplemented if paise is None else self.paise < paise
+
+    def __le__(self, other):
+        if type(other) is Money:
+            return self.paise <= other.paise
+        paise = self._paise(other)
+        return NotImplemented if paise is None else self.paise <= paise
+
+    def __gt__(self, other):
+        if type(other) is Money:
+            return self.paise > other.paise
+        paise = self._paise(other)
+        return NotImplemented if paise is None else self.paise > paise
+
+    def __ge__(self, other):
+        if type(other) is Money:
+            return self.paise >= other.paise
+        paise = self._paise(other)
+        return NotImplemented if paise is None else self.paise >= paise
+
+    def __str__(self):
+        sign = "-" if self.paise < 0 else ""
+        rupees, paise = divmod(abs(self.paise), 100)
+        return f"{sign}{rupees}.{paise:02d}"
+
+    def __repr__(self):
+        return f"Money('{self}')"
+
+    def __format__(self, spec):
+        return format(self.to_decimal(), spec) if spec else str(self)
+
+    def __float__(self):
+        return self.paise / 100
+
+    def to_decimal(self):
+        return Decimal(self.paise).scaleb(-2)
+
+Money.ZERO = Money(0)
+
 class Customer:
+    # One slot per customers column; no per-instance __dict__
+    __slots__ = ("user_id", "username", "email", "password_hash", "address", "mobile_number",
+                 "aadhaar_number", "account_number", "ifsc_code", "card_number", "encrypted_card_pin",
+                 "balance", "credit_score", "loan_amount")
+    hasher = None  # Optional HashingService; bcrypt runs inline when unset
+    allocator = None  # Optional NumberAllocator; numbers are drawn at random when unset
+
     def __init__(self, user_id=None, username=None, email=None, password=None, 
                  address=None, mobile_number=None, aadhaar_number=None, account_number=None, 
                  ifsc_code=None, card_number=None, encrypted_card_pin=None, balance=None, 
@@ -16,242 +195,1333 @@ class Customer:
         self.user_id = user_id
         self.username = username
         self.email = email
-        self.password_hash = self.encrypt_password(password) if password else None
+        password_future = pin_future = None
+        if Customer.hasher:
+            # The password and PIN hashes are computed at the same time on the hashing pool
+            if password:
+                password_future = Customer.hasher.hash_async(password)
+            if not encrypted_card_pin:
+                pin_future = Customer.hasher.hash_async(str(random.randint(1000, 9999)))
+        if password_future:
+            self.password_hash = password_future.result()
+        else:
+            self.password_hash = self.encrypt_password(password) if password else None
         self.address = address
         self.mobile_number = mobile_number
         self.aadhaar_number = aadhaar_number
         self.account_number = account_number if account_number else self.generate_account_number()
         self.ifsc_code = ifsc_code if ifsc_code else "BANK1234567"
         self.card_number = card_number if card_number else self.generate_card_number()
-        self.encrypted_card_pin = encrypted_card_pin if encrypted_card_pin else self.generate_encrypted_pin()
-        self.balance = Decimal(balance) if balance is not None else Decimal('0.00')
+        if pin_future:
+            self.encrypted_card_pin = pin_future.result()
+        else:
+            self.encrypted_card_pin = encrypted_card_pin if encrypted_card_pin else self.generate_encrypted_pin()
+        self.balance = Money.of(balance) if balance is not None else Money.ZERO
         self.credit_score = int(credit_score) if credit_score is not None else 600
-        self.loan_amount = Decimal(loan_amount) if loan_amount is not None else Decimal('0.00')
-        self.transactions = deque(maxlen=10)
+        self.loan_amount = Money.of(loan_amount) if loan_amount is not None else Money.ZERO
 
     @staticmethod
     def encrypt_password(password):
-        salt = bcrypt.gensalt()
-        return bcrypt.hashpw(password.encode(), salt).decode()
+        if Customer.hasher:
+            return Customer.hasher.hash(password)
+        return bcrypt_hash(password)
 
     @staticmethod
     def verify_password(stored_hash, entered_password):
-        return bcrypt.checkpw(entered_password.encode(), stored_hash.encode())
+        if Customer.hasher:
+            return Customer.hasher.check(entered_password, stored_hash)
+        return bcrypt_check(entered_password, stored_hash)
 
     @staticmethod
     def generate_encrypted_pin():
         pin = str(random.randint(1000, 9999))
-        salt = bcrypt.gensalt()
-        return bcrypt.hashpw(pin.encode(), salt).decode()
+        return Customer.encrypt_password(pin)
 
     @staticmethod
     def generate_account_number():
+        if Customer.allocator:
+            return Customer.allocator.next("account_number")
         return str(random.randint(1000000000, 9999999999))
 
     @staticmethod
     def generate_card_number():
+        if Customer.allocator:
+            return Customer.allocator.next("card_number")
         return str(random.randint(4000000000000000, 4999999999999999))
 
     def deposit(self, amount, db_manager, cache_manager):
+        state = (self.balance, self.credit_score, self.loan_amount)
         try:
-            amount = Decimal(amount)
+            amount = Money.of(amount)
             if amount <= 0:
                 print("❌ Invalid deposit amount!")
-                return
+                return False
+
+            if db_manager.posting_engine:
+                # Balance, ledger row and score in a single server-side call
+                db_manager.posting_engine.post(self, "Deposit", amount)
+            else:
+                # One unit of work: balance, ledger and score commit together
+                with db_manager.unit_of_work():
+                    self.balance += amount
+                    self.credit_score = db_manager.update_credit_score(self.account_number)
+                    db_manager.update_customer(self)
+                    db_manager.insert_transaction(self.user_id, self.account_number, "Deposit", amount)
 
-            self.balance += amount
-            self.credit_score = db_manager.update_credit_score(self.account_number)
-            db_manager.update_customer(self)
-            db_manager.insert_transaction(self.user_id, self.account_number, "Deposit", amount)
-            
-            # Update cache with new balance and credit score
-            cache_manager.update_cache(self)
-            cache_manager.add_transaction(
-                self.account_number,
-                "Deposit",
-                amount,
-                datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            )
-            
             print(f"✅ Deposited ₹{amount}. New Balance: ₹{self.balance}")
             print(f"Credit Score: {self.credit_score}")
+            return True
 
         except Exception as e:
             print(f"❌ Deposit failed: {e}")
-            db_manager.conn.rollback()
+            self.balance, self.credit_score, self.loan_amount = state
+            return False
 
     def withdraw(self, amount, db_manager, cache_manager):
+        state = (self.balance, self.credit_score, self.loan_amount)
         try:
+            amount = Money.of(amount)
             # Check cache first for quick balance verification
             cached_data = cache_manager.get_from_cache(self.account_number)
-            if cached_data and float(amount) > float(cached_data['balance']):
+            if cached_data and amount > cached_data['balance']:
                 print("❌ Insufficient balance!")
-                return
+                return False
 
-            amount = Decimal(amount)
             if amount <= 0 or amount > self.balance:
                 print("❌ Invalid withdrawal amount!")
-                return
+                return False
+
+            if db_manager.posting_engine:
+                db_manager.posting_engine.post(self, "Withdrawal", -amount)
+            else:
+                with db_manager.unit_of_work():
+                    self.balance -= amount
+                    self.credit_score = db_manager.update_credit_score(self.account_number)
+                    db_manager.update_customer(self)
+                    db_manager.insert_transaction(self.user_id, self.account_number, "Withdrawal", -amount)
 
-            self.balance -= amount
-            self.credit_score = db_manager.update_credit_score(self.account_number)
-            db_manager.update_customer(self)
-            db_manager.insert_transaction(self.user_id, self.account_number, "Withdrawal", -amount)
-            
-            # Update cache
-            cache_manager.update_cache(self)
-            cache_manager.add_transaction(
-                self.account_number,
-                "Withdrawal",
-                -amount,
-                datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            )
-            
             print(f"✅ Withdrawn ₹{amount}. New Balance: ₹{self.balance}")
             print(f"Credit Score: {self.credit_score}")
+            return True
 
         except Exception as e:
             print(f"❌ Withdrawal failed: {e}")
-            db_manager.conn.rollback()
+            self.balance, self.credit_score, self.loan_amount = state
+            return False
 
     def transfer_money(self, receiver, amount, db_manager, cache_manager):
+        state = (self.balance, self.credit_score, receiver.balance, receiver.credit_score)
         try:
+            amount = Money.of(amount)
             # Quick balance check using cache
             cached_data = cache_manager.get_from_cache(self.account_number)
-            if cached_data and float(amount) > float(cached_data['balance']):
+            if cached_data and amount > cached_data['balance']:
                 print("❌ Insufficient balance!")
-                return
+                return False
 
-            amount = Decimal(amount)
             if amount <= 0 or amount > self.balance:
                 print("❌ Invalid transfer amount!")
-                return
-
-            db_manager.conn.begin()
-            try:
-                self.balance -= amount
-                receiver.balance += amount
-
-                self.credit_score = db_manager.update_credit_score(self.account_number)
-                receiver.credit_score = db_manager.update_credit_score(receiver.account_number)
-
-                for customer in [self, receiver]:
-                    db_manager.update_customer(customer)
-                    cache_manager.update_cache(customer)
-
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                # Record transactions in both DB and cache
-                for cust, amt, desc in [(self, -amount, f"Transfer to {receiver.account_number}"),
-                                      (receiver, amount, f"Transfer from {self.account_number}")]:
-                    db_manager.insert_transaction(cust.user_id, cust.account_number, desc, amt)
-                    cache_manager.add_transaction(cust.account_number, desc, amt, timestamp)
+                return False
 
-                db_manager.conn.commit()
-                print(f"✅ Transferred ₹{amount} to {receiver.account_number}")
-                print(f"Your Credit Score: {self.credit_score}")
+            # Both paths lock the two rows in account order and retry if picked as a deadlock victim
+            if db_manager.posting_engine:
+                db_manager.retry_deadlocks(db_manager.posting_engine.transfer, self, receiver, amount)
+            else:
+                db_manager.transfer_funds(self, receiver, amount)
 
-            except Exception as e:
-                db_manager.conn.rollback()
-                raise e
+            print(f"✅ Transferred ₹{amount} to {receiver.account_number}")
+            print(f"Your Credit Score: {self.credit_score}")
+            return True
 
         except Exception as e:
             print(f"❌ Transfer failed: {e}")
+            self.balance, self.credit_score, receiver.balance, receiver.credit_score = state
+            return False
+
     def take_loan(self, amount, db_manager, cache_manager):
+        state = (self.balance, self.credit_score, self.loan_amount)
         try:
-            amount = Decimal(amount)
+            amount = Money.of(amount)
             
             # Check minimum loan amount
             if amount < 500:
                 print("❌ Minimum loan amount is ₹500!")
-                return
+                return False
 
-            # Check loan eligibility
-            eligible, result = db_manager.check_loan_eligibility(self.account_number, amount)
-            if not eligible:
-                print(f"❌ Loan request denied: {result}")
-                return
-
-            # Process loan
-            self.loan_amount += amount
-            self.balance += amount
-            self.credit_score = result["credit_score"]  # Update credit score
+            if db_manager.posting_engine:
+                # Current preapproved terms turn an oversized request away without posting;
+                # the posting applies the same rules itself while it holds the account's lock
+                preapproved = db_manager.preapproved_terms(self.account_number)
+                if preapproved:
+                    eligible, reason = loan_eligibility(*preapproved, amount)
+                    if not eligible:
+                        print(f"❌ Loan request denied: {reason}")
+                        return False
+                posted = db_manager.posting_engine.post(self, "Loan Taken", amount, loan_delta=amount,
+                                                        check_loan=True)
+                result = posted["terms"]
+            else:
+                with db_manager.unit_of_work():
+                    # Check loan eligibility
+                    eligible, result = db_manager.check_loan_eligibility(self.account_number, amount)
+                    if not eligible:
+                        print(f"❌ Loan request denied: {result}")
+                        return False
 
-            # Update database
-            query = """UPDATE customers 
-                      SET balance = %s, loan_amount = %s, credit_score = %s 
-                      WHERE account_number = %s"""
-            db_manager.cursor.execute(query, (
-                self.balance, 
-                self.loan_amount,
-                self.credit_score,
-                self.account_number
-            ))
-            db_manager.conn.commit()
+                    # Process loan
+                    self.loan_amount += amount
+                    self.balance += amount
+                    self.credit_score = result["credit_score"]  # Update credit score
 
-            # Record transaction and update cache
-            db_manager.insert_transaction(self.user_id, self.account_number, "Loan Taken", amount)
-            cache_manager.update_cache(self)
+                    # Update database, record transaction and update cache
+                    db_manager.update_customer(self)
+                    db_manager.insert_transaction(self.user_id, self.account_number, "Loan Taken", amount)
             
             print(f"✅ Loan of ₹{amount} granted")
             print(f"Interest Rate: {result['interest_rate']}%")
             print(f"Credit Score: {self.credit_score}")
             print(f"New Balance: ₹{self.balance}")
             print(f"Total Loan Amount: ₹{self.loan_amount}")
+            return True
 
         except Exception as e:
             print(f"❌ Loan failed: {e}")
-            db_manager.conn.rollback()
+            self.balance, self.credit_score, self.loan_amount = state
+            return False
+
     def return_loan(self, amount, db_manager, cache_manager):
+        state = (self.balance, self.credit_score, self.loan_amount)
         try:
+            amount = Money.of(amount)
             # Quick check using cache first
             cached_data = cache_manager.get_from_cache(self.account_number)
             if cached_data:
-                if float(amount) > float(cached_data['balance']) or float(amount) > float(cached_data['loan_amount']):
+                if amount > cached_data['balance'] or amount > cached_data['loan_amount']:
                     print("❌ Invalid loan repayment amount!")
-                    return
+                    return False
 
-            amount = Decimal(amount)
             if amount <= 0 or amount > self.balance or amount > self.loan_amount:
                 print("❌ Invalid loan repayment amount!")
-                return
+                return False
 
-            self.loan_amount -= amount
-            self.balance -= amount
-            
-            # Update credit score for loan repayment
-            self.credit_score = db_manager.update_credit_score(self.account_number)
-            
-            # Update both database and cache
-            db_manager.update_customer(self)
-            cache_manager.update_cache(self)
-            
-            # Record transaction in both DB and cache
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            db_manager.insert_transaction(self.user_id, self.account_number, "Loan Repayment", -amount)
-            cache_manager.add_transaction(self.account_number, "Loan Repayment", -amount, timestamp)
+            if db_manager.posting_engine:
+                db_manager.posting_engine.post(self, "Loan Repayment", -amount, loan_delta=-amount)
+            else:
+                with db_manager.unit_of_work():
+                    self.loan_amount -= amount
+                    self.balance -= amount
+
+                    # Update credit score for loan repayment
+                    self.credit_score = db_manager.update_credit_score(self.account_number)
+
+                    # Update database (and cache), then record the transaction
+                    db_manager.update_customer(self)
+                    db_manager.insert_transaction(self.user_id, self.account_number, "Loan Repayment", -amount)
             
             print(f"✅ Loan repayment of ₹{amount} successful")
             print(f"Remaining loan: ₹{self.loan_amount}")
             print(f"New Balance: ₹{self.balance}")
             print(f"Credit Score: {self.credit_score}")
+            return True
 
         except Exception as e:
             print(f"❌ Loan repayment failed: {e}")
-            db_manager.conn.rollback()
+            self.balance, self.credit_score, self.loan_amount = state
+            return False
 
-class DatabaseManager:
-    def __init__(self, cache_manager=None):
-        self.MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD")
-        self.conn = pymysql.connect(
-            host="localhost",
-            user="root",
-            password=self.MYSQL_PASSWORD,
-            database="bank_system"
+class AccountHandle(Customer):
+    """A Customer read with only the columns an operation needs.
+
+    fetch_customer and authenticate_customer return these instead of hydrating the whole
+    row. PROFILE covers the balances, the score and what the cache keeps; the other
+    columns (password and PIN hashes, Aadhaar, mobile, IFSC and card number) are fetched
+    with one query the first time any of them is read. The operations work on a handle
+    exactly as on a Customer.
+    """
+
+    __slots__ = ("_db",)
+    PROFILE = ("user_id", "username", "email", "address", "account_number", "balance", "loan_amount",
+               "credit_score")
+
+    def __init__(self, db_manager, columns, row):
+        self._db = db_manager
+        self._set(columns, row)
+
+    def _set(self, columns, row):
+        for column, value in zip(columns, row):
+            if column in ("balance", "loan_amount"):
+                value = Money(value)
+            setattr(self, column, value)
+
+    def __getattr__(self, name):
+        # Only reached for slots that have not been loaded yet
+        if name not in Customer.__slots__:
+            raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+        missing = []
+        for column in Customer.__slots__:
+            try:
+                object.__getattribute__(self, column)
+            except AttributeError:
+                missing.append(column)
+        row = self._db.load_columns(self.account_number, missing)
+        if row is None:
+            raise AttributeError(f"Account {self.account_number} no longer exists")
+        self._set(missing, row)
+        return object.__getattribute__(self, name)
+
+def bcrypt_hash(secret):
+    salt = bcrypt.gensalt()
+    return bcrypt.hashpw(secret.encode(), salt).decode()
+
+def bcrypt_check(secret, stored_hash):
+    return bcrypt.checkpw(secret.encode(), stored_hash.encode())
+
+class HashingService:
+    """Runs bcrypt on a process pool so logins and sign-ups hash in parallel on every core."""
+
+    def __init__(self, workers=None):
+        # Spawned workers only import this module; forking would copy the caller's threads and locks
+        self.executor = ProcessPoolExecutor(max_workers=workers if workers else os.cpu_count(),
+                                            mp_context=multiprocessing.get_context("spawn"))
+
+    def hash_async(self, secret):
+        return self.executor.submit(bcrypt_hash, secret)
+
+    def hash(self, secret):
+        return self.hash_async(secret).result()
+
+    def check(self, secret, stored_hash):
+        return self.executor.submit(bcrypt_check, secret, stored_hash).result()
+
+    def hash_many(self, secrets_to_hash, chunksize=16):
+        """Hash a batch of secrets across the pool, keeping input order."""
+        return list(self.executor.map(bcrypt_hash, secrets_to_hash, chunksize=chunksize))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+class SessionStore:
+    """In-memory sessions behind HMAC-signed tokens, so repeat requests skip bcrypt and the DB."""
+
+    def __init__(self, secret=None, ttl=1800):
+        secret = secret if secret else os.getenv("BANK_SESSION_SECRET")
+        self.secret = secret.encode() if secret else secrets.token_bytes(32)
+        self.ttl = ttl
+        self.sessions = {}  # session_id -> (customer, expires_at)
+        self._lock = threading.Lock()
+
+    def _sign(self, payload):
+        return hmac.new(self.secret, payload.encode(), hashlib.sha256).hexdigest()
+
+    def create(self, customer):
+        session_id = secrets.token_urlsafe(16)
+        expires_at = int(time.time() + self.ttl)
+        payload = f"{session_id}.{expires_at}"
+        with self._lock:
+            self.sessions[session_id] = (customer, expires_at)
+        return f"{payload}.{self._sign(payload)}"
+
+    def resolve(self, token):
+        """Return the customer behind a token, or None if it is forged, expired or revoked."""
+        try:
+            session_id, expires_at, signature = token.split(".")
+            expires_at = int(expires_at)
+        except (AttributeError, ValueError):
+            return None
+        # Forged tokens are rejected by the signature before touching the store
+        if not hmac.compare_digest(signature, self._sign(f"{session_id}.{expires_at}")):
+            return None
+        if expires_at < time.time():
+            self.revoke(token)
+            return None
+        with self._lock:
+            entry = self.sessions.get(session_id)
+        return entry[0] if entry else None
+
+    def revoke(self, token):
+        session_id = token.split(".")[0] if isinstance(token, str) else None
+        with self._lock:
+            self.sessions.pop(session_id, None)
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            for session_id in [s for s, (_, expires_at) in self.sessions.items() if expires_at < now]:
+                del self.sessions[session_id]
+
+def describe_transaction(transaction_type, counterparty=None):
+    """Human-readable label, e.g. "Transfer to 1234567890"."""
+    if transaction_type == "Transfer Out":
+        return f"Transfer to {counterparty}"
+    if transaction_type == "Transfer In":
+        return f"Transfer from {counterparty}"
+    if transaction_type == "Transfer Refund":
+        return f"Refund of transfer to {counterparty}"
+    return transaction_type
+
+def six_months_ago(now=None):
+    """Same boundary as MySQL's DATE_SUB(NOW(), INTERVAL 6 MONTH)."""
+    now = now if now else datetime.now()
+    year, month = now.year, now.month - 6
+    if month <= 0:
+        year, month = year - 1, month + 12
+    # MySQL clamps the day to the end of the target month (e.g. Aug 31 -> Feb 28)
+    day = min(now.day, calendar.monthrange(year, month)[1])
+    return now.replace(year=year, month=month, day=day)
+
+def six_months_after(moment):
+    """Earliest time at which six_months_ago() can move past `moment`."""
+    year, month = moment.year, moment.month + 6
+    if month > 12:
+        year, month = year + 1, month - 12
+    day = min(moment.day, calendar.monthrange(year, month)[1])
+    return moment.replace(year=year, month=month, day=day)
+
+SCORED_DEPOSIT_PAISE = 100000  # Deposits of ₹1000 or more count towards the score
+
+def calculate_credit_score(balance, deposits, repayments, failed_transactions):
+    # Base score calculation
+    base_score = 600
+
+    # Balance factor (up to +200)
+    balance_factor = min(200, balance.paise // 100000)  # One point per ₹1000
+
+    # Transaction patterns
+    deposit_score = min(100, deposits * 20)
+
+    # Loan repayment history
+    repayment_score = min(150, repayments * 30)
+
+    # Penalties for negative behavior
+    penalty = min(200, failed_transactions * 50)
+
+    # Calculate final score
+    return min(900, base_score + balance_factor + deposit_score +
+               repayment_score - penalty)
+
+def loan_terms(balance, credit_score):
+    """Loan limits for a balance and credit score, or None if the score is too low."""
+    # Calculate loan multiplier based on credit score
+    if credit_score >= 800:
+        multiplier = 3  # Can borrow up to 3x balance
+    elif credit_score >= 700:
+        multiplier = 2  # Can borrow up to 2x balance
+    elif credit_score >= 600:
+        multiplier = 1  # Can borrow up to 1x balance
+    else:
+        return None
+
+    return {
+        "credit_score": credit_score,
+        "multiplier": multiplier,
+        "interest_rate": max(8, 15 - (credit_score - 600) / 100),
+        "max_loan": balance * multiplier
+    }
+
+def loan_eligibility(credit_score, terms, requested_amount):
+    """(True, terms) if the request fits the terms, else (False, reason)."""
+    if terms is None:
+        return False, f"Credit score too low ({credit_score}/900)"
+    if requested_amount > terms["max_loan"]:
+        return False, f"Maximum loan amount allowed: ₹{terms['max_loan']}"
+    return True, terms
+
+class CreditScoreEngine:
+    """Rolling six-month counters per account, so a score refresh never rescans history.
+
+    Each window remembers the newest ledger row it has counted (its version). Rows other
+    writers append are picked up with catch_up() before the counts are used, and rows
+    this process posts are recorded with their ids so a catch-up does not count them
+    twice. Only the `max_accounts` most recently used windows are kept.
+    """
+
+    DEPOSIT, REPAYMENT, FAILED = 0, 1, 2
+
+    def __init__(self, bucket_seconds=86400, max_accounts=100000):
+        self.bucket_seconds = bucket_seconds
+        self.max_accounts = max_accounts
+        # account_number -> {"buckets": deque, "totals": [deposits, repayments, failed],
+        #                    "version": newest counted row id or None, "pending": ids recorded past it}
+        self.windows = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def classify(cls, transaction_type, amount):
+        """Return the counter a transaction feeds, or None if the score ignores it."""
+        if transaction_type == "Deposit" and amount.paise >= SCORED_DEPOSIT_PAISE:
+            return cls.DEPOSIT
+        if transaction_type == "Loan Repayment":
+            return cls.REPAYMENT
+        if transaction_type in ["Failed", "Bounced"]:
+            return cls.FAILED
+        return None
+
+    def is_tracked(self, account_number):
+        return account_number in self.windows
+
+    def version(self, account_number):
+        """Newest ledger row id the window has counted, or None if it has to be seeded."""
+        with self._lock:
+            window = self.windows.get(account_number)
+            return window["version"] if window else None
+
+    def seed(self, account_number, transactions, version):
+        """Start tracking an account from its (transaction_type, amount, timestamp) rows up to
+        ledger row `version`."""
+        with self._lock:
+            self.windows[account_number] = {"buckets": deque(), "totals": [0, 0, 0],
+                                            "version": version, "pending": set()}
+            self.windows.move_to_end(account_number)
+            for transaction_type, amount, timestamp in sorted(transactions, key=lambda t: t[2]):
+                self._add(account_number, transaction_type, amount, timestamp.timestamp())
+            while len(self.windows) > self.max_accounts:
+                self.windows.popitem(last=False)
+
+    def catch_up(self, account_number, transactions):
+        """Count (transaction_type, amount, timestamp, transaction_id) rows appended after the
+        window's version, skipping the ones this process already recorded."""
+        with self._lock:
+            window = self.windows.get(account_number)
+            if window is None or window["version"] is None:
+                return
+            version = window["version"]
+            for transaction_type, amount, timestamp, transaction_id in sorted(transactions, key=lambda t: t[3]):
+                if transaction_id <= version or transaction_id in window["pending"]:
+                    continue
+                self._add(account_number, transaction_type, amount, timestamp.timestamp())
+            version = max([version] + [transaction[3] for transaction in transactions])
+            window["version"] = version
+            window["pending"] = {transaction_id for transaction_id in window["pending"] if transaction_id > version}
+
+    def record(self, account_number, transaction_type, amount, timestamp=None, transaction_id=None):
+        """Feed a posted transaction into the account's counters.
+
+        Without its ledger row id the window can no longer be checked against the
+        database, so it is seeded again on next use.
+        """
+        with self._lock:
+            # Untracked accounts pick this row up from the database when they are seeded
+            window = self.windows.get(account_number)
+            if window is None:
+                return
+            if transaction_id is None:
+                window["version"] = None
+            elif window["version"] is not None:
+                if transaction_id <= window["version"]:
+                    return  # Already counted by a catch-up
+                window["pending"].add(transaction_id)
+            self._add(account_number, transaction_type, amount,
+                      timestamp.timestamp() if timestamp else time.time())
+
+    def forget(self, account_number):
+        with self._lock:
+            self.windows.pop(account_number, None)
+
+    def counts(self, account_number, now=None):
+        """Return (deposits, repayments, failed) inside the six-month window."""
+        with self._lock:
+            window = self.windows[account_number]
+            self.windows.move_to_end(account_number)
+            self._expire(window, six_months_ago(now).timestamp())
+            return tuple(window["totals"])
+
+    def next_expiry(self, account_number):
+        """When the oldest event in the window drops out, or None if the window is empty.
+
+        Until then the counts can only change through new postings. An account that is
+        no longer tracked counts as expired already.
+        """
+        with self._lock:
+            window = self.windows.get(account_number)
+            if window is None:
+                return 0
+            for key, start, events, counts in window["buckets"]:
+                if start < len(events):
+                    return six_months_after(datetime.fromtimestamp(events[start][0])).timestamp()
+            return None
+
+    def _add(self, account_number, transaction_type, amount, ts):
+        kind = self.classify(transaction_type, amount)
+        if kind is None:
+            return
+        window = self.windows[account_number]
+        buckets = window["buckets"]
+        key = int(ts // self.bucket_seconds)
+        # Bucket layout: [key, first live event index, [(ts, kind), ...], [deposits, repayments, failed]]
+        if not buckets or buckets[-1][0] != key:
+            buckets.append([key, 0, [], [0, 0, 0]])
+        bucket = buckets[-1]
+        bucket[2].append((ts, kind))
+        bucket[3][kind] += 1
+        window["totals"][kind] += 1
+
+    def _expire(self, window, cutoff):
+        buckets, totals = window["buckets"], window["totals"]
+        while buckets:
+            key, start, events, counts = buckets[0]
+            if (key + 1) * self.bucket_seconds <= cutoff:
+                # The whole bucket is older than the window: drop it in one step
+                for kind in (self.DEPOSIT, self.REPAYMENT, self.FAILED):
+                    totals[kind] -= counts[kind]
+                buckets.popleft()
+                continue
+            # Only the bucket straddling the cutoff is trimmed event by event
+            while start < len(events) and events[start][0] < cutoff:
+                kind = events[start][1]
+                totals[kind] -= 1
+                counts[kind] -= 1
+                start += 1
+            buckets[0][1] = start
+            break
+
+class LoanPreapprovalIndex:
+    """Loan terms per account, precomputed so eligibility checks are a dict lookup.
+
+    An entry is dropped whenever the account's balance or scored history changes, and
+    expires on its own when the oldest event in the six-month window ages out (the score
+    could then change without any posting). Entries are filled through begin()/put():
+    a put is discarded if the account was invalidated after its begin(), so a refresh
+    that raced a posting never stores terms computed from the old balance.
+    Writes through the owning DatabaseManager invalidate entries directly. Writes from
+    anywhere else (other processes, bulk jobs, stored procedures) are caught on get():
+    each entry keeps the id of the account's newest ledger row, and every writer
+    appends one when it moves money, so an entry is only used while that id is unchanged.
+    """
+
+    def __init__(self):
+        self.entries = {}  # account_number -> (credit_score, terms or None, valid_until or None, version)
+        self.generations = {}  # account_number -> invalidation counter
+        self._lock = threading.Lock()
+
+    def __contains__(self, account_number):
+        return account_number in self.entries
+
+    def get(self, account_number, version, now=None):
+        """Return (credit_score, terms) or None if the account has no entry for `version`,
+        the id of its newest ledger row."""
+        entry = self.entries.get(account_number)
+        if entry is None:
+            return None
+        credit_score, terms, valid_until, entry_version = entry
+        if entry_version != version or (valid_until is not None and (now if now else time.time()) >= valid_until):
+            self.invalidate(account_number)
+            return None
+        return credit_score, terms
+
+    def begin(self, account_number):
+        with self._lock:
+            return self.generations.get(account_number, 0)
+
+    def put(self, account_number, generation, version, balance, credit_score, valid_until=None):
+        with self._lock:
+            if self.generations.get(account_number, 0) == generation:
+                self.entries[account_number] = (credit_score, loan_terms(balance, credit_score), valid_until,
+                                                version)
+
+    def invalidate(self, account_number):
+        with self._lock:
+            self.generations[account_number] = self.generations.get(account_number, 0) + 1
+            self.entries.pop(account_number, None)
+
+def luhn_check_digit(body):
+    """Luhn check digit for a string of digits."""
+    total = 0
+    for position, digit in enumerate(reversed(body)):
+        value = int(digit)
+        if position % 2 == 0:  # Doubled positions, counting from the digit next to the check digit
+            value *= 2
+            if value > 9:
+                value -= 9
+        total += value
+    return str((10 - total % 10) % 10)
+
+class NumberAllocator:
+    """Collision-free account and card numbers from block-reserved database sequences.
+
+    Each number is a sequence value followed by a Luhn check digit. A block of values
+    is reserved with one locked read and update of number_sequences, and numbers that
+    were already handed out at random before the allocator existed are skipped.
+    """
+
+    # sequence name -> (first value, last value); bodies are one digit shorter than the number
+    SEQUENCES = {
+        "account_number": (100000000, 999999999),
+        "card_number": (400000000000000, 499999999999999)
+    }
+
+    def __init__(self, db_manager, block_size=1000):
+        self.db_manager = db_manager
+        self.block_size = block_size
+        self.available = {name: deque() for name in self.SEQUENCES}
+        self._lock = threading.Lock()
+
+    def next(self, name):
+        return self.take(name, 1)[0]
+
+    def take(self, name, count):
+        """Return `count` unused numbers from the named sequence."""
+        with self._lock:
+            available = self.available[name]
+            while len(available) < count:
+                available.extend(self._reserve_block(name, max(self.block_size, count - len(available))))
+            return [available.popleft() for _ in range(count)]
+
+    def _reserve_block(self, name, size):
+        first, last = self.SEQUENCES[name]
+        db = self.db_manager
+        # Callers reserve before opening their own unit of work, so the sequence row lock is short
+        with db.unit_of_work():
+            db.cursor.execute("SELECT next_value FROM number_sequences WHERE name = %s FOR UPDATE", (name,))
+            row = db.cursor.fetchone()
+            start = row[0] if row else first
+            end = min(start + size, last + 1)
+            if start > last:
+                raise RuntimeError(f"Sequence {name} is exhausted")
+            if row:
+                db.cursor.execute("UPDATE number_sequences SET next_value = %s WHERE name = %s", (end, name))
+            else:
+                db.cursor.execute("INSERT INTO number_sequences (name, next_value) VALUES (%s, %s)", (name, end))
+
+            # Numbers issued randomly before the allocator can fall inside the block
+            low, high = str(start * 10), str((end - 1) * 10 + 9)
+            db.cursor.execute(f"SELECT {name} FROM customers WHERE {name} BETWEEN %s AND %s", (low, high))
+            taken = {row[0] for row in db.cursor.fetchall()}
+
+        numbers = []
+        for body in range(start, end):
+            number = str(body) + luhn_check_digit(str(body))
+            if number not in taken:
+                numbers.append(number)
+        return numbers
+
+class StorageBackend(abc.ABC):
+    """Where DatabaseManager's connections come from, and how that engine differs.
+
+    Backends hand out connections with the pymysql-style surface the manager uses:
+    cursor(), begin(), commit(), rollback(), ping(reconnect), close() and `open`,
+    with cursors that take %s placeholders.
+    """
+
+    name = None
+    supports_procedures = False  # Stored procedures for PostingEngine (migration 4)
+    IntegrityError = Exception
+    connection_errors = ()  # Errors after which a pooled connection is thrown away
+    max_params = 999  # Bind parameters one statement may carry
+
+    @abc.abstractmethod
+    def connect(self):
+        """A new connection to this backend's database."""
+
+    @abc.abstractmethod
+    def has_table(self, cursor, name):
+        """True if the connected database has a table called `name`."""
+
+    def check_schema(self, cursor):
+        """Raise RuntimeError if the connected database predates what the manager expects."""
+
+    def describe(self):
+        return self.name
+
+    def is_retryable(self, error):
+        """True if the transaction was aborted over a lock conflict and can simply run again."""
+        return False
+
+class MySQLBackend(StorageBackend):
+    name = "mysql"
+    supports_procedures = True
+    max_params = 65535  # Prepared statement limit
+
+    def __init__(self, database="bank_system", host="localhost", user="root", password=None):
+        if pymysql is None:
+            raise RuntimeError("pymysql is not installed; install it or use SQLiteBackend")
+        self.database = database
+        self.host = host
+        self.user = user
+        self.password = password if password is not None else os.getenv("MYSQL_PASSWORD")
+        self.IntegrityError = pymysql.IntegrityError
+        self.connection_errors = (pymysql.OperationalError, pymysql.InterfaceError)
+        # Money parameters go over the wire as their paise, the BIGINT columns' unit
+        self.conversions = dict(pymysql.converters.conversions)
+        self.conversions[Money] = lambda value, mapping=None: str(value.paise)
+
+    def connect(self):
+        return pymysql.connect(
+            host=self.host,
+            user=self.user,
+            password=self.password,
+            database=self.database,
+            conv=self.conversions
         )
-        self.cursor = self.conn.cursor()
+
+    def describe(self):
+        return f"MySQL - Database: {self.database}"
+
+    def has_table(self, cursor, name):
+        cursor.execute("""SELECT COUNT(*) FROM information_schema.TABLES
+                          WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s""", (name,))
+        return cursor.fetchone()[0] > 0
+
+    def check_schema(self, cursor):
+        # Money binds as paise, so a database still holding rupees in DECIMAL columns
+        # would store every amount 100 times too large
+        cursor.execute("""SELECT DATA_TYPE FROM information_schema.COLUMNS
+                          WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'customers'
+                          AND COLUMN_NAME = 'balance'""")
+        row = cursor.fetchone()
+        if row is None or row[0].lower() != "bigint":
+            raise RuntimeError(f"{self.database} does not store amounts in paise yet (migration 6, "
+                               f"money_in_paise); run `python migrations.py --database {self.database} migrate`")
+
+    def is_retryable(self, error):
+        return isinstance(error, pymysql.OperationalError) and error.args[0] in DEADLOCK_ERRORS
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS customers (
+    user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username VARCHAR(255) NOT NULL,
+    email VARCHAR(255) UNIQUE NOT NULL,
+    password_hash VARCHAR(255) NOT NULL,
+    address TEXT NOT NULL,
+    mobile_number VARCHAR(15) UNIQUE NOT NULL,
+    aadhaar_number VARCHAR(12) UNIQUE NOT NULL,
+    account_number VARCHAR(20) UNIQUE NOT NULL,
+    ifsc_code VARCHAR(11) NOT NULL,
+    card_number VARCHAR(16) UNIQUE NOT NULL,
+    encrypted_card_pin VARCHAR(255) NOT NULL,
+    balance BIGINT NOT NULL DEFAULT 0,
+    credit_score INT DEFAULT 600,
+    loan_amount BIGINT DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS transaction_record (
+    transaction_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INT NOT NULL,
+    account_number VARCHAR(20) NOT NULL,
+    transaction_type VARCHAR(20) NOT NULL,
+    counterparty VARCHAR(20),
+    amount BIGINT NOT NULL,
+    timestamp TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+CREATE INDEX IF NOT EXISTS idx_txn_account_time
+    ON transaction_record (account_number, timestamp, transaction_id);
+CREATE INDEX IF NOT EXISTS idx_txn_account_id
+    ON transaction_record (account_number, transaction_id);
+CREATE TABLE IF NOT EXISTS transfer_handoffs (
+    handoff_id CHAR(32) PRIMARY KEY,
+    from_account VARCHAR(20) NOT NULL,
+    to_account VARCHAR(20) NOT NULL,
+    amount BIGINT NOT NULL,
+    status VARCHAR(10) NOT NULL CHECK (status IN ('PREPARED', 'COMMITTED', 'ABORTED', 'REFUNDED')),
+    created_at TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime')),
+    completed_at TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_handoff_status
+    ON transfer_handoffs (status, to_account);
+CREATE TABLE IF NOT EXISTS number_sequences (
+    name VARCHAR(32) PRIMARY KEY,
+    next_value BIGINT NOT NULL
+);
+INSERT OR IGNORE INTO number_sequences (name, next_value) VALUES
+    ('account_number', 100000000),
+    ('card_number', 400000000000000);
+"""
+
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",  # Readers never block the writer
+    "PRAGMA synchronous = NORMAL",  # fsync at checkpoints; a commit survives a process crash
+    "PRAGMA busy_timeout = 5000",  # Wait for the write lock instead of failing at once
+    "PRAGMA cache_size = -65536",  # 64 MiB page cache
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA mmap_size = 268435456"
+)
+
+@functools.lru_cache(maxsize=1024)
+def sqlite_sql(query):
+    """Rewrite a pymysql-style statement for sqlite3.
+
+    Cached per statement text, so the rewritten text is identical on every call and
+    sqlite3's per-connection statement cache reuses the prepared statement.
+    """
+    # The write lock taken by BEGIN IMMEDIATE already covers what FOR UPDATE locks
+    query = re.sub(r"\s+FOR UPDATE\b", "", query)
+    return query.replace("%s", "?").replace("%%", "%")
+
+class SQLiteCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query, params=None):
+        self._cursor.execute(sqlite_sql(query), params if params is not None else ())
+        return self._cursor.rowcount
+
+    def executemany(self, query, params):
+        self._cursor.executemany(sqlite_sql(query), params)
+        return self._cursor.rowcount
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size):
+        return self._cursor.fetchmany(size)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+class SQLiteConnection:
+    """sqlite3 connection in autocommit mode; units of work open BEGIN IMMEDIATE explicitly."""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False,
+                                     detect_types=sqlite3.PARSE_DECLTYPES, cached_statements=512)
+        for pragma in SQLITE_PRAGMAS:
+            self._conn.execute(pragma)
+        self.open = True
+
+    def cursor(self):
+        return SQLiteCursor(self._conn.cursor())
+
+    def begin(self):
+        # Take the write lock up front: a deferred transaction that later needs to write
+        # can fail with SQLITE_BUSY instead of waiting
+        self._conn.execute("BEGIN IMMEDIATE")
+
+    def commit(self):
+        if self._conn.in_transaction:
+            self._conn.execute("COMMIT")
+
+    def rollback(self):
+        if self._conn.in_transaction:
+            self._conn.execute("ROLLBACK")
+
+    def ping(self, reconnect=True):
+        if not self.open:
+            raise sqlite3.InterfaceError("Connection is closed")
+
+    def close(self):
+        self._conn.close()
+        self.open = False
+
+# sqlite3 keeps adapters and converters process-wide: Money is stored as its paise,
+# datetimes in the same text form as the ledger's timestamps, and TIMESTAMP columns
+# come back as datetimes
+sqlite3.register_adapter(Money, lambda value: value.paise)
+sqlite3.register_adapter(datetime, lambda value: value.strftime("%Y-%m-%d %H:%M:%S"))
+sqlite3.register_converter("TIMESTAMP", lambda value: datetime.fromisoformat(value.decode()))
+
+class SQLiteBackend(StorageBackend):
+    """Embedded single-file database in WAL mode, for single-node deployments.
+
+    Posting needs no network hop or server process. The schema is created on first
+    use; stored procedures (single_round_trip) are MySQL only.
+    """
+
+    name = "sqlite"
+    IntegrityError = sqlite3.IntegrityError
+    connection_errors = (sqlite3.InterfaceError, sqlite3.ProgrammingError)
+    # SQLITE_MAX_VARIABLE_NUMBER: 999 before SQLite 3.32
+    max_params = 32766 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999
+
+    def __init__(self, path="bank_system.db"):
+        self.path = path
+        conn = SQLiteConnection(path)
+        try:
+            conn._conn.executescript(SQLITE_SCHEMA)
+            conn.begin()
+            if conn._conn.execute("PRAGMA user_version").fetchone()[0] < 1:
+                # Files written before amounts were stored in paise held rupees
+                conn._conn.execute("""UPDATE customers SET balance = CAST(ROUND(balance * 100) AS INTEGER),
+                                      loan_amount = CAST(ROUND(loan_amount * 100) AS INTEGER)""")
+                conn._conn.execute("UPDATE transaction_record SET amount = CAST(ROUND(amount * 100) AS INTEGER)")
+                conn._conn.execute("PRAGMA user_version = 1")
+            if conn._conn.execute("PRAGMA user_version").fetchone()[0] < 2:
+                # The schema used to create account_snapshots, which now marks a ledger-mode
+                # file; an empty one was never used as a ledger
+                if self.has_table(conn.cursor(), "account_snapshots") and \
+                        conn._conn.execute("SELECT COUNT(*) FROM account_snapshots").fetchone()[0] == 0:
+                    conn._conn.execute("DROP TABLE account_snapshots")
+                conn._conn.execute("PRAGMA user_version = 2")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def connect(self):
+        return SQLiteConnection(self.path)
+
+    def has_table(self, cursor, name):
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = %s", (name,))
+        return cursor.fetchone()[0] > 0
+
+    def describe(self):
+        return f"SQLite - {self.path}"
+
+    def is_retryable(self, error):
+        return isinstance(error, sqlite3.OperationalError) and "locked" in str(error)
+
+def backend_from_env():
+    """SQLite at $BANK_SQLITE_PATH when that is set, MySQL otherwise."""
+    path = os.getenv("BANK_SQLITE_PATH")
+    return SQLiteBackend(path) if path else MySQLBackend()
+
+class ConnectionPool:
+    """Bounded pool of database connections shared by worker threads."""
+
+    def __init__(self, connect, min_size=1, max_size=10, timeout=30.0, health_check_interval=30.0):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Pool sizes must satisfy 0 <= min_size <= max_size and max_size >= 1")
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval  # Idle connections older than this are pinged
+        self._idle = deque()  # (connection, last_used)
+        self._size = 0
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            "checkouts": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "timeouts": 0,
+            "reconnects": 0,
+            "discarded": 0,
+            "peak_in_use": 0
+        }
+        for _ in range(min_size):
+            self._idle.append((connect(), time.time()))
+            self._size += 1
+
+    def acquire(self):
+        start = time.perf_counter()
+        deadline = start + self.timeout
+        conn = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1  # Reserve the slot, connect outside the lock
+                    break
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise TimeoutError(f"No database connection free after {self.timeout}s")
+                self._cond.wait(remaining)
+            self._in_use += 1
+
+        try:
+            if conn is None:
+                conn = self._connect()
+            elif time.time() - last_used > self.health_check_interval:
+                conn = self._check(conn)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        waited = time.perf_counter() - start
+        with self._cond:
+            self._stats["checkouts"] += 1
+            self._stats["wait_time_total"] += waited
+            self._stats["wait_time_max"] = max(self._stats["wait_time_max"], waited)
+            self._stats["peak_in_use"] = max(self._stats["peak_in_use"], self._in_use)
+        return conn
+
+    def _check(self, conn):
+        # Health check: ping and let the driver reconnect, replace the connection if that fails
+        try:
+            conn.ping(reconnect=True)
+            return conn
+        except Exception:
+            try:
+                conn.close()
+            except Exception:
+                pass
+            self._stats["reconnects"] += 1
+            return self._connect()
+
+    def release(self, conn, broken=False):
+        with self._cond:
+            self._in_use -= 1
+            if broken or not conn.open:
+                self._size -= 1
+                self._stats["discarded"] += 1
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            else:
+                self._idle.append((conn, time.time()))
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "utilization": self._in_use / self.max_size,
+                "wait_time_avg": (stats["wait_time_total"] / stats["checkouts"]
+                                  if stats["checkouts"] else 0.0)
+            })
+            return stats
+
+    def close_all(self):
+        with self._cond:
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._size -= 1
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+DEADLOCK_ERRORS = (1205, 1213)  # Lock wait timeout, deadlock victim
+
+def checked_out(method):
+    """Run a DatabaseManager method on a connection checked out for the calling thread."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.session():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+class DatabaseManager:
+    def __init__(self, cache_manager=None, pool_min=None, pool_max=None, single_round_trip=False,
+                 database="bank_system", backend=None, ledger=False, compact_interval=None, compact_min_tail=100,
+                 check_schema=True):
+        self.backend = backend if backend else MySQLBackend(database)
+        # Ledger mode belongs to the database: once account_snapshots exists, balances
+        # live in the ledger and every manager on that database has to read them there
+        ledger = self._inspect_schema(check_schema) or ledger
+        if single_round_trip and not self.backend.supports_procedures:
+            raise ValueError(f"single_round_trip needs stored procedures, which {self.backend.name} lacks")
+        if single_round_trip and ledger:
+            raise ValueError("single_round_trip and ledger are separate posting paths, pick one "
+                             "(this database is in ledger mode if it has account_snapshots)")
+        if compact_interval and not (ledger and pool_max):
+            raise ValueError("compact_interval needs ledger mode and a connection pool")
         self.cache_manager = cache_manager
-        print("✅ Connected to MySQL - Database: bank_system")
+        self.score_engine = CreditScoreEngine()
+        self.preapprovals = LoanPreapprovalIndex()
+        # Append-only ledger mode: balances are snapshot plus tail
+        self.ledger = LedgerEngine(self) if ledger else None
+        # Server-side posting path (needs migration 4); Customer operations use it when set
+        self.posting_engine = PostingEngine(self) if single_round_trip else self.ledger
+        self._local = threading.local()  # Connection checked out by each thread
+        if pool_max:
+            # Pooled mode: every operation checks a connection out for its own thread
+            self.pool = ConnectionPool(self._connect, min_size=pool_min if pool_min is not None else 1,
+                                       max_size=pool_max)
+            print(f"✅ Connected to {self.backend.describe()} (pool of up to {pool_max})")
+        else:
+            self.pool = None
+            self._conn = self._connect()
+            self._cursor = self._conn.cursor()
+            print(f"✅ Connected to {self.backend.describe()}")
+        self.compactor = None
+        if self.ledger:
+            self.ledger.open_accounts()
+            if compact_interval:
+                self.compactor = LedgerCompactor(self.ledger, compact_interval, compact_min_tail)
+
+    def _connect(self):
+        return self.backend.connect()
+
+    def _inspect_schema(self, check_schema):
+        """Refuse a database whose schema the manager cannot work with (check_schema=False
+        is for migrations.py); True if the database is in ledger mode."""
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            if check_schema:
+                self.backend.check_schema(cursor)
+            return self.backend.has_table(cursor, "account_snapshots")
+        finally:
+            conn.close()
+
+    @property
+    def conn(self):
+        if self.pool is None:
+            return self._conn
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            raise RuntimeError("No connection checked out, wrap the work in db_manager.session()")
+        return conn
+
+    @property
+    def cursor(self):
+        if self.pool is None:
+            return self._cursor
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None:
+            raise RuntimeError("No connection checked out, wrap the work in db_manager.session()")
+        return cursor
+
+    @contextmanager
+    def session(self):
+        """Hold one connection for the calling thread until the block exits."""
+        if self.pool is None or getattr(self._local, "conn", None) is not None:
+            # Single connection, or already inside a session on this thread
+            yield self.conn
+            return
+        conn = self.pool.acquire()
+        self._local.conn = conn
+        self._local.cursor = conn.cursor()
+        broken = False
+        try:
+            yield conn
+        except self.backend.connection_errors:
+            broken = True
+            raise
+        finally:
+            try:
+                self._local.cursor.close()
+            except Exception:
+                broken = True
+            self._local.conn = None
+            self._local.cursor = None
+            self.pool.release(conn, broken=broken)
+
+    def pool_stats(self):
+        return self.pool.stats() if self.pool else None
+
+    @contextmanager
+    def unit_of_work(self):
+        """Run everything in the block as one transaction with a single commit.
+
+        Nested units join the enclosing one through a savepoint, so a failing inner
+        operation is undone on its own while the rest of the unit still commits.
+        """
+        unit = getattr(self._local, "unit", None)
+        if unit is not None:
+            unit["depth"] += 1
+            savepoint = f"uow_{unit['depth']}"
+            callbacks, scored = len(unit["after_commit"]), len(unit["scored"])
+            self.cursor.execute(f"SAVEPOINT {savepoint}")
+            try:
+                yield
+            except BaseException:
+                self.cursor.execute(f"ROLLBACK TO SAVEPOINT {savepoint}")
+                del unit["after_commit"][callbacks:]
+                for account_number in unit["scored"][scored:]:
+                    self.score_engine.forget(account_number)
+                del unit["scored"][scored:]
+                raise
+            else:
+                self.cursor.execute(f"RELEASE SAVEPOINT {savepoint}")
+            finally:
+                unit["depth"] -= 1
+            return
 
+        with self.session():
+            unit = {"depth": 0, "after_commit": [], "scored": []}
+            self._local.unit = unit
+            try:
+                self.conn.begin()
+                yield
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                # Counters fed by rolled back rows are rebuilt from the database on next use
+                for account_number in unit["scored"]:
+                    self.score_engine.forget(account_number)
+                raise
+            finally:
+                self._local.unit = None
+            # Cache writes only happen once the data is durable
+            for callback, args in unit["after_commit"]:
+                callback(*args)
+
+    def _commit(self):
+        # Inside a unit of work the commit happens once, when the unit ends
+        if getattr(self._local, "unit", None) is None:
+            self.conn.commit()
+
+    def _rollback(self, error):
+        if getattr(self._local, "unit", None) is not None:
+            raise error  # Abort the unit (or its savepoint) instead of undoing half of it
+        self.conn.rollback()
+
+    def _record_score(self, account_number, transaction_type, amount, transaction_id=None):
+        self.score_engine.record(account_number, transaction_type, amount, transaction_id=transaction_id)
+        self._balance_changed(account_number)
+        unit = getattr(self._local, "unit", None)
+        if unit is not None:
+            unit["scored"].append(account_number)  # Forgotten again if the unit rolls back
+
+    def _balance_changed(self, account_number):
+        # Once now and once after the commit, so a refresh that read the old row in
+        # between cannot store its terms
+        self.preapprovals.invalidate(account_number)
+        self._after_commit(self.preapprovals.invalidate, account_number)
+
+    def _window_counts(self, account_number):
+        self._sync_credit_window(account_number)
+        try:
+            return self.score_engine.counts(account_number)
+        except KeyError:
+            # Evicted by another thread since the sync
+            self._seed_credit_window(account_number)
+            return self.score_engine.counts(account_number)
+
+    def _sync_credit_window(self, account_number):
+        """Bring the account's score counters up to its newest ledger row, whoever wrote it,
+        and return that row's id."""
+        version = self.score_engine.version(account_number)
+        if version is None:
+            return self._seed_credit_window(account_number)
+        # Served by the (account_number, transaction_id) index; empty unless the account moved
+        self.cursor.execute("""SELECT transaction_type, amount, timestamp, transaction_id
+                               FROM transaction_record
+                               WHERE account_number = %s AND transaction_id > %s""", (account_number, version))
+        rows = self.cursor.fetchall()
+        if not rows:
+            return version
+        self.score_engine.catch_up(account_number, [(transaction_type, Money(amount), timestamp, transaction_id)
+                                                    for transaction_type, amount, timestamp, transaction_id in rows])
+        return max(row[3] for row in rows)
+
+    def _preapprove(self, account_number, version, balance):
+        # Terms for the account as a posting left it, stored once that posting commits;
+        # `version` is the posting's ledger row, so a later write anywhere supersedes them
+        counts = self._window_counts(account_number)
+        if self.score_engine.version(account_number) != version:
+            return  # The counters already include later rows; terms stored under `version` would be stale
+        credit_score = calculate_credit_score(balance, *counts)
+        valid_until = self.score_engine.next_expiry(account_number)
+
+        def store():
+            generation = self.preapprovals.begin(account_number)
+            self.preapprovals.put(account_number, generation, version, balance, credit_score, valid_until)
+        self._after_commit(store)
+
+    def _after_commit(self, callback, *args):
+        unit = getattr(self._local, "unit", None)
+        if unit is None:
+            callback(*args)
+        else:
+            unit["after_commit"].append((callback, args))
+
+    @checked_out
     def insert_customer(self, customer):
         try:
             query = """INSERT INTO customers (
@@ -269,48 +1539,109 @@ class DatabaseManager:
             )
             
             self.cursor.execute(query, data)
-            self.conn.commit()
-            self.cache_manager.update_cache(customer)
+            if self.ledger:
+                self.ledger.open_accounts([customer])
+            self._commit()
+            self._after_commit(self.cache_manager.update_cache, customer)
             print("✅ Customer created successfully")
             
-        except pymysql.IntegrityError as e:
+        except self.backend.IntegrityError as e:
             print(f"❌ Customer already exists: {e}")
-            self.conn.rollback()
+            self._rollback(e)
         except Exception as e:
             print(f"❌ Error creating customer: {e}")
-            self.conn.rollback()
+            self._rollback(e)
+
+    def onboard_customers(self, records, batch_size=1000):
+        """Create many customers at once, in batched inserts under a single commit.
+
+        records are dicts with username, email, password, address, mobile_number and
+        aadhaar_number. Numbers come from Customer.allocator (or a fresh NumberAllocator)
+        and passwords and PINs are hashed on Customer.hasher when one is set.
+        Returns the created account numbers, or an empty list if nothing was committed.
+        """
+        allocator = Customer.allocator if Customer.allocator else NumberAllocator(self)
+        records = list(records)
+        if not records:
+            return []
+        # Reserve every number before the insert transaction opens
+        account_numbers = allocator.take("account_number", len(records))
+        card_numbers = allocator.take("card_number", len(records))
 
-    def fetch_customer(self, account_number):
+        query = """INSERT INTO customers (
+            username, email, password_hash, address, mobile_number,
+            aadhaar_number, account_number, ifsc_code, card_number,
+            encrypted_card_pin, balance, credit_score, loan_amount
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"""
         try:
-            query = """SELECT user_id, username, email, password_hash, address,
-                      mobile_number, aadhaar_number, balance, loan_amount,
-                      encrypted_card_pin, account_number, ifsc_code, card_number,
-                      credit_score FROM customers WHERE account_number = %s"""
-            self.cursor.execute(query, (account_number,))
+            with self.unit_of_work():
+                for offset in range(0, len(records), batch_size):
+                    batch = records[offset:offset + batch_size]
+                    secrets_to_hash = [r["password"] for r in batch]
+                    secrets_to_hash += [str(random.randint(1000, 9999)) for _ in batch]
+                    if Customer.hasher:
+                        hashes = Customer.hasher.hash_many(secrets_to_hash)
+                    else:
+                        hashes = [bcrypt_hash(secret) for secret in secrets_to_hash]
+
+                    rows = []
+                    for i, record in enumerate(batch):
+                        rows.append((
+                            record["username"], record["email"], hashes[i],
+                            record["address"], record["mobile_number"], record["aadhaar_number"],
+                            account_numbers[offset + i], "BANK1234567", card_numbers[offset + i],
+                            hashes[len(batch) + i], Money.ZERO, 600, Money.ZERO
+                        ))
+                    self.cursor.executemany(query, rows)
+                if self.ledger:
+                    self.ledger.open_accounts(account_numbers)
+            print(f"✅ {len(records)} customers onboarded")
+            return account_numbers
+        except self.backend.IntegrityError as e:
+            print(f"❌ Onboarding rolled back, duplicate customer data: {e}")
+        except Exception as e:
+            print(f"❌ Onboarding failed: {e}")
+        return []
+
+    @checked_out
+    def fetch_customer(self, account_number, columns=AccountHandle.PROFILE):
+        """An AccountHandle with `columns` loaded (the rest on first access), or None."""
+        try:
+            columns = tuple(columns)
+            required = ("account_number", "balance", "loan_amount") if self.ledger else ("account_number",)
+            columns += tuple(column for column in required if column not in columns)
+            self.cursor.execute(f"SELECT {self._column_list(columns)} FROM customers WHERE account_number = %s",
+                                (account_number,))
             result = self.cursor.fetchone()
-            
-            if result:
-                return Customer(
-                    user_id=result[0],
-                    username=result[1],
-                    email=result[2],
-                    password=None,
-                    address=result[4],
-                    mobile_number=result[5],
-                    aadhaar_number=result[6],
-                    balance=result[7],
-                    loan_amount=result[8],
-                    encrypted_card_pin=result[9],
-                    account_number=result[10],
-                    ifsc_code=result[11],
-                    card_number=result[12],
-                    credit_score=result[13]
-                )
-            return None
+            return self._ledger_balances(AccountHandle(self, columns, result)) if result else None
         except Exception as e:
             print(f"❌ Error fetching customer: {e}")
             return None
 
+    def _ledger_balances(self, handle):
+        # In ledger mode customers.balance is only refreshed by the compactor
+        if self.ledger:
+            with self.session():
+                state = self.ledger.state(handle.account_number)
+            if state:
+                handle.balance, handle.loan_amount = state[0], state[1]
+        return handle
+
+    @staticmethod
+    def _column_list(columns):
+        unknown = set(columns) - set(Customer.__slots__)
+        if unknown:
+            raise ValueError(f"Unknown customer columns: {', '.join(sorted(unknown))}")
+        return ", ".join(columns)
+
+    @checked_out
+    def load_columns(self, account_number, columns):
+        """The given columns of one customers row as a tuple, or None if it is gone."""
+        self.cursor.execute(f"SELECT {self._column_list(columns)} FROM customers WHERE account_number = %s",
+                            (account_number,))
+        return self.cursor.fetchone()
+
+    @checked_out
     def update_customer(self, customer):
         try:
             query = """UPDATE customers 
@@ -322,180 +1653,302 @@ class DatabaseManager:
                 customer.loan_amount,
                 customer.account_number
             ))
-            self.conn.commit()
-            self.cache_manager.update_cache(customer)
+            self._commit()
+            self._balance_changed(customer.account_number)
+            self._after_commit(self.cache_manager.update_cache, customer)
             print(f"✅ Customer {customer.account_number} updated")
         except Exception as e:
             print(f"❌ Update failed: {e}")
-            self.conn.rollback()
+            self._rollback(e)
 
+    @checked_out
     def delete_customer(self, account_number):
         try:
             self.cursor.execute("DELETE FROM transaction_record WHERE account_number = %s", 
                               (account_number,))
             self.cursor.execute("DELETE FROM customers WHERE account_number = %s", 
                               (account_number,))
-            self.conn.commit()
-            self.cache_manager.remove_from_cache(account_number)
+            if self.ledger:
+                self.cursor.execute("DELETE FROM account_snapshots WHERE account_number = %s", (account_number,))
+            self._commit()
+            self._balance_changed(account_number)
+            self._after_commit(self.score_engine.forget, account_number)
+            self._after_commit(self.cache_manager.remove_from_cache, account_number)
             print(f"✅ Customer {account_number} deleted")
         except Exception as e:
             print(f"❌ Deletion failed: {e}")
-            self.conn.rollback()
+            self._rollback(e)
+
+    def retry_deadlocks(self, operation, *args, retries=5):
+        """Run operation, running it again when InnoDB aborts it over a lock conflict."""
+        for attempt in range(retries + 1):
+            try:
+                return operation(*args)
+            except Exception as e:
+                # Inside an enclosing unit only the whole unit can be retried, not this step
+                if (not self.backend.is_retryable(e) or attempt == retries
+                        or getattr(self._local, "unit", None) is not None):
+                    raise
+                time.sleep(random.uniform(0, 0.01 * 2 ** attempt))
+
+    def transfer_funds(self, sender, receiver, amount):
+        """Move amount from sender to receiver without lost updates under concurrent workers.
 
-    def insert_transaction(self, user_id, account_number, transaction_type, amount):
+        Both rows are locked with SELECT ... FOR UPDATE in account-number order, the funds
+        check runs against the locked balance and the balances change through relative,
+        guarded updates. Deadlocks and lock wait timeouts are retried.
+        """
+        return self.retry_deadlocks(self._transfer_locked, sender, receiver, amount)
+
+    def _transfer_locked(self, sender, receiver, amount):
+        if amount <= 0:
+            raise ValueError("Transfer amount must be positive")
+        with self.unit_of_work():
+            self.cursor.execute("""SELECT account_number, balance FROM customers
+                                   WHERE account_number IN (%s, %s)
+                                   ORDER BY account_number
+                                   FOR UPDATE""", (sender.account_number, receiver.account_number))
+            balances = {number: Money(balance) for number, balance in self.cursor.fetchall()}
+            if len(balances) != 2:
+                raise ValueError("Account not found")
+            if balances[sender.account_number] < amount:
+                raise ValueError("Insufficient balance")
+
+            # Scores use the balances as they were before the transfer, like update_credit_score
+            scores = {}
+            for number, balance in balances.items():
+                deposits, repayments, failed_transactions = self._window_counts(number)
+                scores[number] = calculate_credit_score(balance, deposits, repayments, failed_transactions)
+
+            for customer, delta in ((sender, -amount), (receiver, amount)):
+                self.cursor.execute("""UPDATE customers
+                                       SET balance = balance + %s, credit_score = %s
+                                       WHERE account_number = %s AND balance + %s >= 0""",
+                                    (delta, scores[customer.account_number], customer.account_number, delta))
+                if self.cursor.rowcount != 1:
+                    raise ValueError("Insufficient balance")
+                customer.balance = balances[customer.account_number] + delta
+                customer.credit_score = scores[customer.account_number]
+                if self.cache_manager:
+                    self._after_commit(self.cache_manager.update_cache, customer)
+
+            self.insert_transaction(sender.user_id, sender.account_number, "Transfer Out", -amount,
+                                    receiver.account_number)
+            self.insert_transaction(receiver.user_id, receiver.account_number, "Transfer In", amount,
+                                    sender.account_number)
+
+    @checked_out
+    def insert_transaction(self, user_id, account_number, transaction_type, amount, counterparty=None):
         try:
+            # The timestamp is set here so the cached history and the ledger agree on it
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             query = """INSERT INTO transaction_record 
-                      (user_id, account_number, transaction_type, amount) 
-                      VALUES (%s, %s, %s, %s)"""
-            self.cursor.execute(query, (user_id, account_number, transaction_type, amount))
-            self.conn.commit()
+                      (user_id, account_number, transaction_type, counterparty, amount, timestamp) 
+                      VALUES (%s, %s, %s, %s, %s, %s)"""
+            self.cursor.execute(query, (user_id, account_number, transaction_type, counterparty,
+                                        amount, timestamp))
+            transaction_id = self.cursor.lastrowid
+            self._commit()
+            self._record_score(account_number, transaction_type, amount, transaction_id)
             
             # Update transaction cache
             if self.cache_manager:
-                self.cache_manager.add_transaction(
+                self._after_commit(
+                    self.cache_manager.add_transaction,
                     account_number,
                     transaction_type,
                     amount,
-                    datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    timestamp,
+                    transaction_id,
+                    counterparty
                 )
             print(f"✅ Transaction recorded: {transaction_type} ₹{amount}")
         except Exception as e:
             print(f"❌ Transaction recording failed: {e}")
-            self.conn.rollback()
+            self._rollback(e)
+
+    @checked_out
+    def fetch_transactions(self, account_number, before=None, limit=10):
+        """Print and return one page of history, newest first.
 
-    def fetch_transactions(self, account_number):
+        Pass the returned cursor as `before` to get the next (older) page. Recent pages come
+        from the cached history; older ones use keyset pagination on
+        (timestamp, transaction_id), so deep pages cost the same as the first.
+        Returns (transactions, next_cursor); next_cursor is None on the last page.
+        """
         try:
-            query = """SELECT transaction_type, amount, timestamp 
-                      FROM transaction_record 
-                      WHERE account_number = %s 
-                      ORDER BY timestamp DESC LIMIT 10"""
-            self.cursor.execute(query, (account_number,))
-            transactions = self.cursor.fetchall()
-            
+            transactions = None
+            cache = self.cache_manager
+            if before is None and cache and limit <= cache.max_transactions:
+                transactions = cache.get_history(account_number)
+                if transactions is None:
+                    # Read-through: fill the account's deque, then serve from it
+                    cache.begin_history_fill(account_number)
+                    rows = self._query_transactions(account_number, None, cache.max_transactions)
+                    cache.fill_history(account_number, rows)
+                    transactions = rows
+                # One extra row tells whether an older page exists
+                has_more = len(transactions) > limit
+                transactions = transactions[:limit]
+                if not has_more and len(transactions) == limit == cache.max_transactions:
+                    has_more = True  # The deque is full, older rows may exist in the ledger
+            else:
+                transactions = self._query_transactions(account_number, before, limit + 1)
+                has_more = len(transactions) > limit
+                transactions = transactions[:limit]
+
             if transactions:
                 print("\n===== Transaction History =====")
                 for t in transactions:
-                    print(f"{t[2]} - {t[0]} ₹{t[1]}")
+                    print(f"{t['timestamp']} - {describe_transaction(t['type'], t['counterparty'])} ₹{t['amount']}")
             else:
                 print("No transactions found.")
+
+            next_cursor = None
+            if has_more and transactions:
+                next_cursor = (transactions[-1]["timestamp"], transactions[-1]["transaction_id"])
+            return transactions, next_cursor
         except Exception as e:
             print(f"❌ Error fetching transactions: {e}")
+            return [], None
+
+    def _query_transactions(self, account_number, before, limit):
+        if before is None:
+            query = """SELECT transaction_id, transaction_type, counterparty, amount, timestamp
+                      FROM transaction_record
+                      WHERE account_number = %s
+                      ORDER BY timestamp DESC, transaction_id DESC LIMIT %s"""
+            params = (account_number, limit)
+        else:
+            # Keyset condition spelled out so it can seek on (account_number, timestamp, transaction_id)
+            before_timestamp, before_id = before
+            query = """SELECT transaction_id, transaction_type, counterparty, amount, timestamp
+                      FROM transaction_record
+                      WHERE account_number = %s
+                      AND (timestamp < %s OR (timestamp = %s AND transaction_id < %s))
+                      ORDER BY timestamp DESC, transaction_id DESC LIMIT %s"""
+            params = (account_number, before_timestamp, before_timestamp, before_id, limit)
+        self.cursor.execute(query, params)
+        return [
+            {
+                "transaction_id": row[0],
+                "type": row[1],
+                "counterparty": row[2],
+                "amount": Money(row[3]),
+                "timestamp": str(row[4])
+            }
+            for row in self.cursor.fetchall()
+        ]
 
     def authenticate_customer(self, email, password):
         try:
-            query = """SELECT user_id, username, email, password_hash, address,
-                      mobile_number, aadhaar_number, balance, loan_amount,
-                      encrypted_card_pin, account_number, ifsc_code, card_number,
-                      credit_score FROM customers WHERE email = %s"""
-            self.cursor.execute(query, (email,))
-            result = self.cursor.fetchone()
-            
-            if result and bcrypt.checkpw(password.encode(), result[3].encode()):
-                return Customer(
-                    user_id=result[0],
-                    username=result[1],
-                    email=result[2],
-                    password=None,
-                    address=result[4],
-                    mobile_number=result[5],
-                    aadhaar_number=result[6],
-                    balance=result[7],
-                    loan_amount=result[8],
-                    encrypted_card_pin=result[9],
-                    account_number=result[10],
-                    ifsc_code=result[11],
-                    card_number=result[12],
-                    credit_score=result[13]
-                )
+            # The hash is only needed for the check; the handle loads it again if asked
+            query = f"""SELECT password_hash, {self._column_list(AccountHandle.PROFILE)}
+                       FROM customers WHERE email = %s"""
+            with self.session():
+                self.cursor.execute(query, (email,))
+                result = self.cursor.fetchone()
+
+            # bcrypt runs with the connection back in the pool
+            if result and Customer.verify_password(result[0], password):
+                return self._ledger_balances(AccountHandle(self, AccountHandle.PROFILE, result[1:]))
             return None
         except Exception as e:
             print(f"❌ Authentication error: {e}")
             return None
+    @checked_out
     def update_credit_score(self, account_number):
         """Calculate and update customer's credit score."""
         try:
-            # Get transaction history
-            query = """SELECT transaction_type, amount, timestamp 
-                      FROM transaction_record 
-                      WHERE account_number = %s 
-                      AND timestamp >= DATE_SUB(NOW(), INTERVAL 6 MONTH)"""
-            self.cursor.execute(query, (account_number,))
-            transactions = self.cursor.fetchall()
-            
-            # Get current balance and loan info
-            query = "SELECT balance, loan_amount FROM customers WHERE account_number = %s"
-            self.cursor.execute(query, (account_number,))
-            balance, loan_amount = self.cursor.fetchone()
-            
-            # Base score calculation
-            base_score = 600
-            
-            # Balance factor (up to +200)
-            balance_factor = min(200, int(float(balance) / 1000))
-            
-            # Transaction patterns
-            deposits = sum(1 for t in transactions if t[0] == "Deposit" and float(t[1]) >= 1000)
-            deposit_score = min(100, deposits * 20)
-            
-            # Loan repayment history
-            repayments = sum(1 for t in transactions if t[0] == "Loan Repayment")
-            repayment_score = min(150, repayments * 30)
-            
-            # Penalties for negative behavior
-            failed_transactions = sum(1 for t in transactions if t[0] in ["Failed", "Bounced"])
-            penalty = min(200, failed_transactions * 50)
-            
-            # Calculate final score
-            credit_score = min(900, base_score + balance_factor + deposit_score + 
-                             repayment_score - penalty)
-            
+            # Transaction patterns come from the rolling counters; the six-month history
+            # is only read once per account to seed them
+            deposits, repayments, failed_transactions = self._window_counts(account_number)
+
+            credit_score = calculate_credit_score(self._balance(account_number), deposits, repayments,
+                                                  failed_transactions)
+
             # Update credit score
             query = "UPDATE customers SET credit_score = %s WHERE account_number = %s"
             self.cursor.execute(query, (credit_score, account_number))
-            self.conn.commit()
-            
+            self._commit()
+
             return credit_score
-            
+
         except Exception as e:
             print(f"❌ Error updating credit score: {e}")
-            self.conn.rollback()
+            self._rollback(e)
             return None
 
+    def _balance(self, account_number):
+        # customers.balance lags the ledger in ledger mode, so read snapshot plus tail there
+        state = self.ledger.state(account_number) if self.ledger else None
+        if state:
+            return state[0]
+        self.cursor.execute("SELECT balance FROM customers WHERE account_number = %s", (account_number,))
+        row = self.cursor.fetchone()
+        if row is None:
+            raise LookupError(f"Account {account_number} not found")
+        return Money(row[0])
+
+    def _seed_credit_window(self, account_number):
+        # The version is read first, and only rows up to it are counted, so a later
+        # catch-up starts exactly where the seed stopped
+        version = self._last_transaction_id(account_number)
+        # Only the rows the score counts are worth shipping over the wire
+        query = f"""SELECT transaction_type, amount, timestamp
+                  FROM transaction_record
+                  WHERE account_number = %s
+                  AND timestamp >= %s
+                  AND transaction_id <= %s
+                  AND (transaction_type IN ('Loan Repayment', 'Failed', 'Bounced')
+                       OR (transaction_type = 'Deposit' AND amount >= {SCORED_DEPOSIT_PAISE}))"""
+        # The cutoff is computed here rather than with DATE_SUB so every backend agrees on it
+        self.cursor.execute(query, (account_number, six_months_ago(), version))
+        self.score_engine.seed(account_number, [(transaction_type, Money(amount), timestamp)
+                                                for transaction_type, amount, timestamp in self.cursor.fetchall()],
+                               version)
+        return version
+
+    def _last_transaction_id(self, account_number):
+        # The preapproval index's version: every balance change appends a ledger row
+        self.cursor.execute("SELECT MAX(transaction_id) FROM transaction_record WHERE account_number = %s",
+                            (account_number,))
+        last_id = self.cursor.fetchone()[0]
+        return last_id if last_id is not None else 0
+
+    def preapproved_terms(self, account_number):
+        """(credit_score, terms) from the preapproval index if they are still current, else None."""
+        if account_number not in self.preapprovals:
+            return None  # Nothing to validate, so no round trip
+        with self.session():
+            return self.preapprovals.get(account_number, self._last_transaction_id(account_number))
+
+    @checked_out
     def check_loan_eligibility(self, account_number, requested_amount):
         """Check if customer is eligible for loan."""
         try:
-            # Get customer details
-            query = """SELECT balance, credit_score, loan_amount 
-                      FROM customers 
-                      WHERE account_number = %s"""
-            self.cursor.execute(query, (account_number,))
-            balance, credit_score, current_loan = self.cursor.fetchone()
-            
-            # Update credit score first
-            credit_score = self.update_credit_score(account_number)
-            if not credit_score:
-                return False, "Failed to calculate credit score"
-            
-            # Calculate loan multiplier based on credit score
-            if credit_score >= 800:
-                multiplier = 3.0  # Can borrow up to 3x balance
-            elif credit_score >= 700:
-                multiplier = 2.0  # Can borrow up to 2x balance
-            elif credit_score >= 600:
-                multiplier = 1.0  # Can borrow up to 1x balance
+            # The counters are brought up to the account's newest ledger row, and that row is
+            # the version a fresh preapproval is stored under
+            version = self._sync_credit_window(account_number)
+            preapproved = self.preapprovals.get(account_number, version)
+            if preapproved:
+                credit_score, terms = preapproved
             else:
-                return False, f"Credit score too low ({credit_score}/900)"
-            
-            max_loan = float(balance) * multiplier
-            
-            if float(requested_amount) > max_loan:
-                return False, f"Maximum loan amount allowed: ₹{max_loan:.2f}"
-                
-            return True, {
-                "credit_score": credit_score,
-                "interest_rate": max(8, 15 - (credit_score - 600) / 100),
-                "max_loan": max_loan
-            }
+                generation = self.preapprovals.begin(account_number)
+
+                balance = self._balance(account_number)
+
+                # Update credit score first
+                credit_score = self.update_credit_score(account_number)
+                if not credit_score:
+                    return False, "Failed to calculate credit score"
+
+                terms = loan_terms(balance, credit_score)
+                # Stored once the score write commits, unless the account changes first
+                self._after_commit(self.preapprovals.put, account_number, generation, version, balance,
+                                   credit_score, self.score_engine.next_expiry(account_number))
+
+            return loan_eligibility(credit_score, terms, Money.of(requested_amount))
             
         except Exception as e:
             print(f"❌ Error checking loan eligibility: {e}")
@@ -503,85 +1956,1353 @@ class DatabaseManager:
 
     def close(self):
         try:
-            self.conn.close()
+            if self.compactor:
+                self.compactor.close()
+            if self.pool:
+                self.pool.close_all()
+            else:
+                self.conn.close()
             print("✅ Database connection closed")
         except Exception as e:
             print(f"❌ Error closing connection: {e}")
 
+class PostingEngine:
+    """Posts an operation with one stored-procedure CALL plus the commit.
+
+    The balance change, ledger insert and credit score refresh all happen server-side
+    (see migration 4), instead of the separate SELECT/UPDATE/INSERT round trips of the
+    unit-of-work path. Inside a unit of work the commit is left to the unit.
+    """
+
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+
+    def post(self, customer, transaction_type, amount, loan_delta=Money.ZERO, counterparty=None,
+             check_loan=False):
+        """Apply one posting to `customer` and return its new state.
+
+        With check_loan the result also carries the loan terms the posting was approved
+        under, which are based on the balance before it.
+        """
+        db = self.db_manager
+        with db.session():
+            deposits, repayments, failed = db._window_counts(customer.account_number)
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            try:
+                db.cursor.execute("CALL post_transaction(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)", (
+                    customer.account_number, transaction_type, counterparty, amount, loan_delta,
+                    timestamp, deposits, repayments, failed, check_loan
+                ))
+                balance, loan_amount, credit_score, transaction_id = db.cursor.fetchone()
+                while db.cursor.nextset():  # Drain the CALL status packet already on the wire
+                    pass
+                db._commit()
+            except Exception as e:
+                db._rollback(e)
+                raise
+
+            customer.balance = Money(balance)
+            customer.loan_amount = Money(loan_amount)
+            customer.credit_score = credit_score
+            self._posted(customer, transaction_type, amount, timestamp, transaction_id, counterparty)
+            # The procedure scored and checked the loan against the balance before the posting
+            terms = loan_terms(customer.balance - amount, credit_score) if check_loan else None
+            return {"balance": customer.balance, "loan_amount": customer.loan_amount,
+                    "credit_score": credit_score, "transaction_id": transaction_id, "terms": terms}
+
+    def transfer(self, sender, receiver, amount):
+        """Move `amount` between two customers in one CALL, locking both rows in account order."""
+        db = self.db_manager
+        with db.session():
+            sender_counts = db._window_counts(sender.account_number)
+            receiver_counts = db._window_counts(receiver.account_number)
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            try:
+                db.cursor.execute("CALL post_transfer(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)", (
+                    sender.account_number, receiver.account_number, amount, timestamp,
+                    *sender_counts, *receiver_counts
+                ))
+                (sender_balance, sender_score, sender_id,
+                 receiver_balance, receiver_score, receiver_id) = db.cursor.fetchone()
+                while db.cursor.nextset():
+                    pass
+                db._commit()
+            except Exception as e:
+                db._rollback(e)
+                raise
+
+            sender.balance, sender.credit_score = Money(sender_balance), sender_score
+            receiver.balance, receiver.credit_score = Money(receiver_balance), receiver_score
+            self._posted(sender, "Transfer Out", -amount, timestamp, sender_id, receiver.account_number)
+            self._posted(receiver, "Transfer In", amount, timestamp, receiver_id, sender.account_number)
+
+    def _posted(self, customer, transaction_type, amount, timestamp, transaction_id, counterparty):
+        db = self.db_manager
+        db._record_score(customer.account_number, transaction_type, amount, transaction_id)
+        db._preapprove(customer.account_number, transaction_id, customer.balance)
+        if db.cache_manager:
+            db._after_commit(db.cache_manager.update_cache, customer)
+            db._after_commit(db.cache_manager.add_transaction, customer.account_number, transaction_type,
+                             amount, timestamp, transaction_id, counterparty)
+
+LOAN_TYPES = ("Loan Taken", "Loan Repayment")
+
+# Created when a database enters ledger mode; its presence is what marks that mode
+ACCOUNT_SNAPSHOTS_TABLE = """CREATE TABLE IF NOT EXISTS account_snapshots (
+    account_number VARCHAR(20) PRIMARY KEY,
+    base_transaction_id BIGINT NOT NULL,
+    base_balance BIGINT NOT NULL,
+    base_loan_amount BIGINT NOT NULL,
+    last_transaction_id BIGINT NOT NULL,
+    balance BIGINT NOT NULL,
+    loan_amount BIGINT NOT NULL,
+    taken_at DATETIME NOT NULL
+)"""
+
+def seed_account_snapshots(cursor, taken_at):
+    """Opening snapshots for accounts that have none: their current balance and loan, as of
+    their newest ledger row. Everything the ledger computes later builds on these."""
+    cursor.execute("""INSERT INTO account_snapshots
+                          (account_number, base_transaction_id, base_balance, base_loan_amount,
+                           last_transaction_id, balance, loan_amount, taken_at)
+                      SELECT c.account_number, COALESCE(MAX(t.transaction_id), 0), c.balance,
+                             COALESCE(c.loan_amount, 0), COALESCE(MAX(t.transaction_id), 0), c.balance,
+                             COALESCE(c.loan_amount, 0), %s
+                      FROM customers c
+                      LEFT JOIN transaction_record t ON t.account_number = c.account_number
+                      WHERE NOT EXISTS (SELECT 1 FROM account_snapshots s
+                                        WHERE s.account_number = c.account_number)
+                      GROUP BY c.account_number, c.balance, c.loan_amount""", (taken_at,))
+    return cursor.rowcount
+
+class LedgerEngine(PostingEngine):
+    """Append-only posting, with transaction_record as the source of truth.
+
+    An account's balance and loan are its account_snapshots row plus the ledger rows
+    after the snapshot's last_transaction_id (the tail), so reading them costs O(tail)
+    and a posting is a single INSERT; customers.balance becomes a copy the compactor
+    refreshes. The snapshot row doubles as the account's lock: postings and compaction
+    read it FOR UPDATE (SQLite's BEGIN IMMEDIATE covers it), so each account's events
+    are appended one transaction at a time and a debit is checked against every
+    committed event. Loan balances follow from the Loan Taken / Loan Repayment rows.
+
+    Each snapshot also keeps the base it was opened from, so replay() can recompute an
+    account from its base and the full ledger, and rebuild() can repair a snapshot.
+    """
+
+    def open_accounts(self, accounts=None):
+        """Create opening snapshots for the given customers or account numbers, or for every
+        account that lacks one (creating account_snapshots first, which puts the database
+        in ledger mode)."""
+        db = self.db_manager
+        taken_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with db.session():
+            if accounts is None:
+                db.cursor.execute(ACCOUNT_SNAPSHOTS_TABLE)
+                with db.unit_of_work():
+                    created = seed_account_snapshots(db.cursor, taken_at)
+                if created > 0:
+                    print(f"✅ Opened ledger snapshots for {created} accounts")
+                return
+            rows = []
+            for account in accounts:
+                if isinstance(account, Customer):
+                    rows.append((account.account_number, account.balance, account.loan_amount,
+                                 account.balance, account.loan_amount, taken_at))
+                else:
+                    rows.append((account, Money.ZERO, Money.ZERO, Money.ZERO, Money.ZERO, taken_at))
+            db.cursor.executemany("""INSERT INTO account_snapshots
+                                         (account_number, base_transaction_id, base_balance, base_loan_amount,
+                                          last_transaction_id, balance, loan_amount, taken_at)
+                                     VALUES (%s, 0, %s, %s, 0, %s, %s, %s)""", rows)
+
+    def state(self, account_number, lock=False):
+        """(balance, loan_amount, last_transaction_id, tail_length) for an account, or None."""
+        cursor = self.db_manager.cursor
+        locking = " FOR UPDATE" if lock else ""
+        cursor.execute(f"""SELECT last_transaction_id, balance, loan_amount FROM account_snapshots
+                           WHERE account_number = %s{locking}""", (account_number,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        last_id, balance, loan_amount = row
+        # A locking read too: a consistent read could use an older view than the lock
+        # and miss events committed by the previous holder
+        cursor.execute(f"""SELECT COALESCE(SUM(amount), 0),
+                                  COALESCE(SUM(CASE WHEN transaction_type IN ('Loan Taken', 'Loan Repayment') THEN amount ELSE 0 END), 0),
+                                  MAX(transaction_id), COUNT(*)
+                           FROM transaction_record
+                           WHERE account_number = %s AND transaction_id > %s{locking}""", (account_number, last_id))
+        amount, loan_delta, tail_last_id, tail_length = cursor.fetchone()
+        # MySQL sums BIGINT columns as DECIMAL
+        return (Money(balance + int(amount)), Money(loan_amount + int(loan_delta)),
+                tail_last_id if tail_last_id is not None else last_id, tail_length)
+
+    def balances(self, account_numbers):
+        """{account_number: (balance, loan_amount)} computed from snapshot plus tail."""
+        db = self.db_manager
+        with db.session():
+            db.conn.commit()  # Start a fresh read view
+            states = {number: self.state(number) for number in account_numbers}
+        return {number: state[:2] for number, state in states.items() if state}
+
+    def post(self, customer, transaction_type, amount, loan_delta=Money.ZERO, counterparty=None,
+             check_loan=False):
+        """Append one posting for `customer` and return its new state."""
+        if loan_delta != (amount if transaction_type in LOAN_TYPES else Money.ZERO):
+            raise ValueError(f"The ledger derives loan changes from the type; {transaction_type} cannot move "
+                             f"the loan by ₹{loan_delta}")
+        db = self.db_manager
+        with db.unit_of_work():
+            state = self.state(customer.account_number, lock=True)
+            if state is None:
+                raise ValueError("Account not found")
+            balance, loan_amount = state[0], state[1]
+            if balance + amount < 0:
+                raise ValueError("Insufficient balance")
+            if loan_amount + loan_delta < 0:
+                raise ValueError("Invalid loan repayment amount")
+
+            # Scored on the balance before the posting, like update_credit_score
+            credit_score = calculate_credit_score(balance, *db._window_counts(customer.account_number))
+            terms = None
+            if check_loan:
+                terms = loan_terms(balance, credit_score)
+                if terms is None:
+                    raise ValueError("Credit score too low")
+                if amount > terms["max_loan"]:
+                    raise ValueError("Requested loan exceeds maximum loan amount")
+
+            timestamp, transaction_id = self._append(customer, transaction_type, amount, counterparty)
+            customer.balance = balance + amount
+            customer.loan_amount = loan_amount + loan_delta
+            customer.credit_score = credit_score
+            self._posted(customer, transaction_type, amount, timestamp, transaction_id, counterparty)
+        return {"balance": customer.balance, "loan_amount": customer.loan_amount,
+                "credit_score": credit_score, "transaction_id": transaction_id, "terms": terms}
+
+    def transfer(self, sender, receiver, amount):
+        """Append both sides of a transfer, locking the two snapshots in account order."""
+        if amount <= 0:
+            raise ValueError("Transfer amount must be positive")
+        if sender.account_number == receiver.account_number:
+            raise ValueError("Cannot transfer to the same account")
+        db = self.db_manager
+        with db.unit_of_work():
+            states = {number: self.state(number, lock=True)
+                      for number in sorted((sender.account_number, receiver.account_number))}
+            if None in states.values():
+                raise ValueError("Account not found")
+            if states[sender.account_number][0] < amount:
+                raise ValueError("Insufficient balance")
+
+            for customer, transaction_type, delta, counterparty in (
+                    (sender, "Transfer Out", -amount, receiver.account_number),
+                    (receiver, "Transfer In", amount, sender.account_number)):
+                balance = states[customer.account_number][0]
+                credit_score = calculate_credit_score(balance, *db._window_counts(customer.account_number))
+                timestamp, transaction_id = self._append(customer, transaction_type, delta, counterparty)
+                customer.balance = balance + delta
+                customer.credit_score = credit_score
+                self._posted(customer, transaction_type, delta, timestamp, transaction_id, counterparty)
+
+    def _append(self, customer, transaction_type, amount, counterparty):
+        cursor = self.db_manager.cursor
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        cursor.execute("""INSERT INTO transaction_record
+                          (user_id, account_number, transaction_type, counterparty, amount, timestamp)
+                          VALUES (%s, %s, %s, %s, %s, %s)""",
+                       (customer.user_id, customer.account_number, transaction_type, counterparty, amount, timestamp))
+        return timestamp, cursor.lastrowid
+
+    def compact(self, account_number):
+        """Fold an account's tail into its snapshot; returns how many events were folded."""
+        db = self.db_manager
+        with db.unit_of_work():
+            state = self.state(account_number, lock=True)
+            if state is None or state[3] == 0:
+                return 0
+            balance, loan_amount, last_id, tail_length = state
+            credit_score = calculate_credit_score(balance, *db._window_counts(account_number))
+            self._write_snapshot(account_number, last_id, balance, loan_amount)
+            # The customers row keeps a copy for reports and batch jobs, written once
+            # per compaction instead of on every posting
+            db.cursor.execute("""UPDATE customers SET balance = %s, loan_amount = %s, credit_score = %s
+                                 WHERE account_number = %s""", (balance, loan_amount, credit_score, account_number))
+        return tail_length
+
+    def compact_all(self, min_tail=1):
+        """Compact every account whose tail has at least min_tail events; returns (accounts, events)."""
+        db = self.db_manager
+        with db.session():
+            db.conn.commit()  # Start a fresh read view
+            db.cursor.execute("""SELECT s.account_number FROM account_snapshots s
+                                 JOIN transaction_record t
+                                 ON t.account_number = s.account_number AND t.transaction_id > s.last_transaction_id
+                                 GROUP BY s.account_number
+                                 HAVING COUNT(*) >= %s""", (min_tail,))
+            account_numbers = [row[0] for row in db.cursor.fetchall()]
+            events = sum(self.compact(number) for number in account_numbers)
+        return len(account_numbers), events
+
+    def replay(self, account_number):
+        """(balance, loan_amount, last_transaction_id) recomputed from the snapshot's base and
+        every ledger row after it, ignoring the snapshot itself; None for unknown accounts."""
+        cursor = self.db_manager.cursor
+        cursor.execute("""SELECT base_transaction_id, base_balance, base_loan_amount FROM account_snapshots
+                          WHERE account_number = %s""", (account_number,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        base_id, balance, loan_amount = row
+        cursor.execute("""SELECT transaction_type, amount, transaction_id FROM transaction_record
+                          WHERE account_number = %s AND transaction_id > %s
+                          ORDER BY transaction_id""", (account_number, base_id))
+        last_id = base_id
+        for transaction_type, amount, transaction_id in cursor.fetchall():
+            balance += amount
+            if transaction_type in LOAN_TYPES:
+                loan_amount += amount
+            last_id = transaction_id
+        return Money(balance), Money(loan_amount), last_id
+
+    def verify(self, account_numbers=None):
+        """Accounts whose snapshot plus tail disagrees with a full replay, as
+        {account_number: ((balance, loan_amount) from the snapshot, (balance, loan_amount) replayed)}."""
+        db = self.db_manager
+        mismatches = {}
+        with db.session():
+            db.conn.commit()
+            if account_numbers is None:
+                db.cursor.execute("SELECT account_number FROM account_snapshots")
+                account_numbers = [row[0] for row in db.cursor.fetchall()]
+            for number in account_numbers:
+                with db.unit_of_work():
+                    # Under the account's lock, so no posting lands between the two reads
+                    state = self.state(number, lock=True)
+                    replayed = self.replay(number)
+                if state is None or replayed is None:
+                    mismatches[number] = (state and state[:2], replayed and replayed[:2])
+                elif state[:2] != replayed[:2]:
+                    mismatches[number] = (state[:2], replayed[:2])
+        return mismatches
+
+    def rebuild(self, account_number):
+        """Replace an account's snapshot with a full replay from its base; returns the new
+        (balance, loan_amount), or None for unknown accounts."""
+        db = self.db_manager
+        with db.unit_of_work():
+            if self.state(account_number, lock=True) is None:
+                return None
+            balance, loan_amount, last_id = self.replay(account_number)
+            self._write_snapshot(account_number, last_id, balance, loan_amount)
+            db.cursor.execute("UPDATE customers SET balance = %s, loan_amount = %s WHERE account_number = %s",
+                              (balance, loan_amount, account_number))
+        return balance, loan_amount
+
+    def _write_snapshot(self, account_number, last_id, balance, loan_amount):
+        self.db_manager.cursor.execute("""UPDATE account_snapshots
+                                          SET last_transaction_id = %s, balance = %s, loan_amount = %s, taken_at = %s
+                                          WHERE account_number = %s""",
+                                       (last_id, balance, loan_amount,
+                                        datetime.now().strftime("%Y-%m-%d %H:%M:%S"), account_number))
+
+class LedgerCompactor:
+    """Background thread that folds long ledger tails into account snapshots.
+
+    Every `interval` seconds each account with at least `min_tail` events past its
+    snapshot is compacted, which keeps balance reads short without touching the posting
+    path. Needs a pooled DatabaseManager, so it works on its own connection.
+    """
+
+    def __init__(self, ledger, interval=60.0, min_tail=100):
+        self.ledger = ledger
+        self.interval = interval
+        self.min_tail = min_tail
+        self.stats = {"runs": 0, "accounts": 0, "events": 0}
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="ledger-compactor", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                accounts, events = self.ledger.compact_all(self.min_tail)
+                self.stats["runs"] += 1
+                self.stats["accounts"] += accounts
+                self.stats["events"] += events
+            except Exception as e:
+                print(f"❌ Ledger compaction failed: {e}")
+
+    def close(self):
+        self._stop_event.set()
+        self._thread.join()
+
+class GroupCommitter:
+    """Collect postings for a few milliseconds and commit them in one transaction.
+
+    Needs a pooled DatabaseManager: the committer thread works on its own connection.
+    If a group fails to commit, the Customer objects its operations touched are put
+    back to their state before the group.
+    """
+
+    def __init__(self, db_manager, window_ms=5, max_batch=200):
+        if db_manager.pool is None:
+            raise ValueError("GroupCommitter needs a pooled DatabaseManager (pool_max)")
+        self.db_manager = db_manager
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+        self._thread.start()
+
+    def submit(self, operation, *args, **kwargs):
+        """Queue operation(*args, **kwargs) for the next group and return its Future.
+
+        The future resolves only after the group has committed, with the operation's
+        own return value or exception.
+        """
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("GroupCommitter is closed")
+            self._queue.put((operation, args, kwargs, future))
+        return future
+
+    @staticmethod
+    def _customers(operation, args, kwargs):
+        candidates = (getattr(operation, "__self__", None),) + args + tuple(kwargs.values())
+        return [candidate for candidate in candidates if isinstance(candidate, Customer)]
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            job = self._queue.get()
+            if job is None:
+                break
+            batch = [job]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    job = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+            self._flush(batch)
+
+    def _flush(self, batch):
+        results = []
+        saved = [(customer, customer.balance, customer.credit_score, customer.loan_amount)
+                 for operation, args, kwargs, _ in batch
+                 for customer in self._customers(operation, args, kwargs)]
+        try:
+            with self.db_manager.unit_of_work():
+                for operation, args, kwargs, future in batch:
+                    # Each posting gets its own savepoint so one failure does not sink the group
+                    try:
+                        with self.db_manager.unit_of_work():
+                            value = operation(*args, **kwargs)
+                        results.append((future, value, None))
+                    except Exception as e:
+                        results.append((future, None, e))
+        except Exception as e:
+            print(f"❌ Group commit failed: {e}")
+            # The operations already applied their postings to these objects; the earliest
+            # saved state of each customer is the one from before the group
+            for customer, balance, credit_score, loan_amount in reversed(saved):
+                customer.balance, customer.credit_score, customer.loan_amount = balance, credit_score, loan_amount
+            for _, _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        for future, value, error in results:
+            if error is None:
+                future.set_result(value)
+            else:
+                future.set_exception(error)
+
+    def close(self):
+        """Flush everything queued so far and stop the committer thread."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+
+class CacheEntry:
+    """One cached customer; read like the dict it replaces (entry["balance"])."""
+    __slots__ = ("username", "balance", "credit_score", "loan_amount", "email", "address",
+                 "last_updated", "size")
+    FIELDS = ("username", "balance", "credit_score", "loan_amount", "email", "address", "last_updated")
+
+    def __init__(self, username, balance, credit_score, loan_amount, email, address, last_updated):
+        self.username = username
+        self.balance = balance
+        self.credit_score = credit_score
+        self.loan_amount = loan_amount
+        self.email = email
+        self.address = address
+        self.last_updated = last_updated
+        # Approximate footprint, used for the byte budget
+        self.size = sys.getsizeof(self) + sum(sys.getsizeof(getattr(self, f)) for f in self.FIELDS)
+
+    @classmethod
+    def from_dict(cls, data):
+        entry = cls(*(data.get(field) for field in cls.FIELDS[:-1]), data.get("last_updated", 0))
+        # Amounts are strings in JSON ("5000.00"); older files hold floats
+        entry.balance = Money.of(entry.balance) if entry.balance is not None else Money.ZERO
+        entry.loan_amount = Money.of(entry.loan_amount) if entry.loan_amount is not None else Money.ZERO
+        return entry
+
+    def as_dict(self):
+        data = {field: getattr(self, field) for field in self.FIELDS}
+        data["balance"], data["loan_amount"] = str(self.balance), str(self.loan_amount)
+        return data
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.FIELDS else default
+
+class CustomerCache:
+    """Customer entries with LRU eviction, TTL expiry and hit/miss/eviction counters."""
+
+    def __init__(self, max_entries=100000, max_bytes=None, ttl=1800):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # account_number -> CacheEntry, least recently used first
+        self._expiry = deque()  # (expires_at, account_number, entry) in write order
+        self.bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "snapshot_hits": 0}
+
+    def __contains__(self, account_number):
+        return account_number in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, account_number, now=None):
+        dropped = self.expire(now)
+        entry = self._entries.get(account_number)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None, dropped
+        self._entries.move_to_end(account_number)
+        self.stats["hits"] += 1
+        return entry, dropped
+
+    def put(self, account_number, entry, now=None):
+        """Insert or replace an entry; returns the account numbers dropped to make room."""
+        old = self._entries.pop(account_number, None)
+        if old is not None:
+            self.bytes -= old.size
+        self._entries[account_number] = entry
+        self.bytes += entry.size
+        self._expiry.append((entry.last_updated + self.ttl, account_number, entry))
+
+        dropped = self.expire(now)
+        while self._entries and (len(self._entries) > self.max_entries or
+                                 (self.max_bytes and self.bytes > self.max_bytes)):
+            victim, victim_entry = self._entries.popitem(last=False)
+            self.bytes -= victim_entry.size
+            self.stats["evictions"] += 1
+            dropped.append(victim)
+        return dropped
+
+    def pop(self, account_number):
+        entry = self._entries.pop(account_number, None)
+        if entry is not None:
+            self.bytes -= entry.size
+        return entry
+
+    def expire(self, now=None):
+        """Drop entries older than the TTL, oldest write first; returns their account numbers."""
+        now = now if now else time.time()
+        dropped = []
+        while self._expiry and self._expiry[0][0] <= now:
+            _, account_number, entry = self._expiry.popleft()
+            # Stale queue records for entries that were rewritten or removed are skipped
+            if self._entries.get(account_number) is entry:
+                self.pop(account_number)
+                self.stats["expirations"] += 1
+                dropped.append(account_number)
+        # Rewritten entries leave records behind; rebuild once they dominate the queue
+        if len(self._expiry) > 2 * len(self._entries) + 1024:
+            self._expiry = deque(r for r in self._expiry if self._entries.get(r[1]) is r[2])
+        return dropped
+
+    def items(self):
+        return list(self._entries.items())
+
+class SharedCustomerCache:
+    """Customer entries in a memory-mapped file shared by every process that opens it.
+
+    The file is an open-addressed hash table (linear probing on the account number's
+    CRC32) of fixed-size records, so all processes see one copy of each entry. Readers
+    take no locks: every record carries a sequence number that writers make odd while
+    they write, and a reader retries until it sees the same even number before and after
+    copying the record. Writers serialize on fcntl byte-range locks, the record's own
+    range for updates and the header's for inserts and removals, which change what
+    probes find. Those locks are per process; CacheManager's lock orders its threads.
+
+    A reader gives up after READ_RETRIES tries and treats the lookup as a miss, so a
+    writer that died mid-record sends callers to the database instead of spinning them
+    forever; the next writer that needs the record takes its lock and repairs it.
+
+    Expired records are skipped by lookups and reused by inserts. Once max_entries is
+    reached, an insert first turns every expired record into a tombstone (at most once
+    per RECLAIM_INTERVAL); there is no LRU, a table full of live entries just stops
+    taking new accounts.
+    """
+
+    MAGIC = b"BKSC"
+    VERSION = 2
+    HEADER = struct.Struct("<4sHHII")  # magic, version, record size, capacity, used slots
+    HEADER_SIZE = 64
+    SEQ = struct.Struct("<I")
+    # state, account_number, balance, credit_score, loan_amount, last_updated, username, email, address
+    BODY = struct.Struct("<B3x16sqi4xqd64s96s128s")  # Amounts in paise
+    RECORD_SIZE = SEQ.size + BODY.size
+    EMPTY, USED, DELETED = 0, 1, 2
+    READ_RETRIES = 1000  # A live writer holds a record for microseconds
+    RECLAIM_INTERVAL = 1.0
+
+    def __init__(self, path, capacity=200000, max_entries=100000, ttl=1800):
+        if fcntl is None:
+            raise RuntimeError("The shared cache needs fcntl (POSIX)")
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "full": 0, "contended": 0}
+        self._reclaimed_at = 0.0
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._lock_range(0, self.HEADER_SIZE)
+        try:
+            if os.fstat(self._fd).st_size == 0:
+                # Sparse file: pages are only allocated once a record lands in them
+                os.ftruncate(self._fd, self.HEADER_SIZE + capacity * self.RECORD_SIZE)
+                os.pwrite(self._fd, self.HEADER.pack(self.MAGIC, self.VERSION, self.RECORD_SIZE, capacity, 0), 0)
+            magic, version, record_size, capacity, _ = self.HEADER.unpack(os.pread(self._fd, self.HEADER.size, 0))
+            if magic != self.MAGIC or version != self.VERSION or record_size != self.RECORD_SIZE:
+                raise ValueError(f"{path} is not a version {self.VERSION} shared cache file")
+        finally:
+            self._unlock_range(0, self.HEADER_SIZE)
+        self.capacity = capacity
+        self.bytes = self.HEADER_SIZE + capacity * self.RECORD_SIZE
+        self._map = mmap.mmap(self._fd, self.bytes)
+
+    def _lock_range(self, start, length):
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, length, start, os.SEEK_SET)
+
+    def _unlock_range(self, start, length):
+        fcntl.lockf(self._fd, fcntl.LOCK_UN, length, start, os.SEEK_SET)
+
+    @contextmanager
+    def _locked(self, start, length):
+        self._lock_range(start, length)
+        try:
+            yield
+        finally:
+            self._unlock_range(start, length)
+
+    def _offset(self, slot):
+        return self.HEADER_SIZE + slot * self.RECORD_SIZE
+
+    def _read(self, slot):
+        """Consistent copy of a record's body, or None if it stayed mid-write for READ_RETRIES tries."""
+        offset = self._offset(slot)
+        for _ in range(self.READ_RETRIES):
+            seq = self.SEQ.unpack_from(self._map, offset)[0]
+            if seq & 1:
+                time.sleep(0)
+                continue
+            body = self.BODY.unpack_from(self._map, offset + self.SEQ.size)
+            if self.SEQ.unpack_from(self._map, offset)[0] == seq:
+                return body
+        self.stats["contended"] += 1
+        return None
+
+    def _settle(self, slot):
+        """Read a record a writer died in the middle of, leaving a tombstone in its place.
+
+        Caller holds the header lock; the record's lock is free once its writer is gone.
+        """
+        with self._locked(self._offset(slot), self.RECORD_SIZE):
+            body = self._read(slot)
+            if body is not None:
+                return body  # A live writer finished after all
+            body = self.BODY.unpack_from(self._map, self._offset(slot) + self.SEQ.size)
+            # Half written, so no account can trust it; an update in place was still counted
+            if body[0] == self.USED:
+                self._adjust_count(-1)
+            body = (self.DELETED,) + body[1:]
+            self._write(slot, body)
+        return body
+
+    def _write(self, slot, body):
+        # Caller holds the record's lock; odd sequence number while the body is in flux
+        offset = self._offset(slot)
+        seq = self.SEQ.unpack_from(self._map, offset)[0] | 1  # Also odd if a dead writer left it so
+        self.SEQ.pack_into(self._map, offset, seq)
+        self.BODY.pack_into(self._map, offset + self.SEQ.size, *body)
+        self.SEQ.pack_into(self._map, offset, seq + 1)
+
+    def _probe(self, key, settle=False):
+        """Yield (slot, body) along key's probe sequence until an empty slot.
+
+        A record that cannot be read ends the probe early, unless `settle` (header lock
+        held) repairs it first.
+        """
+        slot = zlib.crc32(key) % self.capacity
+        for _ in range(self.capacity):
+            body = self._read(slot)
+            if body is None:
+                if not settle:
+                    return
+                body = self._settle(slot)
+            if body[0] == self.EMPTY:
+                return
+            yield slot, body
+            slot = (slot + 1) % self.capacity
+
+    def _find(self, key, settle=False):
+        for slot, body in self._probe(key, settle):
+            if body[0] == self.USED and body[1] == key:
+                return slot, body
+        return None, None
+
+    def _reclaim(self, now):
+        # Caller holds the header lock. Expired records still count toward max_entries
+        # until an insert reuses them, so tombstone them all
+        reclaimed = 0
+        for slot in range(self.capacity):
+            body = self._read(slot)
+            if body is None or body[0] != self.USED or body[5] + self.ttl > now:
+                continue
+            with self._locked(self._offset(slot), self.RECORD_SIZE):
+                if self._read(slot) == body:  # Not refreshed in place meanwhile
+                    self._write(slot, (self.DELETED,) + body[1:])
+                    reclaimed += 1
+        self._adjust_count(-reclaimed)
+        self.stats["expirations"] += reclaimed
+        return reclaimed
+
+    def _adjust_count(self, delta):
+        # Caller holds the header lock
+        used = self.HEADER.unpack_from(self._map, 0)[4]
+        struct.pack_into("<I", self._map, 12, used + delta)
+
+    def __len__(self):
+        return self.HEADER.unpack_from(self._map, 0)[4]
+
+    def __contains__(self, account_number):
+        return self._find(self._key(account_number))[0] is not None
+
+    @staticmethod
+    def _key(account_number):
+        return str(account_number).encode().ljust(16, b"\0")[:16]
+
+    @staticmethod
+    def _text(value, size):
+        # Truncated on a character boundary to fit the record
+        return (value or "").encode()[:size].decode(errors="ignore").encode()
+
+    def _body(self, key, entry):
+        return (self.USED, key, entry.balance.paise, int(entry.credit_score), entry.loan_amount.paise,
+                float(entry.last_updated), self._text(entry.username, 64), self._text(entry.email, 96),
+                self._text(entry.address, 128))
+
+    @staticmethod
+    def _entry(body):
+        _, _, balance, credit_score, loan_amount, last_updated, username, email, address = body
+        return CacheEntry(username.rstrip(b"\0").decode(), Money(balance), credit_score, Money(loan_amount),
+                          email.rstrip(b"\0").decode(), address.rstrip(b"\0").decode(), last_updated)
+
+    def get(self, account_number, now=None):
+        now = now if now else time.time()
+        _, body = self._find(self._key(account_number))
+        if body is None or body[5] + self.ttl <= now:
+            self.stats["misses"] += 1
+            return None, []
+        self.stats["hits"] += 1
+        return self._entry(body), []
+
+    def put(self, account_number, entry, now=None):
+        key = self._key(account_number)
+        body = self._body(key, entry)
+        slot, _ = self._find(key)
+        if slot is not None:
+            with self._locked(self._offset(slot), self.RECORD_SIZE):
+                # Still this account's record once locked: update in place
+                current = self._read(slot)
+                if current is not None and current[:2] == (self.USED, key):
+                    self._write(slot, body)
+                    return []
+        now = now if now else time.time()
+        with self._locked(0, self.HEADER_SIZE):
+            free, replaces, last = None, self.EMPTY, None
+            for slot, current in self._probe(key, settle=True):
+                if current[0] == self.USED and current[1] == key:
+                    with self._locked(self._offset(slot), self.RECORD_SIZE):
+                        self._write(slot, body)
+                    return []
+                # Tombstones and other accounts' expired records are reused
+                if free is None and (current[0] == self.DELETED or current[5] + self.ttl <= now):
+                    free, replaces = slot, current[0]
+                last = slot
+            if free is None:
+                free = (last + 1) % self.capacity if last is not None else zlib.crc32(key) % self.capacity
+                if last is not None and self._read(free)[0] != self.EMPTY:
+                    self.stats["full"] += 1  # Probed every slot
+                    return []
+            if replaces != self.USED and len(self) >= self.max_entries:
+                if now - self._reclaimed_at >= self.RECLAIM_INTERVAL:
+                    self._reclaimed_at = now
+                    self._reclaim(now)
+                if len(self) >= self.max_entries:
+                    self.stats["full"] += 1
+                    return []
+            with self._locked(self._offset(free), self.RECORD_SIZE):
+                self._write(free, body)
+            if replaces == self.USED:
+                self.stats["expirations"] += 1
+            else:
+                self._adjust_count(1)
+        return []
+
+    def pop(self, account_number):
+        key = self._key(account_number)
+        with self._locked(0, self.HEADER_SIZE):
+            slot, body = self._find(key, settle=True)
+            if slot is None:
+                return None
+            with self._locked(self._offset(slot), self.RECORD_SIZE):
+                # A tombstone, not EMPTY, so probes for accounts further along still find them
+                self._write(slot, (self.DELETED,) + body[1:])
+            self._adjust_count(-1)
+        return self._entry(body)
+
+    def expire(self, now=None):
+        # Expired records are skipped by get and overwritten in place by the next put
+        return []
+
+    def items(self):
+        now = time.time()
+        result = []
+        for slot in range(self.capacity):
+            body = self._read(slot)
+            if body is not None and body[0] == self.USED and body[5] + self.ttl > now:
+                result.append((body[1].rstrip(b"\0").decode(), self._entry(body)))
+        return result
+
+    def close(self):
+        self._map.flush()
+        self._map.close()
+        os.close(self._fd)
+
+class CacheSnapshot:
+    """Read-only view of a binary cache snapshot, mapped into memory and decoded on demand.
+
+    Layout (little-endian), version 2 (amounts in paise):
+        header   magic "BKSN", version, record size, record count, string table
+                 offset and size, save time
+        records  fixed-width, sorted by account number, so the record array is its own
+                 index: lookups binary-search it in place
+        strings  length-prefixed UTF-8, each distinct string stored once; records hold
+                 offsets into this table
+
+    Opening one costs a header read however many accounts it holds.
+    """
+
+    MAGIC = b"BKSN"
+    VERSION = 2
+    HEADER = struct.Struct("<4sHHIQQd")
+    # account_number, balance, credit_score, loan_amount, last_updated, username, email, address
+    RECORD = struct.Struct("<16sqi4xqdIII")  # Amounts in paise
+    LENGTH = struct.Struct("<H")
+    NO_STRING = 0xFFFFFFFF
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < self.HEADER.size:
+            self._map.close()
+            raise ValueError(f"{path} is not a cache snapshot")
+        magic, version, record_size, self.count, self._strings, _, self.saved_at = \
+            self.HEADER.unpack_from(self._map, 0)
+        if magic != self.MAGIC or version != self.VERSION or record_size != self.RECORD.size:
+            self._map.close()
+            raise ValueError(f"{path} is not a version {self.VERSION} cache snapshot")
+
+    @classmethod
+    def open(cls, path):
+        """The snapshot at path, or None if there is none (or it is unreadable)."""
+        try:
+            return cls(path)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    @staticmethod
+    def _key(account_number):
+        return str(account_number).encode().ljust(16, b"\0")[:16]
+
+    def __len__(self):
+        return self.count
+
+    def _record_key(self, index):
+        offset = self.HEADER.size + index * self.RECORD.size
+        return self._map[offset:offset + 16]
+
+    def find(self, account_number):
+        """Record index of an account, or None."""
+        key = self._key(account_number)
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._record_key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low if low < self.count and self._record_key(low) == key else None
+
+    def _string(self, offset):
+        if offset == self.NO_STRING:
+            return None
+        start = self._strings + offset
+        length = self.LENGTH.unpack_from(self._map, start)[0]
+        return self._map[start + 2:start + 2 + length].decode()
+
+    def _entry(self, index):
+        (key, balance, credit_score, loan_amount, last_updated, username, email,
+         address) = self.RECORD.unpack_from(self._map, self.HEADER.size + index * self.RECORD.size)
+        return key.rstrip(b"\0").decode(), CacheEntry(self._string(username), Money(balance), credit_score,
+                                                      Money(loan_amount), self._string(email),
+                                                      self._string(address), last_updated)
+
+    def get(self, account_number):
+        index = self.find(account_number)
+        return self._entry(index)[1] if index is not None else None
+
+    def items(self):
+        return [self._entry(index) for index in range(self.count)]
+
+    def close(self):
+        self._map.close()
+
+    @classmethod
+    def write(cls, path, customers):
+        """Write (account_number, CacheEntry) pairs as a snapshot, replacing path atomically."""
+        customers = sorted(customers, key=lambda item: cls._key(item[0]))
+        strings, table = {}, bytearray()
+
+        def intern(value):
+            if value is None:
+                return cls.NO_STRING
+            offset = strings.get(value)
+            if offset is None:
+                data = value.encode()[:0xFFFF]
+                offset = strings[value] = len(table)
+                table.extend(cls.LENGTH.pack(len(data)))
+                table.extend(data)
+            return offset
+
+        records = bytearray()
+        for acc_num, entry in customers:
+            records.extend(cls.RECORD.pack(cls._key(acc_num), entry.balance.paise,
+                                           int(entry.credit_score or 0), entry.loan_amount.paise,
+                                           float(entry.last_updated or 0), intern(entry.username),
+                                           intern(entry.email), intern(entry.address)))
+        header = cls.HEADER.pack(cls.MAGIC, cls.VERSION, cls.RECORD.size, len(customers),
+                                 cls.HEADER.size + len(records), len(table), time.time())
+        # Write to a temporary file and rename so a crash never leaves a half-written snapshot
+        tmp_file = path + ".tmp"
+        with open(tmp_file, "wb") as file:
+            file.write(header)
+            file.write(records)
+            file.write(table)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_file, path)
+
 class CacheManager:
-    def __init__(self, cache_file="cache.json", max_transactions=10):
+    """Customer entries and recent histories kept in front of the database.
+
+    cache_file is a binary CacheSnapshot. It is mapped, not parsed, at startup, and
+    entries are decoded from it the first time they are looked up; the in-memory LRU holds
+    what was looked up or written since. A legacy JSON cache next to it (cache.json for
+    cache.snap) is imported once if no snapshot exists yet; import_json and export_json
+    convert explicitly.
+    """
+
+    def __init__(self, cache_file="cache.snap", max_transactions=10, write_behind=False,
+                 journal_file=None, flush_max_bytes=1024 * 1024, flush_interval=5.0,
+                 durability="batch", fsync_interval=1.0, max_entries=100000, max_bytes=None,
+                 ttl=1800, shared_file=None, shared_capacity=None):
         self.cache_file = cache_file
-        self.customer_cache = {}  # Dictionary for fast customer lookup
-        self.transaction_history = {}  # Dictionary of deques for each customer
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl  # Entries older than this (30 minutes by default) are dropped
+        self.customer_cache = CustomerCache(max_entries, max_bytes, ttl)  # Bounded LRU for fast customer lookup
+        self.snapshot = None  # CacheSnapshot of cache_file, looked up on LRU misses
+        self._hidden = set()  # Snapshot accounts removed or evicted since it was written
+        # shared_file: customers live in a SharedCustomerCache that every process opening the
+        # same file reads and writes, instead of a per-process dict saved to cache_file
+        self.shared_file = shared_file
+        self.shared_capacity = shared_capacity if shared_capacity else 2 * max_entries
+        if shared_file and write_behind:
+            raise ValueError("A shared cache is written in place; it has no journal")
+        self.transaction_history = {}  # Dictionary of deques for each cached customer
+        self._history_fills = {}  # account_number -> True once a posting lands during a fill
         self.max_transactions = max_transactions
+
+        # Write-behind mode: updates go to an append-only journal and a background
+        # flusher compacts the journal into the snapshot (cache_file)
+        if durability not in ("batch", "interval"):
+            raise ValueError("durability must be 'batch' or 'interval'")
+        self.write_behind = write_behind
+        self.journal_file = journal_file if journal_file else cache_file + ".journal"
+        self.flush_max_bytes = flush_max_bytes
+        self.flush_interval = flush_interval
+        self.durability = durability  # "batch": fsync every append, "interval": fsync every fsync_interval
+        self.fsync_interval = fsync_interval
+        self._lock = threading.RLock()
+        self._journal = None
+        self._journal_bytes = 0
+        self._journal_dirty = False
+        self._last_compaction = time.time()
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        self._flusher = None
+
         self.load_cache()
 
+        if self.write_behind:
+            self._open_journal()
+            self._flusher = threading.Thread(target=self._flush_loop, name="cache-flusher", daemon=True)
+            self._flusher.start()
+
     def load_cache(self):
+        if self.shared_file:
+            self.customer_cache = SharedCustomerCache(self.shared_file, self.shared_capacity,
+                                                      self.max_entries, self.ttl)
+            return
+        self.customer_cache = CustomerCache(self.max_entries, self.max_bytes, self.ttl)
+        self._hidden = set()
+        if self.snapshot:
+            self.snapshot.close()
+        self.snapshot = CacheSnapshot.open(self.cache_file)
+        legacy_file = os.path.splitext(self.cache_file)[0] + ".json"
+        if self.snapshot is None and legacy_file != self.cache_file and os.path.exists(legacy_file):
+            self.import_json(legacy_file)
+
+        if self.write_behind:
+            # Replay journals on top of the snapshot: a rotated journal left behind by an
+            # interrupted compaction first, then the live one
+            rotated = self.journal_file + ".old"
+            replayed_rotated = self._replay_journal(rotated)
+            self._replay_journal(self.journal_file)
+            if replayed_rotated:
+                # Fold the rotated journal into a snapshot before it can be overwritten
+                self._write_snapshot(self._capture())
+                os.remove(rotated)
+
+    def import_json(self, path):
+        """Load a JSON cache ({"customers": {account: fields}}) and save it as the snapshot."""
+        with open(path, "r") as file:
+            data = json.load(file)
+        with self._lock:
+            # Oldest first, so expiry order and LRU order both follow the write times
+            customers = sorted(data.get("customers", {}).items(), key=lambda item: item[1].get("last_updated", 0))
+            for acc_num, entry in customers:
+                self._hidden.discard(acc_num)
+                self._drop_history(self.customer_cache.put(acc_num, CacheEntry.from_dict(entry)))
+            self._write_snapshot(self._capture())
+
+    def export_json(self, path):
+        with self._lock:
+            customers = self._merge(*self._capture())
+        with open(path, "w") as file:
+            json.dump({"customers": {acc: entry.as_dict() for acc, entry in customers},
+                       "last_saved": time.time()}, file, indent=4)
+        return len(customers)
+
+    def _replay_journal(self, path):
         try:
-            with open(self.cache_file, "r") as file:
-                data = json.load(file)
-                self.customer_cache = data.get("customers", {})
-                # Initialize transaction deques
-                for acc_num in self.customer_cache:
-                    self.transaction_history[acc_num] = deque(maxlen=self.max_transactions)
-        except (FileNotFoundError, json.JSONDecodeError):
-            self.customer_cache = {}
+            file = open(path, "r")
+        except FileNotFoundError:
+            return False
+        with file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # Torn write at the tail of the journal, everything after it is lost
+                if record["op"] == "put":
+                    self._hidden.discard(record["acc"])
+                    self._drop_history(self.customer_cache.put(record["acc"], CacheEntry.from_dict(record["data"])))
+                elif record["op"] == "del":
+                    self.customer_cache.pop(record["acc"])
+                    self._hidden.add(record["acc"])
+        return True
 
     def update_cache(self, customer):
         # Update customer data in cache
-        self.customer_cache[customer.account_number] = {
-            "username": customer.username,
-            "balance": float(customer.balance),
-            "credit_score": customer.credit_score,
-            "loan_amount": float(customer.loan_amount),
-            "email": customer.email,
-            "address": customer.address,
-            "last_updated": time.time()
-        }
-        self.save_cache()
+        entry = CacheEntry(
+            username=customer.username,
+            balance=customer.balance,
+            credit_score=customer.credit_score,
+            loan_amount=customer.loan_amount,
+            email=customer.email,
+            address=customer.address,
+            last_updated=time.time()
+        )
+        with self._lock:
+            self._hidden.discard(customer.account_number)
+            self._drop_history(self.customer_cache.put(customer.account_number, entry))
+            if self.write_behind:
+                self._append_journal({"op": "put", "acc": customer.account_number, "data": entry.as_dict()})
+            else:
+                self.save_cache()
 
-    def add_transaction(self, account_number, transaction_type, amount, timestamp):
-        # Initialize deque if not exists
-        if account_number not in self.transaction_history:
-            self.transaction_history[account_number] = deque(maxlen=self.max_transactions)
-        
-        # Add transaction to history
-        self.transaction_history[account_number].appendleft({
-            "type": transaction_type,
-            "amount": float(amount),
-            "timestamp": timestamp
-        })
+    def _drop_history(self, account_numbers):
+        # Evicted and expired customers take their transaction history with them, and
+        # their snapshot record (if any) is stale, so it must not be served either
+        for acc_num in account_numbers:
+            self.transaction_history.pop(acc_num, None)
+            self._hidden.add(acc_num)
+
+    def add_transaction(self, account_number, transaction_type, amount, timestamp, transaction_id=None,
+                        counterparty=None):
+        with self._lock:
+            if account_number in self._history_fills:
+                self._history_fills[account_number] = True  # A fill in flight may have missed this row
+            # Only histories filled from the database are kept; a partial deque would be served as complete
+            if account_number not in self.transaction_history:
+                return
+
+            # Add transaction to history
+            self.transaction_history[account_number].appendleft({
+                "transaction_id": transaction_id,
+                "type": transaction_type,
+                "counterparty": counterparty,
+                "amount": amount,
+                "timestamp": timestamp
+            })
 
     def get_cached_transactions(self, account_number):
         return list(self.transaction_history.get(account_number, deque()))
 
+    def get_history(self, account_number):
+        """Cached history for an account, newest first, or None if it has not been filled."""
+        with self._lock:
+            history = self.transaction_history.get(account_number)
+            return list(history) if history is not None else None
+
+    def begin_history_fill(self, account_number):
+        with self._lock:
+            self._history_fills[account_number] = False
+
+    def fill_history(self, account_number, transactions):
+        """Install history read from the database unless a posting raced the read."""
+        with self._lock:
+            raced = self._history_fills.pop(account_number, True)
+            # Only accounts held in the customer cache keep a history, so it is bounded too.
+            # Histories stay per process, so with a shared cache they would miss other
+            # processes' postings; history is then always read from the database.
+            if raced or self.shared_file or self._lookup(account_number) is None:
+                return
+            history = deque(maxlen=self.max_transactions)
+            history.extend(transactions[:self.max_transactions])
+            self.transaction_history[account_number] = history
+
+    def _lookup(self, account_number):
+        # Caller holds the lock. Expired entries are swept out here, not just skipped
+        data, expired = self.customer_cache.get(account_number)
+        self._drop_history(expired)
+        if data is None and self.snapshot and account_number not in self._hidden:
+            data = self.snapshot.get(account_number)
+            if data is not None and data.last_updated + self.ttl > time.time():
+                # Decoded once, then served from the LRU
+                self.customer_cache.stats["snapshot_hits"] += 1
+                self._drop_history(self.customer_cache.put(account_number, data))
+            else:
+                data = None
+        return data
+
     def get_from_cache(self, account_number):
-        if account_number in self.customer_cache:
-            data = self.customer_cache[account_number]
-            # Check if cache is not too old (30 minutes)
-            if time.time() - data.get("last_updated", 0) < 1800:
-                print("✅ Data retrieved from cache")
-                return data
-        return None
+        with self._lock:
+            data = self._lookup(account_number)
+        if data:
+            print("✅ Data retrieved from cache")
+        return data
+
+    def sweep_expired(self):
+        with self._lock:
+            self._drop_history(self.customer_cache.expire())
+
+    def cache_stats(self):
+        with self._lock:
+            stats = dict(self.customer_cache.stats)
+            lookups = stats["hits"] + stats["misses"]
+            stats.update({
+                "entries": len(self.customer_cache),
+                "snapshot_records": len(self.snapshot) if self.snapshot else 0,
+                "bytes": self.customer_cache.bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                # LRU misses answered from the snapshot are hits too
+                "hit_ratio": (stats["hits"] + stats.get("snapshot_hits", 0)) / lookups if lookups else 0.0
+            })
+            return stats
 
     def save_cache(self):
-        cache_data = {
-            "customers": self.customer_cache,
-            "last_saved": time.time()
-        }
-        with open(self.cache_file, "w") as file:
-            json.dump(cache_data, file, indent=4)
+        if self.shared_file:
+            return  # Every write already landed in the mapped file
+        with self._lock:
+            if self.write_behind:
+                self.compact()
+                return
+            self._write_snapshot(self._capture())
 
     def remove_from_cache(self, account_number):
-        if account_number in self.customer_cache:
-            del self.customer_cache[account_number]
-            if account_number in self.transaction_history:
-                del self.transaction_history[account_number]
-            self.save_cache()
+        with self._lock:
+            if self._lookup(account_number) is not None:
+                self.customer_cache.pop(account_number)
+                self._hidden.add(account_number)
+                if account_number in self.transaction_history:
+                    del self.transaction_history[account_number]
+                if self.write_behind:
+                    self._append_journal({"op": "del", "acc": account_number})
+                else:
+                    self.save_cache()
+
+    def _open_journal(self):
+        self._journal = open(self.journal_file, "a")
+        self._journal_bytes = self._journal.tell()
+
+    def _append_journal(self, record):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        self._journal.write(line)
+        self._journal_bytes += len(line)
+        if self.durability == "batch":
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+        else:
+            self._journal_dirty = True
+        if self._journal_bytes >= self.flush_max_bytes:
+            self._wake_event.set()
+
+    def _capture(self):
+        # Caller holds the lock. Entries are replaced, never mutated, and the snapshot is
+        # only swapped under the lock, so this is a consistent view to merge outside it
+        return self.snapshot, frozenset(self._hidden), self.customer_cache.items()
+
+    def _merge(self, snapshot, hidden, items):
+        """Live (account_number, CacheEntry) pairs: the snapshot's, overridden by the LRU's."""
+        customers = {}
+        if snapshot:
+            customers.update(item for item in snapshot.items() if item[0] not in hidden)
+        customers.update(items)
+        cutoff = time.time() - self.ttl
+        live = [item for item in customers.items() if item[1].last_updated > cutoff]
+        if len(live) > self.max_entries:
+            live = sorted(live, key=lambda item: item[1].last_updated)[-self.max_entries:]
+        return live
+
+    def _write_snapshot(self, captured):
+        snapshot = captured[0]
+        CacheSnapshot.write(self.cache_file, self._merge(*captured))
+        with self._lock:
+            if self.snapshot is not snapshot:
+                return  # Another compaction or a reload swapped it first
+            # Removals still matter only for accounts the new snapshot holds
+            self.snapshot = CacheSnapshot(self.cache_file)
+            self._hidden = {acc_num for acc_num in self._hidden if self.snapshot.find(acc_num) is not None}
+            if snapshot:
+                snapshot.close()
+
+    def compact(self):
+        """Fold the journal into a fresh snapshot and start an empty journal."""
+        rotated = self.journal_file + ".old"
+        with self._lock:
+            if self._journal is None or self._journal_bytes == 0:
+                self._last_compaction = time.time()
+                return
+            # Rotate the journal under the lock
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._journal.close()
+            os.replace(self.journal_file, rotated)
+            self._open_journal()
+            self._journal_dirty = False
+            captured = self._capture()
+            self._last_compaction = time.time()
+        # The O(N) snapshot write happens outside the lock so updates keep flowing
+        self._write_snapshot(captured)
+        os.remove(rotated)
+
+    def _flush_loop(self):
+        wait = self.flush_interval
+        if self.durability == "interval":
+            wait = min(wait, self.fsync_interval)
+        while not self._stop_event.is_set():
+            self._wake_event.wait(wait)
+            self._wake_event.clear()
+            try:
+                self.sweep_expired()
+                with self._lock:
+                    if self._journal_dirty:
+                        self._journal.flush()
+                        os.fsync(self._journal.fileno())
+                        self._journal_dirty = False
+                    due = (self._journal_bytes >= self.flush_max_bytes or
+                           time.time() - self._last_compaction >= self.flush_interval)
+                if due:
+                    self.compact()
+            except Exception as e:
+                print(f"❌ Cache flush failed: {e}")
+
+    def close(self):
+        """Stop the background flusher and write a final snapshot."""
+        if self.shared_file:
+            with self._lock:
+                self.customer_cache.close()
+            return
+        if not self.write_behind or self._journal is None:
+            with self._lock:
+                if self.snapshot:
+                    self.snapshot.close()
+                    self.snapshot = None
+            return
+        self._stop_event.set()
+        self._wake_event.set()
+        self._flusher.join()
+        try:
+            self.compact()
+        except Exception as e:
+            print(f"❌ Cache flush failed: {e}")
+        with self._lock:
+            self._journal.close()
+            self._journal = None
 
 def main():
-    cache_manager = CacheManager()
-    db_manager = DatabaseManager(cache_manager)
+    cache_manager = CacheManager(write_behind=True)
+    db_manager = DatabaseManager(cache_manager, backend=backend_from_env())
+    Customer.hasher = HashingService()
     
     while True:
         print("\n===== Banking System =====")
@@ -653,14 +3374,14 @@ def main():
                             
                         elif op == "2":
                             try:
-                                amount = float(input("Amount: "))
+                                amount = Money.parse(input("Amount: "))
                                 customer.deposit(amount, db_manager, cache_manager)
                             except ValueError:
                                 print("❌ Invalid amount format!")
                             
                         elif op == "3":
                             try:
-                                amount = float(input("Amount: "))
+                                amount = Money.parse(input("Amount: "))
                                 customer.withdraw(amount, db_manager, cache_manager)
                             except ValueError:
                                 print("❌ Invalid amount format!")
@@ -674,7 +3395,7 @@ def main():
                             receiver = db_manager.fetch_customer(receiver_acc)
                             if receiver:
                                 try:
-                                    amount = float(input("Amount: "))
+                                    amount = Money.parse(input("Amount: "))
                                     customer.transfer_money(receiver, amount, db_manager, cache_manager)
                                 except ValueError:
                                     print("❌ Invalid amount format!")
@@ -683,20 +3404,22 @@ def main():
                                 
                         elif op == "5":
                             try:
-                                amount = float(input("Loan amount: "))
+                                amount = Money.parse(input("Loan amount: "))
                                 customer.take_loan(amount, db_manager, cache_manager)
                             except ValueError:
                                 print("❌ Invalid amount format!")
                             
                         elif op == "6":
                             try:
-                                amount = float(input("Repayment amount: "))
+                                amount = Money.parse(input("Repayment amount: "))
                                 customer.return_loan(amount, db_manager, cache_manager)
                             except ValueError:
                                 print("❌ Invalid amount format!")
                             
                         elif op == "7":
-                            db_manager.fetch_transactions(customer.account_number)
+                            transactions, cursor = db_manager.fetch_transactions(customer.account_number)
+                            while cursor and input("Show older transactions? (y/n): ").strip().lower() == "y":
+                                transactions, cursor = db_manager.fetch_transactions(customer.account_number, before=cursor)
                         else:
                             print("❌ Invalid operation!")
                 else:
@@ -705,6 +3428,8 @@ def main():
             elif choice == "3":
                 print("✅ Thank you for using our banking system. Goodbye!")
                 db_manager.close()
+                cache_manager.close()
+                Customer.hasher.close()
                 break
             else:
                 print("❌ Invalid choice!")
@@ -712,10 +3437,14 @@ def main():
         except KeyboardInterrupt:
             print("\n\n⚠️ Program interrupted by user")
             db_manager.close()
+            cache_manager.close()
+            Customer.hasher.close()
             break
         except Exception as e:
             print(f"❌ System error: {e}")
             db_manager.close()
+            cache_manager.close()
+            Customer.hasher.close()
             break
 
 if __name__ == "__main__":
@@ -0,0 +1,431 @@
+"""Latency histograms, counters and per-operation traces for the banking hot paths.
+
+instrument() wraps a running system without changing its code:
+    - every statement and commit on the DatabaseManager's connections (round trips,
+      latency per statement kind, commit latency, rollbacks),
+    - the DatabaseManager's public methods,
+    - the CacheManager's methods, with hit/miss counters for customer and history lookups,
+    - the Customer operations (latency and ok/rejected counts per operation),
+    - bcrypt hashing and checking (on the HashingService if given, else Customer's own calls).
+
+Metrics are read with MetricsRegistry.snapshot() or exported in the Prometheus text
+format (prometheus_text(), or PrometheusFileExporter for a node_exporter textfile
+directory). With a Tracer, one in every `sample` Customer operations also records a
+trace: the operation's span tree (queries, commits, cache calls, bcrypt) with offsets
+and durations.
+
+    registry, tracer = MetricsRegistry(), Tracer(sample=100)
+    instrument(registry, db_manager, cache_manager, hasher=Customer.hasher, tracer=tracer)
+    ...
+    print(registry.prometheus_text())
+    print(format_trace(tracer.recent()[-1]))
+"""
+import bisect
+import functools
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from Project_DSA import Customer
+
+# Seconds; wide enough for a sqlite point query at the bottom and bcrypt at the top
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+DATABASE_METHODS = ("insert_customer", "fetch_customer", "update_customer", "delete_customer",
+                    "insert_transaction", "fetch_transactions", "authenticate_customer",
+                    "update_credit_score", "check_loan_eligibility", "transfer_funds", "onboard_customers")
+CACHE_METHODS = ("get_from_cache", "update_cache", "add_transaction", "get_history", "fill_history",
+                 "remove_from_cache", "save_cache", "compact", "sweep_expired")
+CUSTOMER_OPERATIONS = ("deposit", "withdraw", "transfer_money", "take_loan", "return_loan")
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram, as Prometheus expects them."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, fraction):
+        """Upper bound of the bucket holding the given quantile (None if empty)."""
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if total == 0:
+            return None
+        rank, seen = fraction * total, 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class MetricsRegistry:
+    """Named metric families, each keyed by a tuple of label values."""
+
+    def __init__(self):
+        self.families = {}  # name -> {"kind", "help", "labels", "series": {label values: metric}}
+        self._lock = threading.Lock()
+
+    def _series(self, kind, name, help_text, labels, values):
+        family = self.families.get(name)
+        if family is None:
+            with self._lock:
+                family = self.families.setdefault(name, {"kind": kind, "help": help_text, "labels": labels,
+                                                         "series": {}})
+        metric = family["series"].get(values)
+        if metric is None:
+            with self._lock:
+                metric = family["series"].setdefault(values, Counter() if kind == "counter" else Histogram())
+        return metric
+
+    def counter(self, name, help_text, labels=(), values=()):
+        return self._series("counter", name, help_text, labels, values)
+
+    def histogram(self, name, help_text, labels=(), values=()):
+        return self._series("histogram", name, help_text, labels, values)
+
+    def snapshot(self):
+        """Plain-dict copy of every metric, for in-process inspection."""
+        result = {}
+        for name, family in list(self.families.items()):
+            series = {}
+            for values, metric in list(family["series"].items()):
+                key = ",".join(f"{label}={value}" for label, value in zip(family["labels"], values))
+                if family["kind"] == "counter":
+                    series[key] = metric.value
+                else:
+                    series[key] = {"count": metric.count, "sum": metric.sum,
+                                   "p50": metric.quantile(0.50), "p95": metric.quantile(0.95),
+                                   "p99": metric.quantile(0.99)}
+            result[name] = series
+        return result
+
+    def prometheus_text(self):
+        lines = []
+        for name, family in sorted(self.families.items()):
+            lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['kind']}")
+            for values, metric in sorted(family["series"].items()):
+                pairs = [f'{label}="{value}"' for label, value in zip(family["labels"], values)]
+                if family["kind"] == "counter":
+                    lines.append(f"{name}{format_labels(pairs)} {metric.value}")
+                    continue
+                with metric._lock:
+                    counts, total, count = list(metric.counts), metric.sum, metric.count
+                cumulative = 0
+                for bound, bucket_count in zip(metric.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                    lines.append(f"{name}_bucket{format_labels(pairs + [le])} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(pairs)} {total}")
+                lines.append(f"{name}_count{format_labels(pairs)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        # Written aside and renamed, so a scraper never reads half a file
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as file:
+            file.write(self.prometheus_text())
+        os.replace(temp_path, path)
+
+
+def format_labels(pairs):
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class PrometheusFileExporter:
+    """Rewrites a Prometheus text file every `interval` seconds until closed."""
+
+    def __init__(self, registry, path, interval=15.0):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-exporter", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.registry.write_prometheus(self.path)
+
+    def close(self):
+        self._stop_event.set()
+        self._thread.join()
+        self.registry.write_prometheus(self.path)
+
+
+class Tracer:
+    """Samples whole operations and records the spans that ran inside them."""
+
+    def __init__(self, sample=1, keep=100):
+        self.sample = sample  # Trace one in every `sample` operations
+        self.traces = deque(maxlen=keep)
+        self._local = threading.local()
+
+    def start(self, name):
+        """Begin a trace on this thread if it is sampled; returns the trace or None."""
+        if getattr(self._local, "trace", None) is not None or random.randrange(self.sample) != 0:
+            return None
+        trace = {"name": name, "start": time.perf_counter(), "duration": None, "spans": []}
+        self._local.trace = trace
+        self._local.depth = 0
+        return trace
+
+    def finish(self, trace, status):
+        trace["duration"] = time.perf_counter() - trace["start"]
+        trace["status"] = status
+        self._local.trace = None
+        self.traces.append(trace)
+
+    def active(self):
+        return getattr(self._local, "trace", None)
+
+    def enter(self):
+        self._local.depth += 1
+        return self._local.depth
+
+    def leave(self, trace, name, depth, start, duration):
+        self._local.depth -= 1
+        trace["spans"].append({"name": name, "depth": depth, "offset": start - trace["start"],
+                               "duration": duration})
+
+    def recent(self):
+        return list(self.traces)
+
+
+def format_trace(trace):
+    """Indented span tree of one trace, in start order, durations in milliseconds."""
+    lines = [f"{trace['name']} {trace['duration'] * 1000:.3f} ms ({trace['status']})"]
+    for span in sorted(trace["spans"], key=lambda span: span["offset"]):
+        lines.append(f"{'  ' * span['depth']}{span['name']} +{span['offset'] * 1000:.3f} ms "
+                     f"{span['duration'] * 1000:.3f} ms")
+    return "\n".join(lines)
+
+
+def timed(function, histogram, span_name, tracer=None):
+    """Wrap function so each call is observed in histogram and, while tracing, as a span."""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        trace = tracer.active() if tracer else None
+        depth = tracer.enter() if trace else 0
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            duration = time.perf_counter() - start
+            histogram.observe(duration)
+            if trace:
+                tracer.leave(trace, span_name, depth, start, duration)
+    return wrapper
+
+
+class InstrumentedCursor:
+    """Times every statement; one execute or executemany is one round trip."""
+
+    def __init__(self, cursor, registry, tracer):
+        self._cursor = cursor
+        self._registry = registry
+        self._tracer = tracer
+
+    def _timed(self, method, query, params):
+        words = query.split(None, 1)
+        verb = words[0].upper() if words else "OTHER"
+        trace = self._tracer.active() if self._tracer else None
+        depth = self._tracer.enter() if trace else 0
+        start = time.perf_counter()
+        try:
+            return method(query, params)
+        finally:
+            duration = time.perf_counter() - start
+            self._registry.counter("bank_db_round_trips_total", "Statements sent to the database",
+                                   ("statement",), (verb,)).inc()
+            self._registry.histogram("bank_db_query_seconds", "Statement latency",
+                                     ("statement",), (verb,)).observe(duration)
+            if trace:
+                self._tracer.leave(trace, f"db.{verb.lower()}", depth, start, duration)
+
+    def execute(self, query, params=None):
+        return self._timed(self._cursor.execute, query, params)
+
+    def executemany(self, query, params):
+        return self._timed(self._cursor.executemany, query, params)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    def __init__(self, conn, registry, tracer):
+        self._conn = conn
+        self._registry = registry
+        self._tracer = tracer
+        self.commit = timed(conn.commit, registry.histogram("bank_db_commit_seconds", "Commit latency"),
+                            "db.commit", tracer)
+
+    def cursor(self, *args):
+        return InstrumentedCursor(self._conn.cursor(*args), self._registry, self._tracer)
+
+    def rollback(self):
+        self._registry.counter("bank_db_rollbacks_total", "Transactions rolled back").inc()
+        return self._conn.rollback()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class InstrumentedBackend:
+    """Backend whose connections come back instrumented; everything else is delegated."""
+
+    def __init__(self, backend, registry, tracer):
+        self._backend = backend
+        self._registry = registry
+        self._tracer = tracer
+
+    def connect(self):
+        return InstrumentedConnection(self._backend.connect(), self._registry, self._tracer)
+
+    def __getattr__(self, name):
+        return getattr(self._backend, name)
+
+
+def instrument_database(db_manager, registry, tracer=None):
+    if isinstance(db_manager.backend, InstrumentedBackend):
+        return
+    db_manager.backend = InstrumentedBackend(db_manager.backend, registry, tracer)
+    # Connections opened before now are wrapped in place
+    if db_manager.pool is None:
+        db_manager._conn = InstrumentedConnection(db_manager._conn, registry, tracer)
+        db_manager._cursor = db_manager._conn.cursor()
+    else:
+        with db_manager.pool._cond:
+            db_manager.pool._idle = deque((InstrumentedConnection(conn, registry, tracer), last_used)
+                                          for conn, last_used in db_manager.pool._idle)
+    for name in DATABASE_METHODS:
+        histogram = registry.histogram("bank_db_method_seconds", "DatabaseManager method latency",
+                                       ("method",), (name,))
+        setattr(db_manager, name, timed(getattr(db_manager, name), histogram, f"db_manager.{name}", tracer))
+
+
+def instrument_cache(cache_manager, registry, tracer=None):
+    for name in CACHE_METHODS:
+        histogram = registry.histogram("bank_cache_call_seconds", "CacheManager method latency",
+                                       ("method",), (name,))
+        setattr(cache_manager, name, timed(getattr(cache_manager, name), histogram, f"cache.{name}", tracer))
+
+    # Hit ratio = hits / (hits + misses) per lookup kind
+    def counting(function, kind):
+        hits = registry.counter("bank_cache_lookups_total", "Cache lookups", ("kind", "result"), (kind, "hit"))
+        misses = registry.counter("bank_cache_lookups_total", "Cache lookups", ("kind", "result"), (kind, "miss"))
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            result = function(*args, **kwargs)
+            (misses if result is None else hits).inc()
+            return result
+        return wrapper
+
+    cache_manager.get_from_cache = counting(cache_manager.get_from_cache, "customer")
+    cache_manager.get_history = counting(cache_manager.get_history, "history")
+
+
+def instrument_hasher(hasher, registry, tracer=None):
+    hash_histogram = registry.histogram("bank_bcrypt_seconds", "bcrypt time", ("op",), ("hash",))
+    hasher.check = timed(hasher.check, registry.histogram("bank_bcrypt_seconds", "bcrypt time", ("op",),
+                                                          ("check",)), "bcrypt.check", tracer)
+    submit = hasher.hash_async
+
+    @functools.wraps(submit)
+    def hash_async(secret):
+        # Measured to completion on the pool, queueing included
+        start = time.perf_counter()
+        future = submit(secret)
+        future.add_done_callback(lambda _: hash_histogram.observe(time.perf_counter() - start))
+        return future
+
+    hasher.hash_async = hash_async
+
+
+def instrument_inline_bcrypt(registry, tracer=None):
+    """Time Customer's own bcrypt calls, for processes that hash without a HashingService."""
+    for name, op in (("encrypt_password", "hash"), ("verify_password", "check")):
+        function = Customer.__dict__[name].__func__
+        if getattr(function, "_instrumented", False):
+            continue
+        histogram = registry.histogram("bank_bcrypt_seconds", "bcrypt time", ("op",), (op,))
+        wrapper = timed(function, histogram, f"bcrypt.{op}", tracer)
+        wrapper._instrumented = True
+        setattr(Customer, name, staticmethod(wrapper))
+
+
+def instrument_customer_operations(registry, tracer=None):
+    """Wrap the Customer operations (class-wide) with latency, outcome counters and traces."""
+    for name in CUSTOMER_OPERATIONS:
+        function = getattr(Customer, name)
+        if getattr(function, "_instrumented", False):
+            continue
+        setattr(Customer, name, operation_wrapper(function, name, registry, tracer))
+
+
+def operation_wrapper(function, name, registry, tracer):
+    histogram = registry.histogram("bank_operation_seconds", "Customer operation latency",
+                                   ("operation",), (name,))
+    outcomes = {result: registry.counter("bank_operations_total", "Customer operations",
+                                         ("operation", "result"), (name, result))
+                for result in ("ok", "rejected")}
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        trace = tracer.start(f"customer.{name}") if tracer else None
+        start = time.perf_counter()
+        ok = False
+        try:
+            ok = function(*args, **kwargs)
+            return ok
+        finally:
+            histogram.observe(time.perf_counter() - start)
+            outcomes["ok" if ok else "rejected"].inc()
+            if trace:
+                tracer.finish(trace, "ok" if ok else "rejected")
+
+    wrapper._instrumented = True
+    return wrapper
+
+
+def instrument(registry, db_manager=None, cache_manager=None, hasher=None, tracer=None):
+    """Instrument whichever parts of a running system are given (Customer operations always)."""
+    if db_manager is not None:
+        instrument_database(db_manager, registry, tracer)
+    if cache_manager is not None:
+        instrument_cache(cache_manager, registry, tracer)
+    if hasher is not None:
+        instrument_hasher(hasher, registry, tracer)
+    else:
+        instrument_inline_bcrypt(registry, tracer)
+    instrument_customer_operations(registry, tracer)
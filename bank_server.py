@@ -0,0 +1,296 @@
+"""asyncio front end serving the banking operations over a local socket.
+
+Clients send one JSON request per line and get one JSON response per line:
+    {"id": 1, "op": "login", "email": "a@b.c", "password": "secret"}
+    {"id": 2, "op": "deposit", "amount": "2500"}
+    {"id": 3, "op": "transfer", "to_account": "9292010469", "amount": 100}
+    {"id": 4, "op": "history", "before": ["2025-04-18 10:26:17", 42]}
+
+Ops: login, resume, logout, balance, deposit, withdraw, transfer, take_loan, return_loan,
+history. login returns a signed session token; {"op": "resume", "token": ...} rebinds
+that session on a new connection without bcrypt. The account is only reloaded from the
+database if no open session holds it any more.
+Blocking database work runs on a thread pool sized to the connection pool, and bcrypt
+runs on a process pool.
+Operations on one account are serialized by a per-account lock. Back-pressure comes from
+a cap on in-flight jobs and a cap on open sessions.
+
+With --metrics-file, latency histograms and counters (see bank_metrics.py) are rewritten
+to that Prometheus text file every few seconds; --trace-sample N also traces one in every
+N operations, printed on shutdown.
+
+Usage: python bank_server.py [--host 127.0.0.1] [--port 8765] [--unix PATH] [--workers 16]
+                             [--metrics-file bank.prom] [--trace-sample 1000]
+"""
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from bank_metrics import MetricsRegistry, PrometheusFileExporter, Tracer, format_trace, instrument
+from Project_DSA import CacheManager, Customer, DatabaseManager, HashingService, Money, SessionStore, backend_from_env
+
+MONEY_OPS = ("deposit", "withdraw", "take_loan", "return_loan")
+
+
+class RequestError(Exception):
+    """A request the server refuses; reported back to the client, not logged."""
+
+
+class AccountLocks:
+    """asyncio locks keyed by account number, dropped once nobody holds or waits on them."""
+
+    def __init__(self):
+        self._locks = {}  # account_number -> [lock, users]
+
+    async def acquire(self, *account_numbers):
+        # Deterministic order so two transfers in opposite directions cannot deadlock
+        ordered = sorted(set(account_numbers))
+        for number in ordered:
+            entry = self._locks.setdefault(number, [asyncio.Lock(), 0])
+            entry[1] += 1
+            await entry[0].acquire()
+        return ordered
+
+    def release(self, ordered):
+        for number in reversed(ordered):
+            entry = self._locks[number]
+            entry[0].release()
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[number]
+
+
+class BankServer:
+    def __init__(self, workers=16, max_inflight=None, max_sessions=10000, hash_workers=None,
+                 metrics_file=None, trace_sample=None):
+        Customer.hasher = HashingService(hash_workers)
+        self.session_store = SessionStore()
+        self.cache_manager = CacheManager(write_behind=True)
+        self.db_manager = DatabaseManager(self.cache_manager, pool_min=1, pool_max=workers,
+                                          backend=backend_from_env())
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bank-worker")
+        self.inflight = asyncio.Semaphore(max_inflight if max_inflight else workers * 4)
+        self.max_sessions = max_sessions
+        self.sessions = 0
+        self.locks = AccountLocks()
+        self.accounts = {}  # account_number -> [Customer shared by its sessions, open sessions]
+        self.exporter, self.tracer = None, None
+        if metrics_file:
+            registry = MetricsRegistry()
+            self.tracer = Tracer(sample=trace_sample) if trace_sample else None
+            instrument(registry, self.db_manager, self.cache_manager, Customer.hasher, self.tracer)
+            self.exporter = PrometheusFileExporter(registry, metrics_file)
+
+    async def run_blocking(self, function, *args):
+        # Waiting on the semaphore is the back-pressure: requests queue here, not in the pool
+        async with self.inflight:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def handle_client(self, reader, writer):
+        if self.sessions >= self.max_sessions:
+            writer.write(b'{"ok": false, "error": "Server busy"}\n')
+            await writer.drain()
+            writer.close()
+            return
+        self.sessions += 1
+        session = {"customer": None, "token": None}
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = await self.handle_line(session, line)
+                writer.write((json.dumps(response, default=str) + "\n").encode())
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.sessions -= 1
+            self.unbind(session)
+            writer.close()
+
+    async def handle_line(self, session, line):
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise RequestError("Request must be a JSON object")
+            request_id = request.get("id")
+            result = await self.dispatch(session, request)
+            return {"id": request_id, "ok": True, "result": result}
+        except json.JSONDecodeError:
+            return {"id": request_id, "ok": False, "error": "Invalid JSON"}
+        except RequestError as e:
+            return {"id": request_id, "ok": False, "error": str(e)}
+        except Exception as e:
+            print(f"❌ Request failed: {e}")
+            return {"id": request_id, "ok": False, "error": "Internal error"}
+
+    async def dispatch(self, session, request):
+        op = request.get("op")
+        if op == "login":
+            return await self.login(session, request)
+        if op == "resume":
+            token = request.get("token")
+            customer = self.session_store.resolve(token)
+            if customer is None:
+                raise RequestError("Invalid or expired session")
+            if customer.account_number not in self.accounts:
+                # Nobody kept the account open, so the token's Customer may predate later postings
+                customer = await self.run_blocking(self.db_manager.fetch_customer, customer.account_number)
+                if customer is None:
+                    raise RequestError("Invalid or expired session")
+            customer = self.bind(session, customer)
+            session["token"] = token
+            return self.account_state(customer)
+
+        customer = session["customer"]
+        if customer is None:
+            raise RequestError("Login required")
+
+        if op == "logout":
+            self.session_store.revoke(session["token"])
+            self.unbind(session)
+            return {"logged_out": True}
+        if op == "balance":
+            return self.account_state(customer)
+        if op == "history":
+            before = request.get("before")
+            transactions, cursor = await self.run_blocking(
+                self.db_manager.fetch_transactions, customer.account_number, tuple(before) if before else None)
+            return {"transactions": transactions, "next": cursor}
+        if op in MONEY_OPS:
+            amount = parse_amount(request.get("amount"))
+            ordered = await self.locks.acquire(customer.account_number)
+            try:
+                operation = getattr(customer, op)
+                ok = await self.run_blocking(operation, amount, self.db_manager, self.cache_manager)
+            finally:
+                self.locks.release(ordered)
+            return self.operation_result(customer, ok)
+        if op == "transfer":
+            return await self.transfer(customer, request)
+        raise RequestError(f"Unknown op {op!r}")
+
+    async def login(self, session, request):
+        email, password = request.get("email"), request.get("password")
+        if not email or not password:
+            raise RequestError("email and password are required")
+        customer = await self.run_blocking(self.db_manager.authenticate_customer, email, password)
+        if customer is None:
+            raise RequestError("Invalid credentials")
+        customer = self.bind(session, customer)
+        session["token"] = self.session_store.create(customer)
+        return {"username": customer.username, "token": session["token"], **self.account_state(customer)}
+
+    def bind(self, session, customer):
+        """Attach a session to an account and return the Customer every session on it shares."""
+        self.unbind(session)
+        # Sessions on the same account share one Customer so its in-memory state stays coherent
+        entry = self.accounts.setdefault(customer.account_number, [customer, 0])
+        entry[1] += 1
+        session["customer"] = entry[0]
+        return entry[0]
+
+    def unbind(self, session):
+        """Detach a session from its account, dropping the shared Customer with its last session."""
+        customer = session["customer"]
+        session["customer"], session["token"] = None, None
+        if customer is None:
+            return
+        entry = self.accounts[customer.account_number]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self.accounts[customer.account_number]
+
+    async def transfer(self, customer, request):
+        amount = parse_amount(request.get("amount"))
+        receiver_account = str(request.get("to_account", "")).strip()
+        if not receiver_account:
+            raise RequestError("to_account is required")
+        if receiver_account == customer.account_number:
+            raise RequestError("Cannot transfer to same account")
+
+        ordered = await self.locks.acquire(customer.account_number, receiver_account)
+        try:
+            entry = self.accounts.get(receiver_account)
+            receiver = entry[0] if entry else None
+            if receiver is None:
+                receiver = await self.run_blocking(self.db_manager.fetch_customer, receiver_account)
+                if receiver is None:
+                    raise RequestError("Receiver not found")
+            ok = await self.run_blocking(customer.transfer_money, receiver, amount,
+                                         self.db_manager, self.cache_manager)
+        finally:
+            self.locks.release(ordered)
+        return self.operation_result(customer, ok)
+
+    @staticmethod
+    def account_state(customer):
+        return {
+            "account_number": customer.account_number,
+            "balance": str(customer.balance),
+            "loan_amount": str(customer.loan_amount),
+            "credit_score": customer.credit_score
+        }
+
+    def operation_result(self, customer, ok):
+        if not ok:
+            raise RequestError("Operation rejected")
+        return self.account_state(customer)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        if self.exporter:
+            self.exporter.close()
+        if self.tracer:
+            for trace in self.tracer.recent()[-5:]:
+                print(format_trace(trace))
+        Customer.hasher.close()
+        Customer.hasher = None
+        self.db_manager.close()
+        self.cache_manager.close()
+
+
+def parse_amount(value):
+    try:
+        return Money.parse(str(value))
+    except ValueError:
+        raise RequestError("Invalid amount")
+
+
+async def serve(args):
+    server = BankServer(workers=args.workers, max_sessions=args.max_sessions, metrics_file=args.metrics_file,
+                        trace_sample=args.trace_sample)
+    if args.unix:
+        listener = await asyncio.start_unix_server(server.handle_client, path=args.unix)
+        print(f"✅ Serving on {args.unix}")
+    else:
+        listener = await asyncio.start_server(server.handle_client, args.host, args.port)
+        print(f"✅ Serving on {args.host}:{args.port}")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve banking operations over line-delimited JSON.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="Listen on a Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, default=16, help="Worker threads and pooled DB connections")
+    parser.add_argument("--max-sessions", type=int, default=10000)
+    parser.add_argument("--metrics-file", help="Prometheus text file to keep up to date")
+    parser.add_argument("--trace-sample", type=int, help="With --metrics-file, trace one in N operations")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        print("\n⚠️ Server stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Recompute every customer's credit score in one batch job.
+
+Scores are otherwise only refreshed when an account transacts, so dormant accounts keep
+whatever score they had when they last moved money. This job walks customers in
+user_id order (keyset chunks), streams the chunk's six-month window of scored ledger rows,
+counts deposits, repayments and failures per account with NumPy, applies
+calculate_credit_score's formula to the whole chunk at once and writes the changed scores
+back with bulk CASE updates, committing once per chunk. On a ledger-mode database the
+balances are the account snapshots plus their tails, and a score is written back only if
+the account has no newer ledger row than the one the score was computed at.
+
+Usage: python batch_credit_scores.py [--chunk-size 10000] [--write-batch 1000] [--dry-run]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from Project_DSA import SCORED_DEPOSIT_PAISE, DatabaseManager, six_months_ago
+
+# Column order of the per-account counts matrix
+DEPOSIT, REPAYMENT, FAILED = 0, 1, 2
+
+
+# customers.balance only moves with the compactor in ledger mode, so that mode reads
+# snapshot plus tail and checks writes against the account's newest ledger row instead
+LEDGER_CHUNK = """SELECT c.user_id, c.account_number,
+                         s.balance + COALESCE((SELECT SUM(t.amount) FROM transaction_record t
+                                               WHERE t.account_number = c.account_number
+                                               AND t.transaction_id > s.last_transaction_id), 0),
+                         c.credit_score,
+                         COALESCE((SELECT MAX(t.transaction_id) FROM transaction_record t
+                                   WHERE t.account_number = c.account_number), 0)
+                  FROM customers c
+                  JOIN account_snapshots s ON s.account_number = c.account_number
+                  WHERE c.user_id > %s
+                  ORDER BY c.user_id
+                  LIMIT %s"""
+LEDGER_GUARD = """COALESCE((SELECT MAX(t.transaction_id) FROM transaction_record t
+                           WHERE t.account_number = customers.account_number), 0) = %s"""
+
+
+def customer_chunks(db_manager, chunk_size):
+    """Yield (user_ids, account_numbers, balances, scores, versions) lists, chunk_size customers
+    at a time; a version is what write_scores checks before writing (the balance, or in ledger
+    mode the newest ledger row id)."""
+    last_user_id = 0
+    while True:
+        if db_manager.ledger:
+            db_manager.cursor.execute(LEDGER_CHUNK, (last_user_id, chunk_size))
+        else:
+            db_manager.cursor.execute("""SELECT user_id, account_number, balance, credit_score, balance
+                                         FROM customers
+                                         WHERE user_id > %s
+                                         ORDER BY user_id
+                                         LIMIT %s""", (last_user_id, chunk_size))
+        rows = db_manager.cursor.fetchall()
+        if not rows:
+            return
+        # MySQL sums BIGINT columns as DECIMAL
+        rows = [(user_id, number, int(balance), score, version)
+                for user_id, number, balance, score, version in rows]
+        yield tuple(map(list, zip(*rows)))
+        last_user_id = rows[-1][0]
+
+
+def window_counts(db_manager, account_numbers, cutoff, fetch_size=50000):
+    """Deposit / repayment / failure counts since cutoff, one row per account in input order."""
+    position = {number: index for index, number in enumerate(account_numbers)}
+    placeholders = ", ".join(["%s"] * len(account_numbers))
+    # Same rows CreditScoreEngine.classify counts, already reduced to a category code
+    db_manager.cursor.execute(f"""SELECT account_number,
+                                     CASE WHEN transaction_type = 'Deposit' THEN {DEPOSIT}
+                                          WHEN transaction_type = 'Loan Repayment' THEN {REPAYMENT}
+                                          ELSE {FAILED} END
+                                 FROM transaction_record
+                                 WHERE account_number IN ({placeholders})
+                                 AND timestamp >= %s
+                                 AND (transaction_type IN ('Loan Repayment', 'Failed', 'Bounced')
+                                      OR (transaction_type = 'Deposit' AND amount >= %s))""",
+                              (*account_numbers, cutoff, SCORED_DEPOSIT_PAISE))
+    cells = np.zeros(len(account_numbers) * 3, dtype=np.int64)
+    while True:
+        rows = db_manager.cursor.fetchmany(fetch_size)
+        if not rows:
+            break
+        accounts, categories = zip(*rows)
+        index = np.fromiter((position[number] for number in accounts), dtype=np.int64, count=len(rows))
+        cells += np.bincount(index * 3 + np.asarray(categories, dtype=np.int64), minlength=cells.size)
+    return cells.reshape(-1, 3)
+
+
+def score_chunk(balances, counts):
+    """calculate_credit_score over whole arrays; balances are int64 paise."""
+    balance_factor = np.minimum(200, balances // 100000)
+    deposit_score = np.minimum(100, counts[:, DEPOSIT] * 20)
+    repayment_score = np.minimum(150, counts[:, REPAYMENT] * 30)
+    penalty = np.minimum(200, counts[:, FAILED] * 50)
+    return np.minimum(900, 600 + balance_factor + deposit_score + repayment_score - penalty).astype(np.int64)
+
+
+def write_scores(db_manager, updates, write_batch):
+    """Bulk-write (user_id, version, score) triples.
+
+    A row is only updated if its version (see customer_chunks) still matches the one the
+    score was computed at; an account that posted meanwhile already got a fresh score
+    from the posting.
+    """
+    guard = LEDGER_GUARD if db_manager.ledger else "balance = %s"
+    written = 0
+    for start in range(0, len(updates), write_batch):
+        batch = updates[start:start + write_batch]
+        cases = " ".join([f"WHEN user_id = %s AND {guard} THEN %s"] * len(batch))
+        placeholders = ", ".join(["%s"] * len(batch))
+        params = [value for update in batch for value in update]
+        params.extend(user_id for user_id, _, _ in batch)
+        db_manager.cursor.execute(f"""UPDATE customers
+                                     SET credit_score = CASE {cases} ELSE credit_score END
+                                     WHERE user_id IN ({placeholders})""", params)
+        written += db_manager.cursor.rowcount
+    return written
+
+
+def recompute_scores(db_manager, chunk_size=10000, write_batch=1000, dry_run=False):
+    cutoff = six_months_ago().strftime("%Y-%m-%d %H:%M:%S")  # One window boundary for the whole run
+    totals = {"accounts": 0, "changed": 0, "written": 0}
+    with db_manager.session():
+        for user_ids, account_numbers, balances, scores, versions in customer_chunks(db_manager, chunk_size):
+            counts = window_counts(db_manager, account_numbers, cutoff)
+            new_scores = score_chunk(np.asarray(balances, dtype=np.int64), counts)
+            changed = np.flatnonzero(new_scores != np.asarray(scores, dtype=np.int64))
+
+            totals["accounts"] += len(user_ids)
+            totals["changed"] += len(changed)
+            if len(changed) and not dry_run:
+                updates = [(user_ids[i], versions[i], int(new_scores[i])) for i in changed]
+                totals["written"] += write_scores(db_manager, updates, write_batch)
+            db_manager.conn.commit()
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute every customer's credit score in bulk.")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="Customers read per chunk")
+    parser.add_argument("--write-batch", type=int, default=1000, help="Rows per bulk UPDATE")
+    parser.add_argument("--dry-run", action="store_true", help="Count stale scores without writing them")
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager()
+    start = time.perf_counter()
+    try:
+        totals = recompute_scores(db_manager, args.chunk_size, args.write_batch, args.dry_run)
+    finally:
+        db_manager.close()
+    elapsed = time.perf_counter() - start
+    print(f"✅ Scored {totals['accounts']} accounts in {elapsed:.1f}s "
+          f"({totals['accounts'] / max(elapsed, 1e-9):.0f} accounts/sec): {totals['changed']} stale, "
+          f"{totals['written']} updated")
+
+
+if __name__ == "__main__":
+    main()
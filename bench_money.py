@@ -0,0 +1,84 @@
+"""Micro-benchmark of the in-process posting loop: Decimal/float amounts against Money.
+
+Replays the per-operation money handling a withdrawal did before amounts were integer
+paise (float input, Decimal balance, float cache copy and checks) and the same steps
+with Money, without a database, so only the arithmetic and conversions are measured.
+Both loops must end on the same balance.
+
+Usage: python bench_money.py [--postings 200000] [--repeat 5]
+"""
+import argparse
+import random
+import time
+from decimal import Decimal
+
+from Project_DSA import Money
+
+
+def legacy_loop(inputs, opening):
+    balance = Decimal(opening)
+    cached_balance = float(balance)
+    for text in inputs:
+        amount = float(text)  # main() read amounts with float(input(...))
+        if float(amount) > cached_balance:  # The cache check in withdraw
+            continue
+        amount = Decimal(amount)
+        if amount <= 0 or amount > balance:
+            continue
+        balance -= amount
+        cached_balance = float(balance)  # CacheManager.update_cache
+        int(float(balance) / 1000)  # calculate_credit_score's balance factor
+        float(amount) >= 1000  # CreditScoreEngine.classify
+    return balance.quantize(Decimal("0.01"))
+
+
+def money_loop(inputs, opening):
+    balance = Money.of(opening)
+    cached_balance = balance
+    for text in inputs:
+        amount = Money.parse(text)
+        if amount > cached_balance:
+            continue
+        if amount <= 0 or amount > balance:
+            continue
+        balance -= amount
+        cached_balance = balance
+        balance.paise // 100000  # The same balance factor, on paise
+        amount.paise >= 100000
+    return balance
+
+
+def best_of(function, inputs, opening, repeat):
+    timings, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(inputs, opening)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Decimal/float and Money in the posting loop.")
+    parser.add_argument("--postings", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    # Whole-paisa amounts, the shape the server and CLI receive them in
+    inputs = [f"{rng.randint(1, 500)}.{rng.randint(0, 99):02d}" for _ in range(args.postings)]
+    opening = 10 ** 9
+
+    legacy_seconds, legacy_balance = best_of(legacy_loop, inputs, opening, args.repeat)
+    money_seconds, money_balance = best_of(money_loop, inputs, opening, args.repeat)
+    for label, seconds in (("Decimal/float", legacy_seconds), ("Money", money_seconds)):
+        print(f"{label:<14}{seconds * 1000:>10.1f} ms {args.postings / seconds:>12.0f} postings/s")
+    print(f"Speedup: {legacy_seconds / money_seconds:.2f}x")
+    if str(legacy_balance) != str(money_balance):
+        print(f"❌ Balances differ: {legacy_balance} vs {money_balance}")
+        raise SystemExit(1)
+    print(f"✅ Both loops end on ₹{money_balance}")
+
+
+if __name__ == "__main__":
+    main()
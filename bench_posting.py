@@ -0,0 +1,123 @@
+"""Latency benchmark for the two posting paths.
+
+Runs the same deposit / withdraw / transfer mix through the unit-of-work path and through
+PostingEngine (stored procedures from migration 4), and reports p50/p99 latency and the
+number of network round trips per operation for each.
+
+It posts against two accounts of its own in a scratch MySQL database (bank_bench by
+default, created from database_setup.sql plus `python migrations.py --database bank_bench
+migrate`), so it refuses to run against bank_system.
+
+Usage: python bench_posting.py [--iterations 500] [--warmup 20] [--database bank_bench]
+"""
+import argparse
+import contextlib
+import io
+import time
+
+from Project_DSA import CacheManager, Customer, DatabaseManager, Money
+
+BENCH_USERS = ("bench_posting_a", "bench_posting_b")
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class RoundTripCounter:
+    """Counts commands sent to the server by wrapping the connection's command writer."""
+
+    def __init__(self, conn):
+        self.count = 0
+        original = conn._execute_command
+
+        def counted(command, sql):
+            self.count += 1
+            return original(command, sql)
+
+        conn._execute_command = counted
+
+
+def bench_customers(db_manager, cache_manager):
+    """Fetch (creating on first run) the two accounts the benchmark posts against."""
+    customers = []
+    for index, username in enumerate(BENCH_USERS):
+        email = f"{username}@example.invalid"
+        db_manager.cursor.execute("SELECT account_number FROM customers WHERE email = %s", (email,))
+        row = db_manager.cursor.fetchone()
+        if row is None:
+            customer = Customer(username=username, email=email, password="bench-password",
+                                address="Benchmark", mobile_number=f"00000000{index:02d}",
+                                aadhaar_number=f"0000000000{index:02d}")
+            db_manager.insert_customer(customer)
+            account_number = customer.account_number
+        else:
+            account_number = row[0]
+        customer = db_manager.fetch_customer(account_number)
+        if customer.balance < Money.of(50000):
+            customer.deposit(Money.of(100000), db_manager, cache_manager)
+        customers.append(customer)
+    return customers
+
+
+def run(db_manager, cache_manager, iterations, warmup):
+    sender, receiver = bench_customers(db_manager, cache_manager)
+    counter = RoundTripCounter(db_manager.conn)
+    operations = {
+        "deposit": lambda: sender.deposit(Money.of(10), db_manager, cache_manager),
+        "withdraw": lambda: sender.withdraw(Money.of(10), db_manager, cache_manager),
+        "transfer": lambda: sender.transfer_money(receiver, Money.of(1), db_manager, cache_manager),
+    }
+
+    results = {}
+    for name, operation in operations.items():
+        latencies = []
+        round_trips = 0
+        # The operations print a receipt each time; keep that out of the measurement
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(warmup + iterations):
+                before = counter.count
+                start = time.perf_counter()
+                if not operation():
+                    raise RuntimeError(f"{name} failed during the benchmark")
+                elapsed = time.perf_counter() - start
+                if i >= warmup:
+                    latencies.append(elapsed)
+                    round_trips += counter.count - before
+        results[name] = {
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "round_trips": round_trips / iterations
+        }
+    # Give the transferred money back so repeated runs do not drain the sender
+    with contextlib.redirect_stdout(io.StringIO()):
+        receiver.transfer_money(sender, Money.of(1) * (warmup + iterations), db_manager, cache_manager)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare posting latency with and without stored procedures.")
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--database", default="bank_bench", help="Scratch MySQL database with migration 4 applied")
+    args = parser.parse_args()
+    if args.database == "bank_system":
+        parser.error("the benchmark posts thousands of operations; point --database at a scratch one")
+
+    print(f"{'path':<16}{'operation':<12}{'p50 ms':>10}{'p99 ms':>10}{'round trips':>14}")
+    for path, single_round_trip in (("unit_of_work", False), ("posting_engine", True)):
+        cache_manager = CacheManager("bench_posting_cache.snap", write_behind=True)
+        db_manager = DatabaseManager(cache_manager, single_round_trip=single_round_trip, database=args.database)
+        try:
+            results = run(db_manager, cache_manager, args.iterations, args.warmup)
+        finally:
+            db_manager.close()
+            cache_manager.close()
+        for name, stats in results.items():
+            print(f"{path:<16}{name:<12}{stats['p50_ms']:>10.2f}{stats['p99_ms']:>10.2f}"
+                  f"{stats['round_trips']:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""Reproducible load test for the Customer operations.
+
+Seeds a dedicated database with N customers and M historical transactions, then
+replays a mixed workload of deposit, withdraw, transfer_money, take_loan, return_loan
+and authenticate_customer calls from several worker threads. Throughput and p50/p95/p99
+latency per operation are printed and saved as JSON, and --compare prints the change
+against an earlier results file.
+
+Everything runs locally: either a MySQL server with its own database (bank_bench by
+default, created from database_setup.sql plus `python migrations.py --database bank_bench
+migrate`) or, with --backend sqlite, an embedded SQLite file that needs no server at all.
+The benchmark wipes that database's customers on every run, so it refuses to touch bank_system.
+The workload is generated from --seed, so two runs with the same arguments issue the
+same operations. Each worker owns a fixed slice of the accounts, and transfers stay
+inside that slice, so workers never share account state. With --group-commit-ms the
+postings go through a GroupCommitter, which commits the workers' concurrent postings
+together in one transaction (one fsync) per window.
+
+Usage:
+    python benchmark.py --customers 200 --transactions 5000 --operations 2000 --concurrency 8
+    python benchmark.py --backend sqlite --sqlite-path bench.db
+    python benchmark.py --ledger --compact-interval 1
+    python benchmark.py --group-commit-ms 5 --compare before.json
+    python benchmark.py --output after.json --compare before.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import random
+import subprocess
+import threading
+import time
+from datetime import datetime, timedelta
+
+from Project_DSA import (CacheManager, Customer, DatabaseManager, GroupCommitter, HashingService, Money, MySQLBackend,
+                         SQLiteBackend)
+
+OPERATIONS = ("deposit", "withdraw", "transfer", "take_loan", "return_loan", "authenticate")
+DEFAULT_MIX = "deposit=35,withdraw=25,transfer=20,take_loan=5,return_loan=5,authenticate=10"
+PASSWORD = "bench-password"
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, weight = part.split("=")
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation {name!r}")
+        mix[name] = float(weight)
+    return mix
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def seed_database(db_manager, customers, transactions, rng):
+    """Replace the bench database's data with `customers` accounts and `transactions` ledger rows."""
+    tables = ("transaction_record", "customers") + (("account_snapshots",) if db_manager.ledger else ())
+    with db_manager.session():
+        for table in tables:
+            db_manager.cursor.execute(f"DELETE FROM {table}")
+        db_manager.conn.commit()
+
+    records = [{"username": f"bench_{i}", "email": f"bench_{i}@example.invalid", "password": PASSWORD,
+                "address": "Benchmark", "mobile_number": f"9{i:09d}", "aadhaar_number": f"{i:012d}"}
+               for i in range(customers)]
+    account_numbers = db_manager.onboard_customers(records)
+    if len(account_numbers) != customers:
+        raise RuntimeError("Seeding customers failed")
+
+    # History spread over the last six months, so score windows have something to count
+    with db_manager.session():
+        db_manager.cursor.execute("SELECT account_number, user_id FROM customers")
+        user_ids = dict(db_manager.cursor.fetchall())
+        balances = {number: Money.ZERO for number in account_numbers}
+        now = datetime.now()
+        rows = []
+        for _ in range(transactions):
+            number = rng.choice(account_numbers)
+            timestamp = now - timedelta(seconds=rng.randint(0, 180 * 86400))
+            if balances[number] >= 500 and rng.random() < 0.4:
+                transaction_type, amount = "Withdrawal", -Money.of(rng.randint(100, 500))
+            else:
+                transaction_type, amount = "Deposit", Money.of(rng.randint(500, 20000))
+            balances[number] += amount
+            rows.append((user_ids[number], number, transaction_type, amount,
+                         timestamp.strftime("%Y-%m-%d %H:%M:%S")))
+        db_manager.cursor.executemany("""INSERT INTO transaction_record
+                                         (user_id, account_number, transaction_type, amount, timestamp)
+                                         VALUES (%s, %s, %s, %s, %s)""", rows)
+        db_manager.cursor.executemany("UPDATE customers SET balance = %s WHERE account_number = %s",
+                                      [(balance, number) for number, balance in balances.items()])
+        db_manager.conn.commit()
+    return account_numbers
+
+
+def build_workload(account_numbers, operations, concurrency, mix, rng):
+    """One list of (operation, account index, amount, receiver index) per worker."""
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    if len(account_numbers) < 2 * concurrency:
+        raise ValueError("Need at least two customers per worker")
+    plans = [[] for _ in range(concurrency)]
+    slices = [list(range(worker, len(account_numbers), concurrency)) for worker in range(concurrency)]
+    for i in range(operations):
+        worker = i % concurrency
+        own = slices[worker]
+        operation = rng.choices(names, weights)[0]
+        sender, receiver = rng.sample(own, 2)
+        amount = Money.of(rng.randint(500, 5000)) if operation == "take_loan" else Money.of(rng.randint(1, 2000))
+        plans[worker].append((operation, sender, amount, receiver))
+    return plans
+
+
+def run_worker(db_manager, cache_manager, account_numbers, plan, samples, errors, lock, committer=None):
+    customers = {}
+
+    def customer(index):
+        if index not in customers:
+            customers[index] = db_manager.fetch_customer(account_numbers[index])
+        return customers[index]
+
+    def post(method, *args):
+        # Through the committer the call returns once its group has committed
+        return committer.submit(method, *args).result() if committer else method(*args)
+
+    local_samples = {name: [] for name in OPERATIONS}
+    local_errors = {name: 0 for name in OPERATIONS}
+    for operation, sender, amount, receiver in plan:
+        subject = customer(sender)
+        target = customer(receiver) if operation == "transfer" else None
+        start = time.perf_counter()
+        if operation == "authenticate":
+            ok = db_manager.authenticate_customer(subject.email, PASSWORD) is not None
+        elif operation == "transfer":
+            ok = post(subject.transfer_money, target, amount, db_manager, cache_manager)
+        else:
+            ok = post(getattr(subject, operation), amount, db_manager, cache_manager)
+        local_samples[operation].append(time.perf_counter() - start)
+        if not ok:
+            local_errors[operation] += 1
+    with lock:
+        for name in OPERATIONS:
+            samples[name].extend(local_samples[name])
+            errors[name] += local_errors[name]
+
+
+def leave_ledger_mode(backend):
+    # Ledger mode follows account_snapshots; the bench data is wiped anyway, so a run
+    # without --ledger just drops the table an earlier --ledger run left behind
+    conn = backend.connect()
+    try:
+        conn.cursor().execute("DROP TABLE IF EXISTS account_snapshots")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def run_benchmark(args):
+    rng = random.Random(args.seed)
+    Customer.hasher = HashingService()
+    cache_manager = CacheManager("bench_cache.snap", write_behind=True)
+    if args.backend == "sqlite":
+        backend = SQLiteBackend(args.sqlite_path)
+    else:
+        backend = MySQLBackend(args.database)
+    if not args.ledger:
+        leave_ledger_mode(backend)
+    # The group committer works on a connection of its own
+    pool_max = args.concurrency + (1 if args.group_commit_ms else 0)
+    db_manager = DatabaseManager(cache_manager, pool_min=1, pool_max=pool_max,
+                                 single_round_trip=args.single_round_trip, backend=backend, ledger=args.ledger,
+                                 compact_interval=args.compact_interval)
+    committer = None
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            account_numbers = seed_database(db_manager, args.customers, args.transactions, rng)
+        plans = build_workload(account_numbers, args.operations, args.concurrency, parse_mix(args.mix), rng)
+
+        samples = {name: [] for name in OPERATIONS}
+        errors = {name: 0 for name in OPERATIONS}
+        lock = threading.Lock()
+        if args.group_commit_ms:
+            committer = GroupCommitter(db_manager, window_ms=args.group_commit_ms)
+        threads = [threading.Thread(target=run_worker, args=(db_manager, cache_manager, account_numbers, plan,
+                                                            samples, errors, lock, committer))
+                   for plan in plans]
+        # Receipts are printed by every operation; they would dominate the timings
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+    finally:
+        if committer:
+            committer.close()
+        db_manager.close()
+        cache_manager.close()
+        Customer.hasher.close()
+        Customer.hasher = None
+
+    results = {}
+    for name in OPERATIONS:
+        if samples[name]:
+            results[name] = {
+                "count": len(samples[name]),
+                "rejected": errors[name],
+                "throughput": len(samples[name]) / elapsed,
+                "p50_ms": percentile(samples[name], 0.50) * 1000,
+                "p95_ms": percentile(samples[name], 0.95) * 1000,
+                "p99_ms": percentile(samples[name], 0.99) * 1000
+            }
+    total = sum(len(values) for values in samples.values())
+    return {"total": {"count": total, "seconds": elapsed, "throughput": total / elapsed}, "operations": results}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report, baseline=None):
+    print(f"{'operation':<14}{'count':>8}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, stats in report["results"]["operations"].items():
+        line = (f"{name:<14}{stats['count']:>8}{stats['throughput']:>10.1f}{stats['p50_ms']:>10.2f}"
+                f"{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}")
+        before = baseline["results"]["operations"].get(name) if baseline else None
+        if before:
+            line += f"   p99 {(stats['p99_ms'] - before['p99_ms']) / before['p99_ms'] * 100:+.1f}%"
+        print(line)
+    total = report["results"]["total"]
+    line = f"Total: {total['count']} operations in {total['seconds']:.2f}s ({total['throughput']:.1f} ops/s)"
+    if baseline:
+        before = baseline["results"]["total"]["throughput"]
+        line += f", throughput {(total['throughput'] - before) / before * 100:+.1f}% vs {baseline.get('commit')}"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the banking operations against a local database.")
+    parser.add_argument("--customers", type=int, default=200)
+    parser.add_argument("--transactions", type=int, default=5000, help="Seeded ledger rows")
+    parser.add_argument("--operations", type=int, default=2000, help="Operations replayed in the measured run")
+    parser.add_argument("--concurrency", type=int, default=8, help="Worker threads (and pooled connections)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Operation weights, e.g. " + DEFAULT_MIX)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--backend", choices=("mysql", "sqlite"), default="mysql")
+    parser.add_argument("--database", default="bank_bench", help="Scratch MySQL database, wiped on every run")
+    parser.add_argument("--sqlite-path", default="bank_bench.db", help="Scratch SQLite file for --backend sqlite")
+    parser.add_argument("--single-round-trip", action="store_true", help="Use the stored-procedure posting path")
+    parser.add_argument("--ledger", action="store_true", help="Use the append-only ledger posting path")
+    parser.add_argument("--compact-interval", type=float, help="Seconds between ledger compactions (with --ledger)")
+    parser.add_argument("--group-commit-ms", type=float,
+                        help="Commit postings in groups collected over this many milliseconds")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args()
+    if args.backend == "mysql" and args.database == "bank_system":
+        parser.error("the benchmark wipes its database; point --database at a scratch one")
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "results": run_benchmark(args)
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as file:
+            baseline = json.load(file)
+    print_report(report, baseline)
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"✅ Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""Batch ledger ingestion from a JSONL file of money movements.
+
+Every input line is one request:
+    {"id": "r1", "op": "deposit", "account_number": "1234567890", "amount": "2500.00"}
+    {"id": "r2", "op": "transfer", "account_number": "1234567890", "to_account": "9292010469", "amount": 100}
+
+Supported ops are deposit, withdraw, transfer, loan and repay. The file is streamed in
+chunks, so memory stays flat no matter how many lines it has. Each chunk is validated,
+applied in file order against locked account rows, and written back with one bulk
+ledger insert, one bulk balance update and a single commit. One result line per
+request is written to the output JSONL file.
+
+On a ledger-mode database the balances come from the account snapshots plus their
+tails, each snapshot is locked the way LedgerEngine locks it, and only the credit
+scores are written back: the inserted ledger rows are the balance change.
+
+Usage: python bulk_ingest.py requests.jsonl results.jsonl [--chunk-size 5000]
+Set BANK_SQLITE_PATH to ingest into an SQLite file instead of MySQL.
+"""
+import argparse
+import json
+
+from Project_DSA import CacheManager, DatabaseManager, Money, backend_from_env, calculate_credit_score, loan_terms
+
+OPERATIONS = ("deposit", "withdraw", "transfer", "loan", "repay")
+
+
+def read_chunks(path, chunk_size):
+    """Yield lists of (line_number, line) without reading the whole file."""
+    chunk = []
+    with open(path, "r") as file:
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            chunk.append((line_number, line))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def parse_request(line):
+    """Return a normalised request dict, raising ValueError if the line is invalid."""
+    try:
+        request = json.loads(line)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON: {e}")
+    if not isinstance(request, dict):
+        raise ValueError("Request must be a JSON object")
+
+    op = request.get("op")
+    if op not in OPERATIONS:
+        raise ValueError(f"Unknown op {op!r}")
+    account_number = str(request.get("account_number", "")).strip()
+    if not account_number:
+        raise ValueError("Missing account_number")
+
+    # Exact: more than two decimal places is rejected rather than rounded
+    amount = Money.parse(str(request.get("amount")))
+    if amount <= 0:
+        raise ValueError("Amount must be positive")
+    if op == "loan" and amount < 500:
+        raise ValueError("Minimum loan amount is ₹500")
+
+    to_account = None
+    if op == "transfer":
+        to_account = str(request.get("to_account", "")).strip()
+        if not to_account:
+            raise ValueError("Missing to_account")
+        if to_account == account_number:
+            raise ValueError("Cannot transfer to same account")
+
+    return {
+        "id": request.get("id"),
+        "op": op,
+        "account_number": account_number,
+        "to_account": to_account,
+        "amount": amount
+    }
+
+
+def lock_accounts(db_manager, account_numbers):
+    """Load and row-lock every account the chunk touches, in a deterministic order."""
+    accounts = {}
+    numbers = sorted(account_numbers)
+    ledger = db_manager.ledger
+    # In ledger mode the snapshot row is the account's lock; the customers rows are only read
+    locking = "" if ledger else "FOR UPDATE"
+    # Batches stay under the backend's bind-parameter limit and keep the lock order
+    batch_size = db_manager.backend.max_params
+    for start in range(0, len(numbers), batch_size):
+        batch = numbers[start:start + batch_size]
+        placeholders = ", ".join(["%s"] * len(batch))
+        query = f"""SELECT account_number, user_id, balance, loan_amount, credit_score
+                   FROM customers
+                   WHERE account_number IN ({placeholders})
+                   ORDER BY account_number
+                   {locking}"""
+        db_manager.cursor.execute(query, batch)
+        for row in db_manager.cursor.fetchall():
+            accounts[row[0]] = {"user_id": row[1], "balance": Money(row[2]), "loan_amount": Money(row[3]),
+                                "credit_score": row[4]}
+    if ledger:
+        for number in sorted(accounts):
+            state = ledger.state(number, lock=True)
+            if state is None:
+                del accounts[number]
+            else:
+                accounts[number]["balance"], accounts[number]["loan_amount"] = state[0], state[1]
+    return accounts
+
+
+def apply_request(request, accounts, ledger, engine):
+    """Apply one request to the in-memory account states, returning an error or None."""
+    account = accounts.get(request["account_number"])
+    if account is None:
+        return "Account not found"
+    op, amount = request["op"], request["amount"]
+
+    if op == "deposit":
+        account["balance"] += amount
+        ledger.append((account["user_id"], request["account_number"], "Deposit", None, amount))
+    elif op == "withdraw":
+        if amount > account["balance"]:
+            return "Insufficient balance"
+        account["balance"] -= amount
+        ledger.append((account["user_id"], request["account_number"], "Withdrawal", None, -amount))
+    elif op == "transfer":
+        receiver = accounts.get(request["to_account"])
+        if receiver is None:
+            return "Receiver not found"
+        if amount > account["balance"]:
+            return "Insufficient balance"
+        account["balance"] -= amount
+        receiver["balance"] += amount
+        ledger.append((account["user_id"], request["account_number"],
+                       "Transfer Out", request["to_account"], -amount))
+        ledger.append((receiver["user_id"], request["to_account"],
+                       "Transfer In", request["account_number"], amount))
+    elif op == "loan":
+        # Score the account as it stands after the chunk's earlier requests, not as stored
+        account["credit_score"] = calculate_credit_score(account["balance"],
+                                                         *engine.counts(request["account_number"]))
+        terms = loan_terms(account["balance"], account["credit_score"])
+        if terms is None:
+            return f"Credit score too low ({account['credit_score']}/900)"
+        if amount > terms["max_loan"]:
+            return f"Maximum loan amount allowed: ₹{terms['max_loan']}"
+        account["balance"] += amount
+        account["loan_amount"] += amount
+        ledger.append((account["user_id"], request["account_number"], "Loan Taken", None, amount))
+    elif op == "repay":
+        if amount > account["balance"] or amount > account["loan_amount"]:
+            return "Invalid loan repayment amount"
+        account["balance"] -= amount
+        account["loan_amount"] -= amount
+        ledger.append((account["user_id"], request["account_number"], "Loan Repayment", None, -amount))
+    return None
+
+
+def bulk_update_accounts(db_manager, accounts, fields=("balance", "loan_amount", "credit_score")):
+    """Write the given fields of every touched account back with one UPDATE statement per batch."""
+    numbers = sorted(accounts)
+    # Each account takes a CASE pair per field plus its slot in the IN list
+    batch_size = db_manager.backend.max_params // (2 * len(fields) + 1)
+    for start in range(0, len(numbers), batch_size):
+        batch = numbers[start:start + batch_size]
+        cases = " ".join(["WHEN %s THEN %s"] * len(batch))
+        placeholders = ", ".join(["%s"] * len(batch))
+        assignments = ",\n                   ".join(f"{field} = CASE account_number {cases} END" for field in fields)
+        query = f"""UPDATE customers SET
+                   {assignments}
+                   WHERE account_number IN ({placeholders})"""
+        params = []
+        for field in fields:
+            for number in batch:
+                params.extend((number, accounts[number][field]))
+        params.extend(batch)
+        db_manager.cursor.execute(query, params)
+
+
+def process_chunk(db_manager, chunk):
+    """Validate, apply and persist one chunk; returns one result dict per input line."""
+    results = {}
+    requests = []
+    for line_number, line in chunk:
+        try:
+            requests.append((line_number, parse_request(line)))
+        except ValueError as e:
+            results[line_number] = {"line": line_number, "status": "rejected", "error": str(e)}
+
+    account_numbers = set()
+    for _, request in requests:
+        account_numbers.add(request["account_number"])
+        if request["to_account"]:
+            account_numbers.add(request["to_account"])
+
+    engine = db_manager.score_engine
+    touched = set()
+    try:
+        with db_manager.unit_of_work():
+            accounts = lock_accounts(db_manager, account_numbers)
+            # Bring the score counters up to date before this chunk's rows exist in the ledger;
+            # the chunk's rows are recorded without ids, so these windows are seeded afresh next time
+            for number in accounts:
+                db_manager._sync_credit_window(number)
+
+            ledger = []
+            for line_number, request in requests:
+                posted = len(ledger)
+                error = apply_request(request, accounts, ledger, engine)
+                if error:
+                    results[line_number] = {"line": line_number, "id": request["id"],
+                                            "status": "rejected", "error": error}
+                    continue
+                results[line_number] = {"line": line_number, "id": request["id"], "status": "ok"}
+                # Counted as they are applied, so a later loan in the chunk scores against them
+                for _, number, transaction_type, _, amount in ledger[posted:]:
+                    engine.record(number, transaction_type, amount)
+                    touched.add(number)
+
+            if ledger:
+                db_manager.cursor.executemany(
+                    """INSERT INTO transaction_record
+                      (user_id, account_number, transaction_type, counterparty, amount)
+                      VALUES (%s, %s, %s, %s, %s)""", ledger)
+                for number in touched:
+                    db_manager._balance_changed(number)
+
+                # Scores are refreshed once per account per chunk, against the chunk's closing balance
+                for number in touched:
+                    deposits, repayments, failed = engine.counts(number)
+                    accounts[number]["credit_score"] = calculate_credit_score(
+                        accounts[number]["balance"], deposits, repayments, failed)
+                # customers.balance is the compactor's copy in ledger mode, not ours to write
+                fields = ("credit_score",) if db_manager.ledger else ("balance", "loan_amount", "credit_score")
+                bulk_update_accounts(db_manager, {number: accounts[number] for number in touched}, fields)
+
+    except Exception as e:
+        # Counters fed by the rolled back chunk are rebuilt from the database on next use
+        for number in touched:
+            engine.forget(number)
+        for line_number, request in requests:
+            results[line_number] = {"line": line_number, "id": request["id"],
+                                    "status": "error", "error": str(e)}
+        return [results[line_number] for line_number, _ in chunk], set()
+
+    for line_number, request in requests:
+        result = results[line_number]
+        if result["status"] == "ok":
+            result["balance"] = str(accounts[request["account_number"]]["balance"])
+    return [results[line_number] for line_number, _ in chunk], touched
+
+
+def ingest(db_manager, cache_manager, input_path, output_path, chunk_size=5000):
+    """Stream input_path through the ledger and write per-request results to output_path."""
+    totals = {"ok": 0, "rejected": 0, "error": 0}
+    with open(output_path, "w") as output:
+        for chunk in read_chunks(input_path, chunk_size):
+            results, touched = process_chunk(db_manager, chunk)
+            for result in results:
+                totals[result["status"]] += 1
+                output.write(json.dumps(result, separators=(",", ":")) + "\n")
+            # Cached balances for these accounts are now stale
+            for number in touched:
+                cache_manager.remove_from_cache(number)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Post a JSONL file of money movements in bulk.")
+    parser.add_argument("input", help="JSONL file of deposit/withdraw/transfer/loan/repay requests")
+    parser.add_argument("output", help="JSONL file to write one result per request to")
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    cache_manager = CacheManager(write_behind=True)
+    db_manager = DatabaseManager(cache_manager, backend=backend_from_env())
+    try:
+        totals = ingest(db_manager, cache_manager, args.input, args.output, args.chunk_size)
+        print(f"✅ Ingestion finished: {totals['ok']} posted, {totals['rejected']} rejected, "
+              f"{totals['error']} failed")
+    finally:
+        db_manager.close()
+        cache_manager.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Convert the customer cache between its binary snapshot and JSON, or describe a snapshot.
+
+CacheManager reads and writes the binary format (see CacheSnapshot); JSON is only an
+interchange format for inspecting, editing or seeding a cache.
+
+Usage:
+    python cache_snapshot.py info [--cache cache.snap]
+    python cache_snapshot.py export cache_dump.json [--cache cache.snap]
+    python cache_snapshot.py import cache.json [--cache cache.snap]
+"""
+import argparse
+import os
+from datetime import datetime
+
+from Project_DSA import CacheManager, CacheSnapshot
+
+
+def describe(path):
+    snapshot = CacheSnapshot.open(path)
+    if snapshot is None:
+        print(f"❌ {path} is missing or not a cache snapshot")
+        return
+    try:
+        saved = datetime.fromtimestamp(snapshot.saved_at).strftime("%Y-%m-%d %H:%M:%S")
+        print(f"{path}: version {snapshot.VERSION}, {len(snapshot)} records, "
+              f"{os.path.getsize(path)} bytes, saved {saved}")
+    finally:
+        snapshot.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the customer cache snapshot to and from JSON.")
+    parser.add_argument("--cache", default="cache.snap", help="Binary snapshot file")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("info")
+    export_parser = commands.add_parser("export", help="Write the snapshot's live entries as JSON")
+    export_parser.add_argument("json_file")
+    import_parser = commands.add_parser("import", help="Merge a JSON cache into the snapshot")
+    import_parser.add_argument("json_file")
+    args = parser.parse_args()
+
+    if args.command == "info":
+        describe(args.cache)
+        return
+    # Write-behind so the journal is replayed on open and folded in on close
+    cache_manager = CacheManager(args.cache, write_behind=True)
+    try:
+        if args.command == "export":
+            count = cache_manager.export_json(args.json_file)
+            print(f"✅ Exported {count} entries to {args.json_file}")
+        else:
+            cache_manager.import_json(args.json_file)
+            print(f"✅ Imported {args.json_file} into {args.cache}")
+    finally:
+        cache_manager.close()
+    describe(args.cache)
+
+
+if __name__ == "__main__":
+    main()
@@ -26,5 +26,20 @@ CREATE TABLE transaction_record (
     transaction_type ENUM('Deposit', 'Withdrawal', 'Loan Repayment') NOT NULL,
     amount DECIMAL(15,2) NOT NULL,
     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- Dropped by migration 3 (partition_by_month): partitioned tables cannot have foreign keys
     FOREIGN KEY (account_number) REFERENCES customers(account_number) ON DELETE CASCADE
 );
+
+-- Block-reserved sequences for collision-free account and card numbers
+-- (migration 9 adds them to databases created before this table existed)
+CREATE TABLE number_sequences (
+    name VARCHAR(32) PRIMARY KEY,
+    next_value BIGINT NOT NULL
+);
+
+INSERT INTO number_sequences (name, next_value) VALUES
+    ('account_number', 100000000),
+    ('card_number', 400000000000000);
+
+-- Later schema changes (indexes, transaction types, partitioning) are versioned
+-- migrations: run `python migrations.py migrate` after creating this schema.
@@ -0,0 +1,99 @@
+"""Maintain the append-only ledger: tail lengths, compaction, verification and rebuilds.
+
+In ledger mode an account's balance is its account_snapshots row plus the ledger rows
+after it. The mode belongs to the database: `enable` creates and seeds account_snapshots,
+after which every DatabaseManager on that database (and every batch tool) reads balances
+from the ledger, and `disable` folds every tail into customers and drops the table again.
+Stop the other writers while switching. `compact` folds tails into the snapshots, `verify`
+replays every account from the base its snapshot was opened at and reports the ones that
+disagree, and `rebuild` replaces a snapshot with its replay.
+Set BANK_SQLITE_PATH to work on an SQLite file instead of MySQL.
+
+Usage:
+    python ledger_tool.py enable
+    python ledger_tool.py disable
+    python ledger_tool.py status
+    python ledger_tool.py compact [--min-tail 1]
+    python ledger_tool.py verify [ACCOUNT ...]
+    python ledger_tool.py rebuild ACCOUNT [ACCOUNT ...]
+"""
+import argparse
+import time
+
+from Project_DSA import DatabaseManager, backend_from_env
+
+
+def tail_status(db_manager):
+    with db_manager.session():
+        db_manager.cursor.execute("""SELECT COUNT(*), MIN(taken_at) FROM account_snapshots""")
+        accounts, oldest = db_manager.cursor.fetchone()
+        db_manager.cursor.execute("""SELECT COUNT(*), COALESCE(MAX(tail), 0), COALESCE(SUM(tail), 0) FROM (
+                                         SELECT s.account_number, COUNT(*) AS tail FROM account_snapshots s
+                                         JOIN transaction_record t ON t.account_number = s.account_number
+                                         AND t.transaction_id > s.last_transaction_id
+                                         GROUP BY s.account_number) tails""")
+        with_tail, longest, events = db_manager.cursor.fetchone()
+    print(f"{accounts} accounts, {with_tail} with a tail; {events} events past their snapshots, "
+          f"longest tail {longest}; oldest snapshot {oldest}")
+
+
+def disable_ledger(db_manager):
+    """Bring customers up to date with the ledger, then leave ledger mode."""
+    accounts, events = db_manager.ledger.compact_all(1)
+    with db_manager.session():
+        db_manager.cursor.execute("DROP TABLE account_snapshots")
+    print(f"✅ Folded {events} events into {accounts} accounts and left ledger mode")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact, verify or rebuild the ledger's account snapshots.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("enable", help="Create account snapshots and switch the database to ledger mode")
+    commands.add_parser("disable", help="Fold every tail into customers and drop the snapshots")
+    commands.add_parser("status")
+    compact_parser = commands.add_parser("compact", help="Fold ledger tails into the snapshots")
+    compact_parser.add_argument("--min-tail", type=int, default=1, help="Skip accounts with shorter tails")
+    verify_parser = commands.add_parser("verify", help="Compare snapshot plus tail with a full replay")
+    verify_parser.add_argument("accounts", nargs="*", help="Account numbers (default: all)")
+    rebuild_parser = commands.add_parser("rebuild", help="Replace snapshots with a full replay")
+    rebuild_parser.add_argument("accounts", nargs="+")
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager(pool_min=1, pool_max=1, backend=backend_from_env(),
+                                 ledger=args.command == "enable")
+    ledger = db_manager.ledger
+    try:
+        if ledger is None:
+            print("❌ This database is not in ledger mode; run `ledger_tool.py enable` first")
+            raise SystemExit(1)
+        if args.command == "enable":
+            print("✅ Ledger mode is on")
+        elif args.command == "disable":
+            disable_ledger(db_manager)
+        elif args.command == "status":
+            tail_status(db_manager)
+        elif args.command == "compact":
+            start = time.perf_counter()
+            accounts, events = ledger.compact_all(args.min_tail)
+            print(f"✅ Folded {events} events into {accounts} snapshots in {time.perf_counter() - start:.2f}s")
+        elif args.command == "verify":
+            start = time.perf_counter()
+            mismatches = ledger.verify(args.accounts or None)
+            for number, (snapshot, replayed) in mismatches.items():
+                print(f"❌ {number}: snapshot plus tail {snapshot}, replay {replayed}")
+            if mismatches:
+                raise SystemExit(1)
+            print(f"✅ Every snapshot matches its replay ({time.perf_counter() - start:.2f}s)")
+        elif args.command == "rebuild":
+            for number in args.accounts:
+                rebuilt = ledger.rebuild(number)
+                if rebuilt is None:
+                    print(f"❌ {number} has no ledger snapshot")
+                else:
+                    print(f"✅ {number} rebuilt: balance ₹{rebuilt[0]}, loan ₹{rebuilt[1]}")
+    finally:
+        db_manager.close()
+
+
+if __name__ == "__main__":
+    main()
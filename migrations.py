@@ -0,0 +1,470 @@
+"""Versioned schema migrations for the bank_system database.
+
+database_setup.sql creates the base schema; every change after that is a numbered
+migration recorded in schema_migrations, so each database can be brought to the current
+version by running the ones it has not applied yet. MySQL commits DDL implicitly, so a
+migration is recorded only after all of its steps have succeeded.
+
+Usage:
+    python migrations.py [--database bank_system] status
+    python migrations.py [--database bank_system] migrate [--target N] [--report plans.json]
+    python migrations.py [--database bank_system] partitions [--months-ahead 3]
+"""
+import argparse
+import json
+from datetime import datetime
+
+from Project_DSA import DatabaseManager, NumberAllocator
+
+TRANSACTION_TYPES = ("Deposit", "Withdrawal", "Loan Repayment", "Loan Taken",
+                     "Transfer Out", "Transfer In", "Failed", "Bounced", "Transfer Refund")
+
+
+def add_history_index(cursor):
+    # Serves the credit-score window (account + time range) and history pages
+    # (account, newest first, keyset on timestamp then transaction_id) straight from the index
+    cursor.execute("""CREATE INDEX idx_txn_account_time
+                     ON transaction_record (account_number, timestamp, transaction_id)""")
+
+
+def split_transaction_type(cursor):
+    # A one-byte ENUM that accepts every type the code writes; the other account of a
+    # transfer moves to its own column instead of being baked into the type string.
+    # The old ENUM only knew Deposit, Withdrawal and Loan Repayment. Strict mode rejected
+    # "Loan Taken" and "Transfer to/from ..." rows outright, but without it MySQL stored
+    # them as ''. The column is opened up to VARCHAR first so those rows can be mapped,
+    # and the ENUM only goes on once no value outside it is left.
+    cursor.execute("""ALTER TABLE transaction_record
+                      MODIFY transaction_type VARCHAR(20) NOT NULL,
+                      ADD COLUMN counterparty VARCHAR(20) NULL AFTER transaction_type""")
+    # A transfer wrote its debit ("Transfer to") and then its credit ("Transfer from"),
+    # so a pair of blank rows with consecutive ids and opposite amounts is one transfer
+    cursor.execute("""UPDATE transaction_record debit
+                      JOIN transaction_record credit
+                      ON credit.transaction_id = debit.transaction_id + 1
+                      AND credit.transaction_type = '' AND credit.amount = -debit.amount
+                      SET debit.transaction_type = 'Transfer Out', debit.counterparty = credit.account_number,
+                          credit.transaction_type = 'Transfer In', credit.counterparty = debit.account_number
+                      WHERE debit.transaction_type = '' AND debit.amount < 0""")
+    # Of the lost types only "Transfer to" took money out, so an unpaired debit is a
+    # transfer with an unknown counterparty; an unpaired credit is taken for "Loan Taken"
+    cursor.execute("""UPDATE transaction_record SET transaction_type = 'Transfer Out'
+                      WHERE transaction_type = '' AND amount < 0""")
+    cursor.execute("""UPDATE transaction_record SET transaction_type = 'Loan Taken'
+                      WHERE transaction_type = '' AND amount >= 0""")
+
+    types = ", ".join(f"'{t}'" for t in TRANSACTION_TYPES)
+    cursor.execute(f"""SELECT transaction_type, COUNT(*) FROM transaction_record
+                      WHERE transaction_type NOT IN ({types}) GROUP BY transaction_type""")
+    unmapped = cursor.fetchall()
+    if unmapped:
+        found = ", ".join(f"{t!r} x{count}" for t, count in unmapped)
+        raise RuntimeError(f"transaction_record has types the new ENUM cannot hold: {found}")
+    cursor.execute(f"""ALTER TABLE transaction_record
+                      MODIFY transaction_type ENUM({types}) NOT NULL""")
+
+
+def month_start(year, month):
+    return datetime(year + (month - 1) // 12, (month - 1) % 12 + 1, 1)
+
+
+def partition_clause(first, last):
+    """PARTITION definitions for every month from first to last (inclusive) plus a catch-all."""
+    partitions = []
+    current = month_start(first.year, first.month)
+    while current <= last:
+        upper = month_start(current.year, current.month + 1)
+        partitions.append(f"PARTITION p{current:%Y%m} VALUES LESS THAN "
+                          f"(UNIX_TIMESTAMP('{upper:%Y-%m-%d %H:%M:%S}'))")
+        current = upper
+    partitions.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+    return ",\n".join(partitions)
+
+
+def partition_by_month(cursor, months_ahead=3):
+    # InnoDB cannot partition a table that has foreign keys, and every unique key must
+    # include the partitioning column, so the primary key becomes (transaction_id, timestamp).
+    # This drops the ledger's FK to customers for good, with its ON DELETE CASCADE:
+    # - The database no longer refuses a row for an unknown account_number. Every
+    #   writer inserts ledger rows for an account it has just read or locked.
+    # - Deleting a customer no longer deletes its ledger rows. delete_customer does
+    #   that explicitly, and anything else deleting customers must too.
+    cursor.execute("""SELECT CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS
+                     WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME = 'transaction_record'""")
+    for (constraint,) in cursor.fetchall():
+        cursor.execute(f"ALTER TABLE transaction_record DROP FOREIGN KEY {constraint}")
+        print(f"⚠️ Dropped foreign key {constraint} (transaction_record.account_number -> customers); "
+              f"ledger rows are no longer checked against or cascaded from customers")
+
+    cursor.execute("""ALTER TABLE transaction_record
+                     MODIFY timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                     DROP PRIMARY KEY,
+                     ADD PRIMARY KEY (transaction_id, timestamp)""")
+
+    cursor.execute("SELECT MIN(timestamp) FROM transaction_record")
+    first = cursor.fetchone()[0] or datetime.now()
+    now = datetime.now()
+    last = month_start(now.year, now.month + months_ahead)
+    cursor.execute(f"""ALTER TABLE transaction_record
+                      PARTITION BY RANGE (UNIX_TIMESTAMP(timestamp)) (
+                      {partition_clause(first, last)})""")
+
+
+def ensure_month_partitions(cursor, months_ahead=3):
+    """Split pmax so monthly partitions exist up to `months_ahead` months from now."""
+    cursor.execute("""SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+                     WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'transaction_record'
+                     AND PARTITION_NAME LIKE 'p______'
+                     ORDER BY PARTITION_NAME DESC LIMIT 1""")
+    row = cursor.fetchone()
+    if row is None:
+        raise RuntimeError("transaction_record is not partitioned yet, run migrate first")
+    newest = datetime.strptime(row[0][1:], "%Y%m")
+    now = datetime.now()
+    last = month_start(now.year, now.month + months_ahead)
+    first = month_start(newest.year, newest.month + 1)
+    if first > last:
+        return 0
+    cursor.execute(f"""ALTER TABLE transaction_record REORGANIZE PARTITION pmax INTO (
+                      {partition_clause(first, last)})""")
+    return (last.year - first.year) * 12 + last.month - first.month + 1
+
+
+def create_posting_procedures(cursor, money="DECIMAL(15,2)", per_rupee=1):
+    # Server-side posting path used by PostingEngine: the balance change, ledger row and
+    # credit score refresh for one operation cost a single CALL. The procedures do not open
+    # or commit a transaction themselves, so they also work inside a unit of work.
+    # The score is computed from the pre-posting balance and the caller's six-month
+    # window counts, exactly as update_credit_score does.
+    # money / per_rupee: the SQL type amounts are held in and how many units make a rupee
+    for statement in ("DROP FUNCTION IF EXISTS bank_credit_score",
+                      "DROP PROCEDURE IF EXISTS post_transaction",
+                      "DROP PROCEDURE IF EXISTS post_transfer"):
+        cursor.execute(statement)
+
+    cursor.execute(f"""CREATE FUNCTION bank_credit_score(p_balance {money}, p_deposits INT,
+                                                       p_repayments INT, p_failed INT)
+        RETURNS INT DETERMINISTIC
+        RETURN LEAST(900, 600 + LEAST(200, TRUNCATE(p_balance / {1000 * per_rupee}, 0))
+                          + LEAST(100, p_deposits * 20)
+                          + LEAST(150, p_repayments * 30)
+                          - LEAST(200, p_failed * 50))""")
+
+    cursor.execute(f"""CREATE PROCEDURE post_transaction(
+            IN p_account VARCHAR(20), IN p_type VARCHAR(20), IN p_counterparty VARCHAR(20),
+            IN p_amount {money}, IN p_loan_delta {money}, IN p_timestamp DATETIME,
+            IN p_deposits INT, IN p_repayments INT, IN p_failed INT, IN p_check_loan BOOLEAN)
+        BEGIN
+            DECLARE v_user_id INT DEFAULT NULL;
+            DECLARE v_balance {money};
+            DECLARE v_loan {money};
+            DECLARE v_score INT;
+
+            SELECT user_id, balance, loan_amount INTO v_user_id, v_balance, v_loan
+            FROM customers WHERE account_number = p_account FOR UPDATE;
+            IF v_user_id IS NULL THEN
+                SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Account not found';
+            END IF;
+            IF v_balance + p_amount < 0 THEN
+                SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Insufficient balance';
+            END IF;
+            IF v_loan + p_loan_delta < 0 THEN
+                SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Invalid loan repayment amount';
+            END IF;
+
+            SET v_score = bank_credit_score(v_balance, p_deposits, p_repayments, p_failed);
+            IF p_check_loan THEN
+                IF v_score < 600 THEN
+                    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Credit score too low';
+                END IF;
+                IF p_amount > v_balance * (CASE WHEN v_score >= 800 THEN 3 WHEN v_score >= 700 THEN 2 ELSE 1 END) THEN
+                    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Requested loan exceeds maximum loan amount';
+                END IF;
+            END IF;
+
+            UPDATE customers
+            SET balance = balance + p_amount, loan_amount = loan_amount + p_loan_delta, credit_score = v_score
+            WHERE account_number = p_account;
+            INSERT INTO transaction_record
+                (user_id, account_number, transaction_type, counterparty, amount, timestamp)
+            VALUES (v_user_id, p_account, p_type, p_counterparty, p_amount, p_timestamp);
+
+            SELECT v_balance + p_amount, v_loan + p_loan_delta, v_score, LAST_INSERT_ID();
+        END""")
+
+    cursor.execute(f"""CREATE PROCEDURE post_transfer(
+            IN p_from VARCHAR(20), IN p_to VARCHAR(20), IN p_amount {money}, IN p_timestamp DATETIME,
+            IN p_from_deposits INT, IN p_from_repayments INT, IN p_from_failed INT,
+            IN p_to_deposits INT, IN p_to_repayments INT, IN p_to_failed INT)
+        BEGIN
+            DECLARE v_from_user INT DEFAULT NULL;
+            DECLARE v_to_user INT DEFAULT NULL;
+            DECLARE v_from_balance {money};
+            DECLARE v_to_balance {money};
+            DECLARE v_from_score INT;
+            DECLARE v_to_score INT;
+            DECLARE v_from_id INT;
+
+            -- Rows are locked in account-number order so opposite transfers cannot deadlock
+            IF p_from < p_to THEN
+                SELECT user_id, balance INTO v_from_user, v_from_balance
+                FROM customers WHERE account_number = p_from FOR UPDATE;
+                SELECT user_id, balance INTO v_to_user, v_to_balance
+                FROM customers WHERE account_number = p_to FOR UPDATE;
+            ELSE
+                SELECT user_id, balance INTO v_to_user, v_to_balance
+                FROM customers WHERE account_number = p_to FOR UPDATE;
+                SELECT user_id, balance INTO v_from_user, v_from_balance
+                FROM customers WHERE account_number = p_from FOR UPDATE;
+            END IF;
+            IF v_from_user IS NULL OR v_to_user IS NULL THEN
+                SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Account not found';
+            END IF;
+            IF p_amount <= 0 OR v_from_balance < p_amount THEN
+                SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Insufficient balance';
+            END IF;
+
+            SET v_from_score = bank_credit_score(v_from_balance, p_from_deposits, p_from_repayments, p_from_failed);
+            SET v_to_score = bank_credit_score(v_to_balance, p_to_deposits, p_to_repayments, p_to_failed);
+            UPDATE customers SET balance = balance - p_amount, credit_score = v_from_score
+            WHERE account_number = p_from;
+            UPDATE customers SET balance = balance + p_amount, credit_score = v_to_score
+            WHERE account_number = p_to;
+
+            INSERT INTO transaction_record
+                (user_id, account_number, transaction_type, counterparty, amount, timestamp)
+            VALUES (v_from_user, p_from, 'Transfer Out', p_to, -p_amount, p_timestamp);
+            SET v_from_id = LAST_INSERT_ID();
+            INSERT INTO transaction_record
+                (user_id, account_number, transaction_type, counterparty, amount, timestamp)
+            VALUES (v_to_user, p_to, 'Transfer In', p_from, p_amount, p_timestamp);
+
+            SELECT v_from_balance - p_amount, v_from_score, v_from_id,
+                   v_to_balance + p_amount, v_to_score, LAST_INSERT_ID();
+        END""")
+
+
+def create_transfer_handoffs(cursor):
+    # Two-phase handoff for transfers between shards (sharded_workers.py): the sender's
+    # shard debits and parks the money as PREPARED, the receiver's shard credits it and
+    # marks it COMMITTED. ABORTED handoffs are refunded by the sender's shard (REFUNDED).
+    cursor.execute("""CREATE TABLE transfer_handoffs (
+                        handoff_id CHAR(32) PRIMARY KEY,
+                        from_account VARCHAR(20) NOT NULL,
+                        to_account VARCHAR(20) NOT NULL,
+                        amount DECIMAL(15,2) NOT NULL,
+                        status ENUM('PREPARED', 'COMMITTED', 'ABORTED', 'REFUNDED') NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        completed_at TIMESTAMP NULL,
+                        INDEX idx_handoff_status (status, to_account)
+                     )""")
+
+
+def store_money_in_paise(cursor):
+    # Amounts become whole paise in BIGINT columns (Project_DSA.Money), so no value is
+    # ever rounded on its way between the application and the database. Each column is
+    # widened first so multiplying by 100 cannot overflow DECIMAL(15,2).
+    columns = (("customers", "balance", "NOT NULL DEFAULT 0"), ("customers", "loan_amount", "DEFAULT 0"),
+               ("transaction_record", "amount", "NOT NULL"), ("transfer_handoffs", "amount", "NOT NULL"))
+    for table, column, options in columns:
+        cursor.execute(f"ALTER TABLE {table} MODIFY {column} DECIMAL(17,2) {options}")
+        cursor.execute(f"UPDATE {table} SET {column} = {column} * 100")
+        cursor.execute(f"ALTER TABLE {table} MODIFY {column} BIGINT {options}")
+    create_posting_procedures(cursor, money="BIGINT", per_rupee=100)
+
+
+def add_ledger_tail_index(cursor):
+    # Ledger mode reads an account's balance as its account_snapshots row plus the ledger
+    # rows after the snapshot's last_transaction_id, which this index serves. The snapshot
+    # table itself is created when a database is put in ledger mode (ledger_tool.py enable),
+    # since its presence is what switches every client over to ledger balances.
+    cursor.execute("""CREATE INDEX idx_txn_account_id
+                     ON transaction_record (account_number, transaction_id)""")
+
+
+def add_refund_transaction_type(cursor):
+    # A refunded cross-shard handoff (sharded_workers.py) is logged as its own type rather
+    # than as a transfer in from the account that never received the money. Appending to
+    # the ENUM leaves existing values untouched.
+    types = ", ".join(f"'{t}'" for t in TRANSACTION_TYPES)
+    cursor.execute(f"""ALTER TABLE transaction_record
+                      MODIFY transaction_type ENUM({types}) NOT NULL""")
+
+
+def add_number_sequences(cursor):
+    # NumberAllocator reserves account and card numbers in blocks from these rows.
+    # Databases set up before the allocator existed have numbers issued at random, so
+    # each sequence starts above the highest one. If that would leave less than a
+    # million values (random numbers spread over the whole range), it starts at the
+    # bottom instead; the allocator skips numbers already in use either way.
+    cursor.execute("""CREATE TABLE IF NOT EXISTS number_sequences (
+                        name VARCHAR(32) PRIMARY KEY,
+                        next_value BIGINT NOT NULL
+                     )""")
+    for name, (first, last) in NumberAllocator.SEQUENCES.items():
+        # Same-length digit strings sort like their values
+        cursor.execute(f"""SELECT MAX({name}) FROM customers
+                          WHERE CHAR_LENGTH({name}) = %s AND {name} REGEXP '^[0-9]+$'""",
+                       (len(str(last)) + 1,))
+        highest = cursor.fetchone()[0]
+        start = first
+        if highest is not None and last - int(highest[:-1]) >= 1000000:
+            start = max(first, int(highest[:-1]) + 1)
+        cursor.execute("""INSERT INTO number_sequences (name, next_value) VALUES (%s, %s)
+                          ON DUPLICATE KEY UPDATE next_value = GREATEST(next_value, VALUES(next_value))""",
+                       (name, start))
+        print(f"✅ {name} sequence starts at {start}")
+
+
+# (version, name, step); steps run in order and are recorded once they finish
+MIGRATIONS = [
+    (1, "history_index", add_history_index),
+    (2, "split_transaction_type", split_transaction_type),
+    (3, "partition_by_month", partition_by_month),
+    (4, "posting_procedures", create_posting_procedures),
+    (5, "transfer_handoffs", create_transfer_handoffs),
+    (6, "money_in_paise", store_money_in_paise),
+    (7, "ledger_tail_index", add_ledger_tail_index),
+    (8, "refund_transaction_type", add_refund_transaction_type),
+    (9, "number_sequences", add_number_sequences),
+]
+
+# The hot ledger queries, with the account under test as their only parameter
+PLAN_QUERIES = {
+    "credit_score_window": """SELECT transaction_type, amount, timestamp
+                             FROM transaction_record
+                             WHERE account_number = %s
+                             AND timestamp >= DATE_SUB(NOW(), INTERVAL 6 MONTH)""",
+    "history_first_page": """SELECT transaction_id, transaction_type, amount, timestamp
+                            FROM transaction_record
+                            WHERE account_number = %s
+                            ORDER BY timestamp DESC, transaction_id DESC LIMIT 11""",
+}
+
+
+def ensure_migrations_table(cursor):
+    cursor.execute("""CREATE TABLE IF NOT EXISTS schema_migrations (
+                     version INT PRIMARY KEY,
+                     name VARCHAR(100) NOT NULL,
+                     applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)""")
+
+
+def applied_versions(cursor):
+    ensure_migrations_table(cursor)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def summarize_plan(plan):
+    """Pull the numbers that matter out of an EXPLAIN FORMAT=JSON document."""
+    block = plan["query_block"]
+    summary = {"query_cost": float(block.get("cost_info", {}).get("query_cost", 0)),
+               "using_filesort": False}
+
+    def visit(node):
+        if isinstance(node, dict):
+            if node.get("using_filesort"):
+                summary["using_filesort"] = True
+            if "table_name" in node and "access_type" in node:
+                summary.update({
+                    "access_type": node["access_type"],
+                    "key": node.get("key"),
+                    "rows_examined_per_scan": node.get("rows_examined_per_scan"),
+                    "partitions": node.get("partitions")
+                })
+            for value in node.values():
+                visit(value)
+        elif isinstance(node, list):
+            for value in node:
+                visit(value)
+
+    visit(block)
+    return summary
+
+
+def explain_queries(cursor):
+    """EXPLAIN the hot ledger queries against the busiest account."""
+    cursor.execute("""SELECT account_number FROM transaction_record
+                     GROUP BY account_number ORDER BY COUNT(*) DESC LIMIT 1""")
+    row = cursor.fetchone()
+    if row is None:
+        return {}
+    plans = {}
+    for name, query in PLAN_QUERIES.items():
+        cursor.execute("EXPLAIN FORMAT=JSON " + query, (row[0],))
+        plans[name] = summarize_plan(json.loads(cursor.fetchone()[0]))
+    return plans
+
+
+def print_plans(label, plans):
+    print(f"\n===== Query plans {label} =====")
+    for name, plan in plans.items():
+        print(f"{name}: access={plan.get('access_type')} key={plan.get('key')} "
+              f"rows={plan.get('rows_examined_per_scan')} filesort={plan['using_filesort']} "
+              f"cost={plan['query_cost']}")
+
+
+def migrate(db_manager, target=None, report=None):
+    cursor = db_manager.cursor
+    done = applied_versions(cursor)
+    pending = [m for m in MIGRATIONS if m[0] not in done and (target is None or m[0] <= target)]
+    if not pending:
+        print("✅ Schema is up to date")
+        return []
+
+    results = []
+    for version, name, step in pending:
+        before = explain_queries(cursor)
+        print(f"Applying migration {version}: {name}")
+        step(cursor)
+        cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+        db_manager.conn.commit()
+        after = explain_queries(cursor)
+        print_plans(f"before {name}", before)
+        print_plans(f"after {name}", after)
+        results.append({"version": version, "name": name, "before": before, "after": after})
+        print(f"✅ Migration {version} applied")
+
+    if report:
+        with open(report, "w") as file:
+            json.dump(results, file, indent=4)
+        print(f"✅ Query plan report written to {report}")
+    return results
+
+
+def status(db_manager):
+    done = applied_versions(db_manager.cursor)
+    for version, name, _ in MIGRATIONS:
+        print(f"{'✅' if version in done else '⏳'} {version} {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply schema migrations to bank_system.")
+    parser.add_argument("--database", default="bank_system", help="MySQL database to migrate")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status")
+    migrate_parser = commands.add_parser("migrate")
+    migrate_parser.add_argument("--target", type=int, help="Stop after this version")
+    migrate_parser.add_argument("--report", help="Write before/after query plans to this JSON file")
+    partitions_parser = commands.add_parser("partitions", help="Add upcoming monthly partitions")
+    partitions_parser.add_argument("--months-ahead", type=int, default=3)
+    args = parser.parse_args()
+
+    # Migrations run against databases the manager would otherwise refuse
+    db_manager = DatabaseManager(database=args.database, check_schema=False)
+    try:
+        if args.command == "status":
+            status(db_manager)
+        elif args.command == "migrate":
+            migrate(db_manager, args.target, args.report)
+        elif args.command == "partitions":
+            added = ensure_month_partitions(db_manager.cursor, args.months_ahead)
+            print(f"✅ {added} monthly partitions added")
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+    finally:
+        db_manager.close()
+
+
+if __name__ == "__main__":
+    main()
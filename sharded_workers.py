@@ -0,0 +1,436 @@
+"""Sharded posting: account numbers are hashed onto N worker processes.
+
+Each shard is its own process with its own database connection, CacheManager partition
+(cache_shard<N>.snap) and credit-score counters, and it is the only writer for the
+accounts hashed to it. Each shard works through its inbox one message at a time, so
+operations on one account run in the order they were submitted.
+
+A transfer between two shards is a two-phase handoff through transfer_handoffs
+(migration 5):
+    1. the sender's shard debits the sender and records the handoff as PREPARED,
+       in one transaction, then sends the handoff id to the receiver's shard;
+    2. the receiver's shard credits the receiver and marks it COMMITTED, again in one
+       transaction. If the receiver cannot be credited the handoff becomes ABORTED and
+       the sender's shard refunds it (REFUNDED) as a "Transfer Refund" row.
+Handoffs left PREPARED or ABORTED by a crash are finished when the owning shard starts.
+On shutdown the executor waits a bounded time for handoffs in flight; whatever a dead
+or stuck shard left unfinished is then committed or refunded from the parent process.
+
+Usage: python sharded_workers.py requests.jsonl results.jsonl [--shards 4]
+(same request format as bulk_ingest.py; set BANK_SQLITE_PATH to use an SQLite file)
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import secrets
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+from datetime import datetime
+
+from Project_DSA import CacheManager, DatabaseManager, Money, backend_from_env, calculate_credit_score
+from bulk_ingest import parse_request, read_chunks
+
+CUSTOMER_OPS = {"deposit": "deposit", "withdraw": "withdraw", "loan": "take_loan", "repay": "return_loan"}
+
+
+def shard_of(account_number, shards):
+    # crc32 rather than hash(): str hashes are salted per process
+    return zlib.crc32(account_number.encode()) % shards
+
+
+class Shard:
+    """State and message handling for one worker process."""
+
+    def __init__(self, index, shards, db_manager, cache_manager, inboxes):
+        self.index = index
+        self.shards = shards
+        self.db_manager = db_manager
+        self.cache_manager = cache_manager
+        self.inboxes = inboxes
+        self.customers = {}  # This shard is the only writer, so its Customer objects stay current
+
+    def customer(self, account_number):
+        if account_number not in self.customers:
+            customer = self.db_manager.fetch_customer(account_number)
+            if customer is None:
+                return None
+            self.customers[account_number] = customer
+        return self.customers[account_number]
+
+    def handle(self, message):
+        kind = message["kind"]
+        if kind == "request":
+            return self.handle_request(message["request"])
+        if kind == "credit":
+            return self.commit_handoff(message["handoff_id"])
+        if kind == "refund":
+            return self.refund_handoff(message["handoff_id"])
+        raise ValueError(f"Unknown message {kind!r}")
+
+    def handle_request(self, request):
+        result = {"id": request["id"], "status": "rejected"}
+        customer = self.customer(request["account_number"])
+        if customer is None:
+            result["error"] = "Account not found"
+            return result
+
+        if request["op"] in CUSTOMER_OPS:
+            operation = getattr(customer, CUSTOMER_OPS[request["op"]])
+            if operation(request["amount"], self.db_manager, self.cache_manager):
+                result["status"] = "ok"
+        elif shard_of(request["to_account"], self.shards) == self.index:
+            receiver = self.customer(request["to_account"])
+            if receiver is None:
+                result["error"] = "Receiver not found"
+            elif customer.transfer_money(receiver, request["amount"], self.db_manager, self.cache_manager):
+                result["status"] = "ok"
+        else:
+            try:
+                handoff_id = self.prepare_handoff(customer, request["to_account"], request["amount"])
+            except Exception as e:
+                result["error"] = str(e)
+                return result
+            result["status"], result["handoff_id"] = "ok", handoff_id
+            self.send("credit", request["to_account"], handoff_id)
+
+        if result["status"] == "ok":
+            result["balance"] = str(customer.balance)
+        return result
+
+    def send(self, kind, account_number, handoff_id):
+        self.inboxes[shard_of(account_number, self.shards)].put({"kind": kind, "handoff_id": handoff_id})
+
+    def prepare_handoff(self, sender, receiver_account, amount):
+        """Phase 1, on the sender's shard: debit the sender and park the money as PREPARED."""
+        db = self.db_manager
+        if amount <= 0:
+            raise ValueError("Transfer amount must be positive")
+        handoff_id = secrets.token_hex(16)
+        state = (sender.balance, sender.credit_score)
+        try:
+            with db.unit_of_work():
+                db.cursor.execute("SELECT 1 FROM customers WHERE account_number = %s", (receiver_account,))
+                if db.cursor.fetchone() is None:
+                    raise ValueError("Receiver not found")
+                if not self.move_balance(sender, -amount):
+                    raise ValueError("Insufficient balance")
+                db.cursor.execute("""INSERT INTO transfer_handoffs
+                                     (handoff_id, from_account, to_account, amount, status)
+                                     VALUES (%s, %s, %s, %s, 'PREPARED')""",
+                                  (handoff_id, sender.account_number, receiver_account, amount))
+                db.insert_transaction(sender.user_id, sender.account_number, "Transfer Out", -amount,
+                                      receiver_account)
+                db._after_commit(self.cache_manager.update_cache, sender)
+        except Exception:
+            sender.balance, sender.credit_score = state
+            raise
+        return handoff_id
+
+    def commit_handoff(self, handoff_id):
+        """Phase 2, on the receiver's shard: credit a PREPARED handoff exactly once."""
+        db = self.db_manager
+        to_account = None
+        try:
+            with db.unit_of_work():
+                handoff = self.lock_handoff(handoff_id, "PREPARED")
+                if handoff is None:
+                    return {"handoff_id": handoff_id, "status": "done"}  # Already applied
+                from_account, to_account, amount = handoff
+                receiver = self.customer(to_account)
+                if receiver is None:
+                    self.set_status(handoff_id, "ABORTED")
+                    db._after_commit(self.send, "refund", from_account, handoff_id)
+                    return {"handoff_id": handoff_id, "status": "aborted"}
+
+                if not self.move_balance(receiver, amount):
+                    raise ValueError(f"Account {to_account} could not be credited")
+                db.insert_transaction(receiver.user_id, to_account, "Transfer In", amount, from_account)
+                self.set_status(handoff_id, "COMMITTED")
+                db._after_commit(self.cache_manager.update_cache, receiver)
+        except Exception as e:
+            self.customers.pop(to_account, None)  # Reloaded from the database on next use
+            if to_account is None:
+                raise
+            # Send the money back rather than leave it parked until the next restart;
+            # if even that fails the handoff stays PREPARED for recover()
+            try:
+                aborted = self.abort_handoff(handoff_id)
+            except Exception:
+                aborted = False
+            if not aborted:
+                raise
+            return {"handoff_id": handoff_id, "status": "aborted", "error": str(e)}
+        return {"handoff_id": handoff_id, "status": "committed"}
+
+    def abort_handoff(self, handoff_id):
+        """Mark a PREPARED handoff ABORTED and ask the sender's shard to refund it."""
+        db = self.db_manager
+        with db.unit_of_work():
+            handoff = self.lock_handoff(handoff_id, "PREPARED")
+            if handoff is None:
+                return False
+            self.set_status(handoff_id, "ABORTED")
+            db._after_commit(self.send, "refund", handoff[0], handoff_id)
+        return True
+
+    def refund_handoff(self, handoff_id):
+        """Give an ABORTED handoff back to the sender."""
+        db = self.db_manager
+        from_account = None
+        try:
+            with db.unit_of_work():
+                handoff = self.lock_handoff(handoff_id, "ABORTED")
+                if handoff is None:
+                    return {"handoff_id": handoff_id, "status": "done"}
+                from_account, to_account, amount = handoff
+                sender = self.customer(from_account)
+                if sender is None or not self.move_balance(sender, amount):
+                    raise ValueError(f"Account {from_account} could not be refunded")
+                db.insert_transaction(sender.user_id, from_account, "Transfer Refund", amount, to_account)
+                self.set_status(handoff_id, "REFUNDED")
+                db._after_commit(self.cache_manager.update_cache, sender)
+        except Exception:
+            self.customers.pop(from_account, None)
+            raise
+        return {"handoff_id": handoff_id, "status": "refunded"}
+
+    def move_balance(self, customer, amount):
+        """Add `amount` to the customer's stored balance under its lock and rescore it, inside
+        the caller's unit of work; False if that would overdraw the account."""
+        db = self.db_manager
+        number = customer.account_number
+        balance = customer.balance
+        if db.ledger:
+            # The ledger row the caller appends is the balance change itself; it is checked
+            # against the locked snapshot plus tail, not customers.balance
+            state = db.ledger.state(number, lock=True)
+            if state is None or state[0] + amount < 0:
+                return False
+            balance = state[0]
+        score = calculate_credit_score(balance, *db._window_counts(number))
+        if db.ledger:
+            db.cursor.execute("UPDATE customers SET credit_score = %s WHERE account_number = %s", (score, number))
+        else:
+            db.cursor.execute("""UPDATE customers SET balance = balance + %s, credit_score = %s
+                                 WHERE account_number = %s AND balance + %s >= 0""", (amount, score, number, amount))
+            if db.cursor.rowcount != 1:
+                return False
+        customer.balance = balance + amount
+        customer.credit_score = score
+        return True
+
+    def lock_handoff(self, handoff_id, status):
+        self.db_manager.cursor.execute("""SELECT from_account, to_account, amount FROM transfer_handoffs
+                                         WHERE handoff_id = %s AND status = %s
+                                         FOR UPDATE""", (handoff_id, status))
+        row = self.db_manager.cursor.fetchone()
+        return (row[0], row[1], Money(row[2])) if row else None
+
+    def set_status(self, handoff_id, status):
+        self.db_manager.cursor.execute("""UPDATE transfer_handoffs SET status = %s, completed_at = %s
+                                         WHERE handoff_id = %s""",
+                                      (status, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), handoff_id))
+
+    def recover(self):
+        """Finish handoffs a previous run left half done for accounts on this shard."""
+        db = self.db_manager
+        with db.session():
+            db.cursor.execute("""SELECT handoff_id, status, from_account, to_account FROM transfer_handoffs
+                                 WHERE status IN ('PREPARED', 'ABORTED')""")
+            pending = db.cursor.fetchall()
+            db.conn.commit()
+        recovered = 0
+        for handoff_id, status, from_account, to_account in pending:
+            if status == "PREPARED" and shard_of(to_account, self.shards) == self.index:
+                self.commit_handoff(handoff_id)
+                recovered += 1
+            elif status == "ABORTED" and shard_of(from_account, self.shards) == self.index:
+                self.refund_handoff(handoff_id)
+                recovered += 1
+        return recovered
+
+
+def open_shard(index):
+    """The cache partition and database connection shard `index` works with."""
+    cache_manager = CacheManager(f"cache_shard{index}.snap", write_behind=True)
+    return cache_manager, DatabaseManager(cache_manager, backend=backend_from_env())
+
+
+def run_shard(index, shards, inboxes, results):
+    """Worker process entry point."""
+    sys.stdout = open(os.devnull, "w")  # Per-operation receipts; results go back on the queue
+    cache_manager, db_manager = open_shard(index)
+    shard = Shard(index, shards, db_manager, cache_manager, inboxes)
+    try:
+        shard.recover()
+        while True:
+            message = inboxes[index].get()
+            if message is None:
+                break
+            try:
+                result = shard.handle(message)
+            except Exception as e:
+                result = {"status": "error", "error": str(e), "handoff_id": message.get("handoff_id")}
+            result["seq"] = message.get("seq")
+            results.put(result)
+    finally:
+        db_manager.close()
+        cache_manager.close()
+
+
+def recover_handoffs(shards):
+    """Finish, from this process, every handoff the shards left PREPARED or ABORTED.
+
+    Only safe once no shard process is running. Returns how many were still unfinished.
+    """
+    inboxes = [queue.Queue() for _ in range(shards)]  # Refunds are picked up by the next pass instead
+    opened = [open_shard(index) for index in range(shards)]
+    try:
+        recoverers = [Shard(index, shards, db_manager, cache_manager, inboxes)
+                      for index, (cache_manager, db_manager) in enumerate(opened)]
+        # The first pass may abort handoffs whose refunds belong to a shard it already passed
+        recovered = sum(shard.recover() for shard in recoverers)
+        for shard in recoverers:
+            shard.recover()
+        return recovered
+    finally:
+        for cache_manager, db_manager in opened:
+            db_manager.close()
+            cache_manager.close()
+
+
+class ShardedExecutor:
+    """Routes requests to shard processes and hands back a Future per request."""
+
+    def __init__(self, shards=None):
+        self.shards = shards if shards else os.cpu_count()
+        context = multiprocessing.get_context("spawn")
+        self.inboxes = [context.Queue() for _ in range(self.shards)]
+        self.results = context.Queue()
+        self.processes = [context.Process(target=run_shard, args=(index, self.shards, self.inboxes, self.results),
+                                          name=f"bank-shard-{index}")
+                          for index in range(self.shards)]
+        for process in self.processes:
+            process.start()
+
+        self._futures = {}  # seq -> (future, shard)
+        self._seq = 0
+        self._pending_handoffs = 0
+        self._handoff_failed = False
+        self._handoffs_done = threading.Condition()
+        self._reader = threading.Thread(target=self._read_results, daemon=True)
+        self._reader.start()
+
+    def submit(self, request):
+        future = Future()
+        self._seq += 1
+        shard = shard_of(request["account_number"], self.shards)
+        self._futures[self._seq] = (future, shard)
+        self.inboxes[shard].put({"kind": "request", "seq": self._seq, "request": request})
+        return future
+
+    def _read_results(self):
+        while True:
+            try:
+                result = self.results.get(timeout=1.0)
+            except queue.Empty:
+                self._fail_dead_shards()
+                continue
+            if result is None:
+                return
+            seq = result.pop("seq")
+            if seq is not None:
+                entry = self._futures.pop(seq, None)
+                if entry is None:
+                    continue  # Already failed by _fail_dead_shards
+                if result["status"] == "ok" and result.get("handoff_id"):
+                    self._count_handoff(1)
+                entry[0].set_result(result)
+            elif result["status"] != "aborted":
+                # Committed, refunded, already done or failed: no more messages for this handoff.
+                # An aborted one still has its refund to come.
+                if result["status"] == "error":
+                    self._handoff_failed = True
+                self._count_handoff(-1)
+
+    def _fail_dead_shards(self):
+        """Resolve the futures of requests sent to a shard that is no longer running."""
+        dead = {index for index, process in enumerate(self.processes) if not process.is_alive()}
+        if not dead:
+            return
+        for seq, (future, shard) in list(self._futures.items()):
+            if shard in dead and self._futures.pop(seq, None):
+                future.set_result({"id": None, "status": "error", "error": f"Shard {shard} exited"})
+
+    def _count_handoff(self, delta):
+        # May dip below zero when a credit overtakes its own request's result; it is exact
+        # again once every request future has resolved, which is when close() waits on it
+        with self._handoffs_done:
+            self._pending_handoffs += delta
+            self._handoffs_done.notify_all()
+
+    def close(self, timeout=60.0):
+        """Stop the shards, then finish any handoff they could not."""
+        # Cross-shard credits are still in flight after the last request completes. A dead
+        # shard never answers for its handoffs, and a stuck one is given `timeout` seconds.
+        deadline = time.monotonic() + timeout
+        with self._handoffs_done:
+            while self._pending_handoffs > 0 and time.monotonic() < deadline:
+                if not all(process.is_alive() for process in self.processes):
+                    break
+                self._handoffs_done.wait(0.5)
+            unsettled = self._pending_handoffs > 0
+        for inbox in self.inboxes:
+            inbox.put(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self.results.put(None)
+        self._reader.join()
+        if unsettled or self._handoff_failed or any(process.exitcode != 0 for process in self.processes):
+            recovered = recover_handoffs(self.shards)
+            if recovered:
+                print(f"⚠️ {recovered} handoffs left unfinished by the shards were completed on shutdown")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Post a JSONL file of money movements across sharded workers.")
+    parser.add_argument("input", help="JSONL file of deposit/withdraw/transfer/loan/repay requests")
+    parser.add_argument("output", help="JSONL file to write one result per request to")
+    parser.add_argument("--shards", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    executor = ShardedExecutor(args.shards)
+    totals = {"ok": 0, "rejected": 0, "error": 0}
+    start = time.perf_counter()
+    try:
+        with open(args.output, "w") as output:
+            for chunk in read_chunks(args.input, 5000):
+                futures = []
+                for line_number, line in chunk:
+                    try:
+                        futures.append((line_number, executor.submit(parse_request(line))))
+                    except ValueError as e:
+                        futures.append((line_number, {"status": "rejected", "error": str(e)}))
+                for line_number, future in futures:
+                    result = future if isinstance(future, dict) else future.result()
+                    result["line"] = line_number
+                    totals[result["status"]] += 1
+                    output.write(json.dumps(result, separators=(",", ":"), default=str) + "\n")
+    finally:
+        executor.close()
+    elapsed = time.perf_counter() - start
+    count = sum(totals.values())
+    print(f"✅ {count} requests on {args.shards} shards in {elapsed:.2f}s ({count / elapsed:.0f} ops/sec): "
+          f"{totals['ok']} posted, {totals['rejected']} rejected, {totals['error']} failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""Statement and audit export of the transaction ledger.
+
+Rows are streamed from the server through an unbuffered cursor (pymysql SSCursor) and
+flow through generators straight into the output file, so memory use does not depend
+on how many rows are exported. The account and date filters are part of the SQL.
+
+Each account's running balance starts from its opening balance: the current balance
+minus everything posted since the start of the range. That opening balance and the
+rows are read by one statement, so both come from the same snapshot. On a ledger-mode
+database the current balance is the account snapshot plus its tail, as LedgerEngine
+computes it, since customers.balance only moves when the compactor runs.
+
+Whole-bank exports can be split by account hash over several processes, each writing
+its own part file.
+
+Usage:
+    python statement_export.py out.csv --month 2026-09 [--workers 8]
+    python statement_export.py out.jsonl --from 2026-01-01 --to 2026-04-01 --account 1234567890
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import pymysql
+
+from Project_DSA import DatabaseManager, Money
+
+FIELDS = ("account_number", "transaction_id", "timestamp", "type", "counterparty", "amount", "balance")
+NO_MONEY_MOVED = ("Failed", "Bounced")  # Recorded attempts; they never changed a balance
+
+
+def account_filter(column, accounts, partition, partitions):
+    """WHERE fragment and parameters restricting `column` to the requested accounts."""
+    clauses, params = [], []
+    if accounts:
+        clauses.append(f"{column} IN ({', '.join(['%s'] * len(accounts))})")
+        params.extend(accounts)
+    if partitions > 1:
+        clauses.append(f"CRC32({column}) %% %s = %s")
+        params.extend((partitions, partition))
+    return "".join(f" AND {clause}" for clause in clauses), params
+
+
+def statement_rows(cursor, start, end, accounts=None, partition=0, partitions=1, ledger=False):
+    """Yield (account_number, kind, transaction_id, timestamp, type, counterparty, amount).
+
+    kind 0 is the account's opening balance at `start` (in the amount column), kind 1 a
+    ledger row in [start, end). Rows come ordered by account, then time; amounts are paise.
+    With `ledger` the current balance is read from account_snapshots plus the tail.
+    """
+    excluded = ", ".join(f"'{t}'" for t in NO_MONEY_MOVED)
+    current = "c.balance"
+    if ledger:
+        current = """(SELECT s.balance + COALESCE((SELECT SUM(l.amount) FROM transaction_record l
+                                                   WHERE l.account_number = s.account_number
+                                                   AND l.transaction_id > s.last_transaction_id), 0)
+                      FROM account_snapshots s WHERE s.account_number = c.account_number)"""
+    customer_filter, customer_params = account_filter("c.account_number", accounts, partition, partitions)
+    ledger_filter, ledger_params = account_filter("t.account_number", accounts, partition, partitions)
+    query = f"""SELECT c.account_number, 0, NULL, NULL, NULL, NULL,
+                       {current} - COALESCE((SELECT SUM(t.amount) FROM transaction_record t
+                                             WHERE t.account_number = c.account_number
+                                             AND t.timestamp >= %s
+                                             AND t.transaction_type NOT IN ({excluded})), 0)
+                FROM customers c
+                WHERE 1 = 1{customer_filter}
+                UNION ALL
+                SELECT t.account_number, 1, t.transaction_id, t.timestamp, t.transaction_type,
+                       t.counterparty, t.amount
+                FROM transaction_record t
+                WHERE t.timestamp >= %s AND t.timestamp < %s{ledger_filter}
+                ORDER BY 1, 2, 4, 3"""
+    cursor.execute(query, (start, *customer_params, start, end, *ledger_params))
+    # SSCursor: rows arrive as the loop asks for them, never all at once
+    for row in cursor:
+        yield row
+
+
+def with_running_balance(rows):
+    """Turn statement_rows into output dicts carrying the balance after each row.
+
+    An account's opening line is only emitted once it has a row in the range, so
+    dormant accounts produce nothing.
+    """
+    account, opening, balance, opened = None, None, None, False
+    for account_number, kind, transaction_id, timestamp, transaction_type, counterparty, amount in rows:
+        # MySQL hands the opening balance (BIGINT minus a SUM) back as an integral DECIMAL
+        amount = Money(int(amount))
+        if kind == 0:
+            account, opening, balance, opened = account_number, amount, amount, False
+            continue
+        if account_number != account:
+            # Ledger rows left behind by a deleted customer: no opening balance to run from
+            account, opening, balance, opened = account_number, None, None, True
+        if not opened:
+            opened = True
+            yield {"account_number": account, "transaction_id": None, "timestamp": None,
+                   "type": "Opening Balance", "counterparty": None, "amount": None, "balance": str(opening)}
+        if balance is not None and transaction_type not in NO_MONEY_MOVED:
+            balance += amount
+        yield {"account_number": account, "transaction_id": transaction_id,
+               "timestamp": timestamp.strftime("%Y-%m-%d %H:%M:%S"), "type": transaction_type,
+               "counterparty": counterparty, "amount": str(amount),
+               "balance": str(balance) if balance is not None else None}
+
+
+def write_csv(records, file):
+    writer = csv.DictWriter(file, fieldnames=FIELDS)
+    writer.writeheader()
+    count = 0
+    for record in records:
+        writer.writerow(record)
+        count += 1
+    return count
+
+
+def write_jsonl(records, file):
+    count = 0
+    for record in records:
+        file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        count += 1
+    return count
+
+
+WRITERS = {"csv": write_csv, "jsonl": write_jsonl}
+
+
+def export_partition(path, fmt, start, end, accounts=None, partition=0, partitions=1):
+    """Write one partition's statement rows to path; returns the number of lines written."""
+    db_manager = DatabaseManager(pool_min=1, pool_max=1)
+    try:
+        with db_manager.session(), open(path, "w", newline="") as file:
+            cursor = db_manager.conn.cursor(pymysql.cursors.SSCursor)
+            try:
+                rows = statement_rows(cursor, start, end, accounts, partition, partitions,
+                                      ledger=db_manager.ledger is not None)
+                return WRITERS[fmt](with_running_balance(rows), file)
+            finally:
+                cursor.close()
+    finally:
+        db_manager.close()
+
+
+def export(path, fmt, start, end, accounts=None, workers=1):
+    """Export [start, end) to path, or to path.part<N> files when split over workers."""
+    if workers <= 1:
+        return {path: export_partition(path, fmt, start, end, accounts)}
+    base, extension = os.path.splitext(path)
+    paths = [f"{base}.part{partition}{extension}" for partition in range(workers)]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [executor.submit(export_partition, part_path, fmt, start, end, accounts, partition, workers)
+                   for partition, part_path in enumerate(paths)]
+        return {part_path: future.result() for part_path, future in zip(paths, futures)}
+
+
+def month_range(month):
+    start = datetime.strptime(month, "%Y-%m")
+    end = start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    return start, end
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export account statements with running balances.")
+    parser.add_argument("output", help="Output file (.csv or .jsonl)")
+    parser.add_argument("--month", help="Export one calendar month, e.g. 2026-09")
+    parser.add_argument("--from", dest="start", help="Start date (inclusive), YYYY-MM-DD")
+    parser.add_argument("--to", dest="end", help="End date (exclusive), YYYY-MM-DD")
+    parser.add_argument("--account", action="append", help="Only this account (repeatable)")
+    parser.add_argument("--format", choices=sorted(WRITERS), help="Defaults to the output file's extension")
+    parser.add_argument("--workers", type=int, default=1, help="Split the export by account hash")
+    args = parser.parse_args()
+
+    if args.month:
+        start, end = month_range(args.month)
+    elif args.start and args.end:
+        start, end = datetime.strptime(args.start, "%Y-%m-%d"), datetime.strptime(args.end, "%Y-%m-%d")
+    else:
+        parser.error("give --month or both --from and --to")
+    fmt = args.format if args.format else ("jsonl" if args.output.endswith(".jsonl") else "csv")
+
+    written = export(args.output, fmt, start, end, args.account, args.workers)
+    for path, count in written.items():
+        print(f"✅ {path}: {count} lines")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Stress test for concurrent transfers.
+
+Many worker threads, each with its own Customer objects, move random amounts between a
+small set of accounts at the same time, so row locks conflict and deadlocks happen.
+Afterwards the total balance of those accounts must be unchanged, no balance may be
+negative, and every account's balance must equal its opening balance plus its
+transfer ledger rows. With --ledger the balances are the ledger's snapshot plus tail,
+and --compact-interval keeps the compactor folding tails while the transfers run.
+It creates and drains its own accounts, so it needs a scratch target named explicitly:
+a MySQL database other than bank_system, or an SQLite file.
+
+Usage: python stress_transfers.py (--database bank_stress | --sqlite-path bank_stress.db)
+                                  [--workers 16] [--accounts 10] [--transfers 5000] [--ledger]
+"""
+import argparse
+import contextlib
+import io
+import random
+import threading
+
+from Project_DSA import CacheManager, Customer, DatabaseManager, Money, MySQLBackend, SQLiteBackend
+
+OPENING_BALANCE = Money.of(10000)
+
+
+def stress_accounts(db_manager, cache_manager, count):
+    """Account numbers of the stress accounts, creating and funding them on first run."""
+    numbers = []
+    for index in range(count):
+        email = f"stress_{index}@example.invalid"
+        db_manager.cursor.execute("SELECT account_number FROM customers WHERE email = %s", (email,))
+        row = db_manager.cursor.fetchone()
+        if row is None:
+            customer = Customer(username=f"stress_{index}", email=email, password="stress-password",
+                                address="Stress test", mobile_number=f"11{index:08d}",
+                                aadhaar_number=f"11{index:010d}")
+            db_manager.insert_customer(customer)
+            customer = db_manager.fetch_customer(customer.account_number)
+            customer.deposit(OPENING_BALANCE, db_manager, cache_manager)
+            row = (customer.account_number,)
+        numbers.append(row[0])
+    return numbers
+
+
+def snapshot(db_manager, numbers):
+    """Current balance and summed transfer ledger rows per account."""
+    placeholders = ", ".join(["%s"] * len(numbers))
+    with db_manager.session():
+        db_manager.conn.commit()  # Start a fresh read view
+        if db_manager.ledger:
+            balances = {number: state[0] for number, state in db_manager.ledger.balances(numbers).items()}
+        else:
+            db_manager.cursor.execute(f"""SELECT account_number, balance FROM customers
+                                         WHERE account_number IN ({placeholders})""", numbers)
+            balances = {number: Money(balance) for number, balance in db_manager.cursor.fetchall()}
+        db_manager.cursor.execute(f"""SELECT account_number, COALESCE(SUM(amount), 0) FROM transaction_record
+                                     WHERE account_number IN ({placeholders})
+                                     AND transaction_type IN ('Transfer Out', 'Transfer In')
+                                     GROUP BY account_number""", numbers)
+        # MySQL sums BIGINT columns as DECIMAL
+        transferred = {number: Money(int(total)) for number, total in db_manager.cursor.fetchall()}
+    return balances, transferred
+
+
+def worker(db_manager, cache_manager, numbers, transfers, counts, lock):
+    rng = random.Random()
+    customers = {number: db_manager.fetch_customer(number) for number in numbers}
+    ok = failed = 0
+    for _ in range(transfers):
+        sender, receiver = rng.sample(numbers, 2)
+        amount = Money(rng.randint(1, 50000))
+        # The in-memory balance is only a hint here; the locked row decides
+        customers[sender].balance = OPENING_BALANCE * len(numbers)
+        if customers[sender].transfer_money(customers[receiver], amount, db_manager, cache_manager):
+            ok += 1
+        else:
+            failed += 1
+    with lock:
+        counts["ok"] += ok
+        counts["failed"] += failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that concurrent transfers conserve money.")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--accounts", type=int, default=10)
+    parser.add_argument("--transfers", type=int, default=5000, help="Total transfers across all workers")
+    parser.add_argument("--single-round-trip", action="store_true", help="Use the stored-procedure path")
+    parser.add_argument("--ledger", action="store_true", help="Use the append-only ledger path")
+    parser.add_argument("--compact-interval", type=float, help="Seconds between ledger compactions (with --ledger)")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--database", help="Scratch MySQL database")
+    target.add_argument("--sqlite-path", help="Scratch SQLite file")
+    args = parser.parse_args()
+    if args.database == "bank_system":
+        parser.error("the stress test creates and drains its own accounts; point --database at a scratch one")
+    backend = MySQLBackend(args.database) if args.database else SQLiteBackend(args.sqlite_path)
+
+    cache_manager = CacheManager("stress_cache.snap", write_behind=True)
+    db_manager = DatabaseManager(cache_manager, pool_min=1, pool_max=args.workers,
+                                 single_round_trip=args.single_round_trip, backend=backend,
+                                 ledger=args.ledger, compact_interval=args.compact_interval)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()), db_manager.session():
+            numbers = stress_accounts(db_manager, cache_manager, args.accounts)
+        before, transferred_before = snapshot(db_manager, numbers)
+
+        counts = {"ok": 0, "failed": 0}
+        lock = threading.Lock()
+        per_worker = args.transfers // args.workers
+        threads = [threading.Thread(target=worker, args=(db_manager, cache_manager, numbers, per_worker,
+                                                         counts, lock))
+                   for _ in range(args.workers)]
+        # Receipts from thousands of transfers would drown the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        after, transferred_after = snapshot(db_manager, numbers)
+        print(f"Transfers: {counts['ok']} posted, {counts['failed']} rejected")
+        print(f"Total before: ₹{sum(before.values())}  Total after: ₹{sum(after.values())}")
+
+        problems = []
+        if sum(before.values()) != sum(after.values()):
+            problems.append("total balance changed")
+        for number in numbers:
+            if after[number] < 0:
+                problems.append(f"{number} has a negative balance")
+            moved = transferred_after.get(number, Money.ZERO) - transferred_before.get(number, Money.ZERO)
+            if after[number] - before[number] != moved:
+                problems.append(f"{number} balance does not match its ledger")
+        if problems:
+            for problem in problems:
+                print(f"❌ {problem}")
+            raise SystemExit(1)
+        if db_manager.ledger:
+            mismatches = db_manager.ledger.verify(numbers)
+            if mismatches:
+                print(f"❌ {len(mismatches)} snapshots disagree with a full replay")
+                raise SystemExit(1)
+        print("✅ Money conserved and every balance matches the ledger")
+    finally:
+        db_manager.close()
+        cache_manager.close()
+
+
+if __name__ == "__main__":
+    main()